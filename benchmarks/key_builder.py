@@ -0,0 +1,40 @@
+"""缓存key生成器性能对比
+
+python benchmarks/key_builder.py [number]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), r'../')))
+
+from najapy.cache.key_builder import HashKeyBuilder, DigestKeyBuilder
+from najapy.common.async_base import Utils
+
+
+def func_1(str1, int1, float1, *, str3=None, str4=None):
+    pass
+
+
+def main(number=20000):
+
+    args = (r'a', 1, 2.5)
+    kwargs = {r'str3': r'b', r'str4': 100}
+
+    hash_builder = HashKeyBuilder()
+    digest_builder = DigestKeyBuilder()
+
+    cost_sign = timeit.timeit(lambda: Utils.params_sign(func_1, *args, **kwargs), number=number)
+    cost_hash = timeit.timeit(lambda: hash_builder.build(func_1, args, kwargs), number=number)
+    cost_digest = timeit.timeit(lambda: digest_builder.build(func_1, args, kwargs), number=number)
+
+    print(
+        f'params_sign: {cost_sign / number * 1e6:.2f}us '
+        f'hash: {cost_hash / number * 1e6:.2f}us ({cost_sign / cost_hash:.1f}x) '
+        f'digest: {cost_digest / number * 1e6:.2f}us ({cost_sign / cost_digest:.1f}x)'
+    )
+
+
+if __name__ == r'__main__':
+
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -1,32 +1,140 @@
 import asyncio
+import copy
+import weakref
+from contextvars import ContextVar
+from types import MappingProxyType
 from typing import Optional, List
 
-from cachetools import TTLCache
+from cachetools import Cache, TTLCache
 
+from najapy.cache.key_builder import KeyBuilder, HashKeyBuilder
+from najapy.cache.tiny_lfu import TinyLFUCache
 from najapy.common.async_base import Utils
+from najapy.common.metrics import MetricsRegistry, CacheMetrics
+
+
+class _TTLCache(TTLCache):
+    """支持淘汰回调的TTLCache
+    """
+
+    def __init__(self, maxsize, ttl):
+        super().__init__(maxsize, ttl)
+
+        self.on_evict = None
+
+    def expire(self, time=None):
+        if self.on_evict is None:
+            return super().expire(time)
+
+        size = Cache.__len__(self)
+
+        super().expire(time)
+
+        count = size - Cache.__len__(self)
+
+        if count > 0:
+            self.on_evict(r'expired', count)
+
+    def popitem(self):
+        result = super().popitem()
+
+        if self.on_evict is not None:
+            self.on_evict(r'size', 1)
+
+        return result
+
+    def clear(self):
+        """清空缓存，Cache.clear通过popitem逐项删除，清空期间不触发淘汰回调"""
+        on_evict, self.on_evict = self.on_evict, None
+
+        try:
+            super().clear()
+        finally:
+            self.on_evict = on_evict
+
+    def set(self, key, value, ttl):
+        """写入并指定该项的有效期
+        过期链表按过期时间有序，expire依赖该顺序淘汰，因此将该项移动到对应的位置
+        """
+        self[key] = value
+
+        root = self._TTLCache__root
+
+        link = self._TTLCache__links[key]
+        link.unlink()
+        link.expire = self.timer() + ttl
+
+        prev = root.prev
+
+        while prev is not root and prev.expire > link.expire:
+            prev = prev.prev
+
+        link.prev, link.next = prev, prev.next
+        prev.next.prev = link
+        prev.next = link
 
 
 class StackCache:
     """堆栈缓存
 
     使用运行内存作为高速缓存，可有效提高并发的处理能力
+    max_weight大于0时使用按权重限制容量的TinyLFUCache引擎(忽略maxsize)，支持weigher与ttl_jitter
+    两种引擎均支持通过set的ttl参数为单个缓存项指定有效期
+    name不为空时会在MetricsRegistry中注册同名的缓存指标
 
     """
 
-    def __init__(self, maxsize=0xff, ttl=60):
-        self._cache = TTLCache(maxsize, ttl)
+    def __init__(self, maxsize=0xff, ttl=60, *, max_weight=0, weigher=None, ttl_jitter=0, name=None):
+
+        if max_weight > 0:
+            self._cache = TinyLFUCache(max_weight, ttl, weigher=weigher, ttl_jitter=ttl_jitter)
+        else:
+            self._cache = _TTLCache(maxsize, ttl)
+
+        self._metrics = None
+
+        if name is not None:
+            self.metrics = MetricsRegistry().cache_metrics(name)
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics: Optional[CacheMetrics]):
+        self._metrics = metrics
+
+        if metrics is None:
+            self._cache.on_evict = None
+        else:
+            self._cache.on_evict = metrics.evict
+            metrics.bind_size(self.size)
 
     def has(self, key):
         return key in self._cache
 
     def get(self, key, default=None):
-        return self._cache.get(key, default)
+        if self._metrics is None:
+            return self._cache.get(key, default)
+
+        result = self._cache.get(key)
 
-    def set(self, key, val):
+        if result is None:
+            self._metrics.miss()
+            return default
+
+        self._metrics.hit()
+
+        return result
+
+    def set(self, key, val, ttl=None):
         if val is None:
             return
 
-        self._cache[key] = val
+        if ttl is None:
+            self._cache[key] = val
+        else:
+            self._cache.set(key, val, ttl)
 
     def incr(self, key, val=1):
         res = self.get(key, 0) + val
@@ -45,6 +153,9 @@ class StackCache:
     def delete(self, key):
         del self._cache[key]
 
+        if self._metrics is not None:
+            self._metrics.evict(r'explicit')
+
     def size(self):
         return len(self._cache)
 
@@ -65,37 +176,186 @@ class StackCache:
         self.delete(key)
 
 
+class _StaleEntry:
+    """带软过期时间的缓存项
+    """
+
+    __slots__ = [r'value', r'refresh_time', r'expire_time', r'hits']
+
+    def __init__(self, value, refresh_time, expire_time):
+
+        self.value = value
+        self.refresh_time = refresh_time
+        self.expire_time = expire_time
+        self.hits = 0
+
+
 class FuncCache:
     """函数缓存
 
     使用堆栈缓存实现的函数缓存，在有效期内函数签名一致就会命中缓存
     includes: 可从关键字参数中指定某些参数作为缓存key值
     excludes: 可从关键字参数中指定某些参数不作为缓存key值
+    key_builder: 缓存key生成器，默认使用参数元组作为key
+    key_func: 自定义key函数，使用与被装饰函数相同的参数调用，其返回值作为生成缓存key的唯一参数
+    stale_ttl: 软过期(ttl)后继续返回旧值的时长，期间由一个后台任务刷新缓存，超过ttl+stale_ttl才会阻塞调用方
+    refresh_ahead: 提前刷新比例(0~1)，在ttl的最后refresh_ahead部分内被命中的热点缓存项会在后台提前刷新
+    refresh_hits: 热点缓存项的命中次数阈值，加载后命中次数达到该值的缓存项才会提前刷新，冷数据等到软过期后再刷新
+    同一缓存项同一时刻最多只有一个刷新任务
+    max_weight & weigher & ttl_jitter: 透传给StackCache，max_weight大于0时使用TinyLFUCache引擎
+    name: 指标名称，不为空时注册到MetricsRegistry，为空时使用不注册的本地指标，均可通过metrics属性获取命中率等指标
     """
 
     def __init__(self, maxsize=0xff, ttl=10,
                  includes: Optional[List[str]] = None,
-                 excludes: Optional[List[str]] = None
+                 excludes: Optional[List[str]] = None,
+                 *, key_builder: Optional[KeyBuilder] = None, key_func=None,
+                 stale_ttl=0, refresh_ahead=0, refresh_hits=2, max_weight=0, weigher=None, ttl_jitter=0, name=None
                  ):
 
-        self._cache = StackCache(maxsize, ttl)
+        self._key_builder = key_builder if key_builder is not None else HashKeyBuilder()
+        self._key_func = key_func
+
+        self._ttl = ttl
+        self._stale_ttl = max(stale_ttl, 0)
+        self._refresh_ahead = Utils.interval_limit(refresh_ahead, 0, 1)
+        self._refresh_hits = refresh_hits
+
+        # 软过期模式下缓存项为_StaleEntry，按其中的值计算权重
+        if weigher is not None and (self._stale_ttl > 0 or self._refresh_ahead > 0):
+            weigher = Utils.func_partial(self._stale_weigher, weigher)
+
+        self._cache = StackCache(
+            maxsize, ttl + self._stale_ttl, max_weight=max_weight, weigher=weigher, ttl_jitter=ttl_jitter
+        )
         self._includes = includes or []
         self._excludes = excludes or []
 
+        self._refreshing = {}
+
+        self._name = name
+
+        if name is not None:
+            self._cache.metrics = MetricsRegistry().cache_metrics(name)
+
+    @property
+    def metrics(self) -> Optional[CacheMetrics]:
+        return self._cache.metrics
+
+    @staticmethod
+    def _stale_weigher(weigher, key, entry):
+        return weigher(key, entry.value)
+
+    def _bind_metrics(self, func):
+
+        # 未指定name时使用不注册的本地指标，避免同名函数(如闭包)共用同一组指标
+        if self._cache.metrics is None:
+            self._name = f'func_cache:{KeyBuilder.func_name(func)}'
+            self._cache.metrics = CacheMetrics(self._name)
+
     def _get_func_sign(self, func, *args, **kwargs):
+        if self._key_func is not None:
+            return self._key_builder.build(func, (self._key_func(*args, **kwargs),), {})
+
         if not self._includes and not self._excludes:
-            return Utils.params_sign(func, *args, **kwargs)
+            return self._key_builder.build(func, args, kwargs)
 
         if self._includes:
             sign_kwargs = {key: val for key, val in kwargs.items() if key in self._includes}
-            return Utils.params_sign(func, **sign_kwargs)
+            return self._key_builder.build(func, (), sign_kwargs)
 
         if self._excludes:
             sign_kwargs = {key: val for key, val in kwargs.items() if key not in self._excludes}
-            return Utils.params_sign(func, *args, **sign_kwargs)
+            return self._key_builder.build(func, args, sign_kwargs)
+
+    async def _load(self, func_sign, func, args, kwargs):
+        """堆栈缓存未命中时获取函数结果，子类可重写以叠加其它缓存层
+        """
+
+        return await Utils.awaitable_wrapper(
+            func(*args, **kwargs)
+        )
+
+    async def _timed_load(self, func_sign, func, args, kwargs):
+
+        metrics = self._cache.metrics
+
+        begin_time = metrics.load_begin()
+
+        try:
+            return await self._load(func_sign, func, args, kwargs)
+        finally:
+            metrics.load_end(begin_time)
+
+    def _refresh(self, func_sign, func, args, kwargs):
+        """刷新缓存项，同一缓存项共享同一个刷新任务
+        """
+
+        task = self._refreshing.get(func_sign)
+
+        if task is None:
+
+            task = self._refreshing[func_sign] = Utils.create_task(
+                self._do_refresh(func_sign, func, args, kwargs)
+            )
+
+            task.add_done_callback(
+                Utils.func_partial(self._clear_refreshing, func_sign)
+            )
+
+        return task
+
+    async def _do_refresh(self, func_sign, func, args, kwargs):
+
+        result = await self._timed_load(func_sign, func, args, kwargs)
+
+        if result is not None:
+            now = Utils.loop_time()
+            self._cache.set(
+                func_sign,
+                _StaleEntry(result, now + self._ttl * (1 - self._refresh_ahead), now + self._ttl)
+            )
+
+        return result
+
+    def _clear_refreshing(self, func_sign, task):
+
+        self._refreshing.pop(func_sign, None)
+
+        if not task.cancelled() and task.exception() is not None:
+            Utils.log.error(f'func cache refresh error: {task.exception()!r}')
+
+    def _stale_wrapper(self, func):
+
+        @Utils.func_wraps(func)
+        async def _wrapper(*args, **kwargs):
+            func_sign = self._get_func_sign(func, *args, **kwargs)
+            entry = self._cache.get(func_sign)
+
+            if entry is None:
+                return await asyncio.shield(
+                    self._refresh(func_sign, func, args, kwargs)
+                )
+
+            entry.hits += 1
+
+            now = Utils.loop_time()
+
+            # 软过期后总是刷新，提前刷新只针对热点缓存项
+            if entry.expire_time <= now or (entry.refresh_time <= now and entry.hits >= self._refresh_hits):
+                self._refresh(func_sign, func, args, kwargs)
+
+            return entry.value
+
+        return _wrapper
 
     def __call__(self, func):
 
+        self._bind_metrics(func)
+
+        if self._stale_ttl > 0 or self._refresh_ahead > 0:
+            return self._stale_wrapper(func)
+
         @Utils.func_wraps(func)
         async def _wrapper(*args, **kwargs):
             func_sign = self._get_func_sign(func, *args, **kwargs)
@@ -103,9 +363,7 @@ class FuncCache:
 
             if result is None:
 
-                result = await Utils.awaitable_wrapper(
-                    func(*args, **kwargs)
-                )
+                result = await self._timed_load(func_sign, func, args, kwargs)
 
                 if result is not None:
                     self._cache.set(func_sign, result)
@@ -115,16 +373,94 @@ class FuncCache:
         return _wrapper
 
 
+def _freeze(val):
+    """将结果递归冻结为只读视图
+    """
+
+    if isinstance(val, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in val.items()})
+
+    if isinstance(val, (list, tuple)):
+        return tuple(_freeze(item) for item in val)
+
+    if isinstance(val, set):
+        return frozenset(val)
+
+    return val
+
+
 class ShareFuture:
     """共享Future装饰器
 
-    同一时刻并发调用函数时，使用该装饰器的函数签名一致的调用，会共享计算结果
+    同一时刻并发调用函数时，使用该装饰器的函数签名一致的调用，会共享计算结果，函数的异常或取消同样会传递给所有调用方
+    share_mode: 结果的共享方式
+        DEEPCOPY: 其余调用方获得结果的深拷贝
+        COPY: 其余调用方获得结果的浅拷贝
+        SAME: 所有调用方获得同一个对象，调用方不能修改结果
+        FREEZE: 结果冻结为只读视图(dict->MappingProxyType，list->tuple，set->frozenset)后由所有调用方共享
+    key_builder: 函数签名生成器，默认使用参数元组作为key
+    name: 指标名称，不为空时在MetricsRegistry中记录共享情况(hits为共享结果的调用，misses为实际执行的调用)
 
     """
 
-    def __init__(self):
+    DEEPCOPY = r'deepcopy'
+    COPY = r'copy'
+    SAME = r'same'
+    FREEZE = r'freeze'
+
+    _SHARE_FUNCS = {
+        DEEPCOPY: copy.deepcopy,
+        COPY: copy.copy,
+        SAME: None,
+        FREEZE: None,
+    }
+
+    def __init__(self, share_mode=DEEPCOPY, *, key_builder: Optional[KeyBuilder] = None, name=None):
+
+        if share_mode not in self._SHARE_FUNCS:
+            raise ValueError(f'Invalid share mode: {share_mode}')
 
         self._future = {}
+        self._key_builder = key_builder if key_builder is not None else HashKeyBuilder()
+
+        self._share_mode = share_mode
+        self._share_func = self._SHARE_FUNCS[share_mode]
+
+        self._call_count = 0
+        self._coalesce_count = 0
+
+        self._metrics = None if name is None else MetricsRegistry().cache_metrics(name)
+
+    @property
+    def metrics(self) -> Optional[CacheMetrics]:
+        return self._metrics
+
+    @property
+    def call_count(self):
+        """调用总数
+        """
+
+        return self._call_count
+
+    @property
+    def coalesce_count(self):
+        """共享了其它调用计算结果的调用数
+        """
+
+        return self._coalesce_count
+
+    async def _freeze_result(self, coro):
+
+        return _freeze(await coro)
+
+    async def _timed_result(self, coro):
+
+        begin_time = self._metrics.load_begin()
+
+        try:
+            return await coro
+        finally:
+            self._metrics.load_end(begin_time)
 
     def __call__(self, func):
 
@@ -133,7 +469,9 @@ class ShareFuture:
 
             future = None
 
-            func_sign = Utils.params_sign(func, *args, **kwargs)
+            func_sign = self._key_builder.build(func, args, kwargs)
+
+            self._call_count += 1
 
             if func_sign in self._future:
 
@@ -141,14 +479,26 @@ class ShareFuture:
 
                 self._future[func_sign].append(future)
 
+                self._coalesce_count += 1
+
+                if self._metrics is not None:
+                    self._metrics.hit()
+
             else:
 
-                future = Utils.create_task(
-                    func(*args, **kwargs)
-                )
+                coro = func(*args, **kwargs)
+
+                if not asyncio.iscoroutine(coro):
+                    raise TypeError(r'Not Coroutine Object')
+
+                if self._share_mode == self.FREEZE:
+                    coro = self._freeze_result(coro)
 
-                if future is None:
-                    TypeError(r'Not Coroutine Object')
+                if self._metrics is not None:
+                    self._metrics.miss()
+                    coro = self._timed_result(coro)
+
+                future = Utils.create_task(coro)
 
                 self._future[func_sign] = [future]
 
@@ -156,6 +506,9 @@ class ShareFuture:
                     Utils.func_partial(self._clear_future, func_sign)
                 )
 
+                # 发起调用方取消等待不影响共享的任务，只有任务本身被取消时才传递给所有调用方
+                future = asyncio.shield(future)
+
             return await future
 
         return _wrapper
@@ -167,7 +520,168 @@ class ShareFuture:
 
         futures = self._future.pop(func_sign)
 
-        result = futures.pop(0).result()
+        task = futures.pop(0)
+
+        if task.cancelled():
+
+            for future in futures:
+                future.cancel()
+
+            return
+
+        exception = task.exception()
+
+        if exception is not None:
+
+            for future in futures:
+                if not future.done():
+                    future.set_exception(exception)
+
+            return
+
+        result = task.result()
 
         for future in futures:
-            future.set_result(Utils.deepcopy(result))
+            if not future.done():
+                future.set_result(
+                    result if self._share_func is None else self._share_func(result)
+                )
+
+
+class _LoaderScope(dict):
+    """批量加载器的请求级缓存
+    """
+    pass
+
+
+class BatchLoader:
+    """批量加载器
+
+    同一个事件循环周期内并发请求的key会被合并，只调用一次batch_fn(keys)批量加载，再将结果分别返回给各个调用方
+    batch_fn: 批量加载函数，参数为去重后的key列表，返回{key: value}字典或与keys顺序一致的列表，缺失的key返回None
+    max_batch_size: 单次调用batch_fn的最大key数量，超出时拆分为多次并发调用
+    batch_delay: 收集key的等待时间(秒)，为0时只合并同一个事件循环周期内的请求
+
+    调用scope创建请求级缓存，作用域对象被引用期间，当前上下文(包括其创建的子任务)中相同key只会加载一次
+
+    loader = BatchLoader(batch_fn)
+    scope = loader.scope()
+    users = await MultiTasks(*[loader.load(user_id) for user_id in user_ids])
+
+    """
+
+    def __init__(self, batch_fn, max_batch_size=100, *, batch_delay=0):
+
+        self._batch_fn = batch_fn
+        self._max_batch_size = max(max_batch_size, 1)
+        self._batch_delay = batch_delay
+
+        self._pending = {}
+        self._dispatch_handle = None
+
+        # 每个加载器独立的上下文变量，保存作用域的弱引用，随加载器一起释放
+        self._context = ContextVar(r'batch_loader_scope', default=None)
+
+    def scope(self):
+        """创建请求级缓存作用域，需由调用方持有返回的作用域对象
+        """
+
+        scope = _LoaderScope()
+
+        self._context.set(weakref.ref(scope))
+
+        return scope
+
+    def _get_scope(self):
+
+        ref = self._context.get()
+
+        return None if ref is None else ref()
+
+    def clear(self, key=None):
+        """清除当前作用域中的缓存
+        """
+
+        scope = self._get_scope()
+
+        if scope is None:
+            return
+
+        if key is None:
+            scope.clear()
+        else:
+            scope.pop(key, None)
+
+    async def load(self, key):
+        """加载单个key
+        """
+
+        # 同一key的调用方共享future，单个调用方取消等待不影响其它调用方
+        return await asyncio.shield(self._get_future(key))
+
+    def _get_future(self, key):
+
+        scope = self._get_scope()
+
+        if scope is not None:
+
+            future = scope.get(key)
+
+            # 加载失败的结果不缓存
+            if future is not None and not (future.done() and (future.cancelled() or future.exception())):
+                return future
+
+        future = self._pending.get(key)
+
+        if future is None:
+
+            future = self._pending[key] = asyncio.get_event_loop().create_future()
+
+            if self._dispatch_handle is None:
+                if self._batch_delay > 0:
+                    self._dispatch_handle = Utils.call_later(self._batch_delay, self._dispatch)
+                else:
+                    self._dispatch_handle = Utils.call_soon(self._dispatch)
+
+        if scope is not None:
+            scope[key] = future
+
+        return future
+
+    async def load_many(self, keys):
+
+        return await asyncio.gather(*[asyncio.shield(self._get_future(key)) for key in keys])
+
+    def _dispatch(self):
+
+        self._dispatch_handle = None
+
+        pending, self._pending = self._pending, {}
+
+        keys = list(pending.keys())
+
+        for index in range(0, len(keys), self._max_batch_size):
+            Utils.create_task(
+                self._do_batch(keys[index:index + self._max_batch_size], pending)
+            )
+
+    async def _do_batch(self, keys, pending):
+
+        try:
+
+            result = await Utils.awaitable_wrapper(self._batch_fn(keys))
+
+            if not isinstance(result, dict):
+                result = dict(zip(keys, result))
+
+            for key in keys:
+                future = pending[key]
+                if not future.done():
+                    future.set_result(result.get(key))
+
+        except Exception as err:
+
+            for key in keys:
+                future = pending[key]
+                if not future.done():
+                    future.set_exception(err)
@@ -0,0 +1,170 @@
+"""缓存序列化编解码器"""
+import pickle
+import zlib
+
+from najapy.common.async_base import Utils
+
+
+class Codec:
+    """编解码器基类
+
+    CODEC_ID: 编解码器标识(1~0x7f)，写入数据头，用于读取时选择编解码器
+    """
+
+    CODEC_ID = 0
+
+    def encode(self, value) -> bytes:
+
+        raise NotImplementedError()
+
+    def decode(self, data):
+
+        raise NotImplementedError()
+
+
+class PickleCodec(Codec):
+
+    CODEC_ID = 1
+
+    def encode(self, value):
+
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, data):
+
+        return pickle.loads(data)
+
+
+class MsgpackCodec(Codec):
+
+    CODEC_ID = 2
+
+    def encode(self, value):
+
+        return Utils.msgpack_encode(value, use_bin_type=True)
+
+    def decode(self, data):
+
+        return Utils.msgpack_decode(data, raw=False)
+
+
+class JsonCodec(Codec):
+
+    CODEC_ID = 3
+
+    def encode(self, value):
+
+        return Utils.json_encode(value).encode(r'utf-8')
+
+    def decode(self, data):
+
+        return Utils.json_decode(bytes(data))
+
+
+class BytesCodec(Codec):
+    """原始字节，不做序列化
+    """
+
+    CODEC_ID = 4
+
+    def encode(self, value):
+
+        return Utils.utf8(value)
+
+    def decode(self, data):
+
+        return bytes(data)
+
+
+class CodecRegistry:
+    """编解码器注册表
+    """
+
+    _codecs = {}
+
+    @classmethod
+    def register(cls, codec: Codec):
+
+        if not 0 < codec.CODEC_ID < Serializer.COMPRESS_FLAG or codec.CODEC_ID == Serializer.LEGACY_HEADER:
+            raise ValueError(f'Invalid codec id: {codec.CODEC_ID}')
+
+        cls._codecs[codec.CODEC_ID] = codec
+
+    @classmethod
+    def get(cls, codec_id) -> Codec:
+
+        codec = cls._codecs.get(codec_id)
+
+        if codec is None:
+            raise ValueError(f'Unknown codec id: {codec_id}')
+
+        return codec
+
+
+class Serializer:
+    """缓存值序列化器
+
+    数据格式为1字节数据头+数据体，数据头低7位为编解码器标识，最高位标识数据体是否经过zlib压缩
+    只有编码后超过compress_threshold字节的数据才会被压缩，读取时根据数据头自动选择编解码器，
+    因此不同编解码器写入的数据可以互相读取，其它语言的服务只需解析数据头即可读取
+    兼容读取旧版本Utils.pickle_dumps写入的数据(zlib数据流，首字节为0x78)
+
+    codec: 写入时使用的编解码器
+    compress_threshold: 压缩阈值(字节)，小于0时不压缩
+    """
+
+    COMPRESS_FLAG = 0x80
+    LEGACY_HEADER = 0x78
+
+    def __init__(self, codec: Codec = None, compress_threshold=1024, compress_level=6):
+
+        self._codec = codec if codec is not None else CodecRegistry.get(PickleCodec.CODEC_ID)
+        self._compress_threshold = compress_threshold
+        self._compress_level = compress_level
+
+    @property
+    def codec(self):
+
+        return self._codec
+
+    def dumps(self, value) -> bytes:
+
+        stream = self._codec.encode(value)
+
+        header = self._codec.CODEC_ID
+
+        if 0 <= self._compress_threshold < len(stream):
+            stream = zlib.compress(stream, self._compress_level)
+            header |= self.COMPRESS_FLAG
+
+        return bytes((header,)) + stream
+
+    def loads(self, data):
+
+        header = data[0]
+
+        if header == self.LEGACY_HEADER:
+            return Utils.pickle_loads(data)
+
+        stream = memoryview(data)[1:]
+
+        if header & self.COMPRESS_FLAG:
+            stream = zlib.decompress(stream)
+
+        return CodecRegistry.get(header & ~self.COMPRESS_FLAG).decode(stream)
+
+
+class LegacySerializer(Serializer):
+    """旧版本格式(pickle+zlib，无数据头)的序列化器
+
+    redis连接池的默认序列化器，写入旧版本格式，读取同时兼容新格式，
+    保证滚动升级期间旧版本服务可以读取数据，全部升级完成后再显式切换到Serializer
+    """
+
+    def dumps(self, value):
+
+        return Utils.pickle_dumps(value)
+
+
+for _codec in (PickleCodec(), MsgpackCodec(), JsonCodec(), BytesCodec()):
+    CodecRegistry.register(_codec)
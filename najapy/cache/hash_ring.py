@@ -0,0 +1,78 @@
+from bisect import bisect, insort
+
+from najapy.common.async_base import Utils
+
+
+class HashRing:
+    """一致性哈希环
+    每个节点在环上生成replicas个虚拟节点，增删节点时只有相邻区间的key会迁移
+    key中包含{tag}时只使用tag计算哈希，便于将相关的key分配到同一节点
+    """
+
+    def __init__(self, nodes=None, replicas=160):
+
+        self._replicas = replicas
+
+        self._nodes = set()
+        self._points = []
+        self._ring = {}
+
+        for node in (nodes or []):
+            self.add_node(node)
+
+    @property
+    def nodes(self):
+        return set(self._nodes)
+
+    @staticmethod
+    def _hash_tag(key):
+
+        if isinstance(key, bytes):
+            key = key.decode(r'utf-8', r'replace')
+        else:
+            key = str(key)
+
+        begin = key.find(r'{')
+
+        if begin >= 0:
+            end = key.find(r'}', begin + 1)
+            if end > begin + 1:
+                return key[begin + 1:end]
+
+        return key
+
+    def add_node(self, node):
+
+        if node in self._nodes:
+            return
+
+        self._nodes.add(node)
+
+        for index in range(self._replicas):
+            point = Utils.md5_u32(f'{node}#{index}')
+            # 哈希碰撞时保留先加入的节点
+            if point not in self._ring:
+                self._ring[point] = node
+                insort(self._points, point)
+
+    def remove_node(self, node):
+
+        if node not in self._nodes:
+            return
+
+        self._nodes.remove(node)
+
+        self._ring = {point: _node for point, _node in self._ring.items() if _node != node}
+        self._points = sorted(self._ring)
+
+    def get_node(self, key):
+
+        if not self._points:
+            raise KeyError(r'Hash ring is empty')
+
+        index = bisect(self._points, Utils.md5_u32(self._hash_tag(key))) % len(self._points)
+
+        return self._ring[self._points[index]]
+
+    def __len__(self):
+        return len(self._nodes)
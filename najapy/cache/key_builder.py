@@ -0,0 +1,88 @@
+"""缓存key生成器"""
+import hashlib
+
+from najapy.common.async_base import Utils
+
+
+class KeyBuilder:
+    """缓存key生成器基类
+
+    根据函数与调用参数生成缓存key，func可以为None(仅由参数生成key)或字符串(函数全名)
+    """
+
+    def build(self, func, args, kwargs):
+
+        raise NotImplementedError()
+
+    @staticmethod
+    def func_name(func):
+
+        if func is None:
+            return r''
+
+        if isinstance(func, str):
+            return func
+
+        return f'{func.__module__}.{func.__qualname__}'
+
+
+class SignKeyBuilder(KeyBuilder):
+    """兼容Utils.params_sign的key生成器
+
+    参数字符串化后计算md5，生成结果与旧版本一致，适用于需要兼容已有redis数据的场景
+    """
+
+    def build(self, func, args, kwargs):
+
+        if func is None:
+            return Utils.params_sign(*args, **kwargs)
+        else:
+            return Utils.params_sign(func, *args, **kwargs)
+
+
+class HashKeyBuilder(KeyBuilder):
+    """进程内缓存的key生成器
+
+    参数均为str、int、float、bool、bytes、None时直接使用参数元组及其类型作为key，无需字符串化与摘要计算，
+    类型参与比较，因此1、True与1.0不会共用缓存项，key只引用不可变的基础类型，不会延长其它对象的生命周期
+    其它参数(包括容器与自定义对象)退回到Utils.params_sign
+    """
+
+    PRIMITIVE_TYPES = frozenset({str, int, float, bool, bytes, type(None)})
+
+    def build(self, func, args, kwargs):
+
+        if kwargs:
+            items = tuple(sorted(kwargs.items()))
+            values = args + tuple(val for _, val in items)
+        else:
+            items = None
+            values = args
+
+        types = tuple(type(val) for val in values)
+
+        if not self.PRIMITIVE_TYPES.issuperset(types):
+            return SignKeyBuilder.build(self, func, args, kwargs)
+
+        return func, args, items, types
+
+
+class DigestKeyBuilder(KeyBuilder):
+    """跨进程稳定的key生成器
+
+    使用函数全名与msgpack序列化的参数计算blake2b摘要，适用于redis等共享存储的key值
+    无法被msgpack序列化的参数会先转换为字符串
+    """
+
+    def __init__(self, digest_size=16):
+
+        self._digest_size = digest_size
+
+    def build(self, func, args, kwargs):
+
+        stream = Utils.msgpack_encode(
+            (self.func_name(func), args, sorted(kwargs.items()) if kwargs else None),
+            default=str
+        )
+
+        return hashlib.blake2b(stream, digest_size=self._digest_size).hexdigest()
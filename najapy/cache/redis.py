@@ -1,11 +1,27 @@
-from typing import Optional, Type
+import asyncio
+import math
+import random
+import time
+import weakref
+from collections import deque
+from typing import Optional, Type, List
 
 from redis.asyncio import Connection, BlockingConnectionPool, Redis
 from redis.asyncio import ConnectionPool
-
+from redis.commands import AsyncCoreCommands
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError, ResponseError
+from redis.exceptions import LockError, LockNotOwnedError
+
+from najapy.cache.base import FuncCache, BatchLoader, StackCache
+from najapy.cache.codec import Serializer, LegacySerializer
+from najapy.cache.hash_ring import HashRing
+from najapy.cache.key_builder import KeyBuilder, SignKeyBuilder, DigestKeyBuilder
+from najapy.cache.script import LuaScript, ScriptRegistry
 from najapy.common.async_base import AsyncContextManager, Utils
 from najapy.common.base import catch_error
-from najapy.event.async_event import DistributedEvent
+from najapy.common.buffer import QueueBuffer
+from najapy.common.metrics import MetricsRegistry, CacheMetrics
+from najapy.event.async_event import DistributedEvent, StreamEvent
 
 
 class RedisDelegate:
@@ -15,12 +31,19 @@ class RedisDelegate:
 
     def __init__(self):
         self._redis_pool = None
+        self._near_cache = None
+        self._batch_loaders = {}
 
     @property
     def redis_pool(self):
 
         return self._redis_pool
 
+    @property
+    def near_cache(self) -> Optional[r'NearCache']:
+
+        return self._near_cache
+
     def set_redis_key_prefix(self, value):
         self._redis_pool.key_prefix = value
 
@@ -46,6 +69,10 @@ class RedisDelegate:
 
     async def async_close_redis(self):
 
+        if self._near_cache is not None:
+            await self._near_cache.close()
+            self._near_cache = None
+
         if self._redis_pool is not None:
             await self._redis_pool.disconnect()
             self._redis_pool = None
@@ -70,11 +97,200 @@ class RedisDelegate:
 
         return client
 
+    def register_script(self, name, source) -> LuaScript:
+        """注册Lua脚本，连接池初始化后注册的脚本在首次执行时加载
+        """
+        return self._redis_pool.scripts.register(LuaScript(name, source))
+
+    async def enable_near_cache(self, maxsize=1024, ttl=60, *, mode=r'tracking'):
+        """开启近端缓存，需在设置key_prefix之后调用
+        """
+        if self._near_cache is None:
+            self._near_cache = await NearCache(self._redis_pool, maxsize, ttl, mode=mode).open()
+
+        return self._near_cache
+
+    def batch_loader(self, max_batch_size=100, *, batch_delay=0):
+        """提供通过MGET批量读取对象缓存(与get_obj格式一致)的BatchLoader，相同参数返回同一个BatchLoader
+        """
+
+        loader = self._batch_loaders.get((max_batch_size, batch_delay))
+
+        if loader is not None:
+            return loader
+
+        async def _batch_fn(keys):
+
+            cache = await self.get_cache_client()
+
+            try:
+                values = await cache.mget(keys)
+            finally:
+                await cache.release()
+
+            serializer = self._redis_pool.serializer
+
+            return [serializer.loads(value) if value else None for value in values]
+
+        loader = self._batch_loaders[(max_batch_size, batch_delay)] = BatchLoader(
+            _batch_fn, max_batch_size, batch_delay=batch_delay
+        )
+
+        return loader
+
     def event_dispatcher(self, channel_name, channel_count):
         """提供redis广播总线
         """
         return DistributedEvent(self._redis_pool, channel_name, channel_count)
 
+    def stream_event_dispatcher(self, stream_name, **kwargs):
+        """提供redis stream可靠消息总线
+        """
+        return StreamEvent(self._redis_pool, stream_name, **kwargs)
+
+
+class ShardedRedisDelegate(RedisDelegate):
+    """分片Redis功能组件
+    多个Redis节点组成一致性哈希环，按get_safe_key生成的key将命令路由到对应节点，对外接口与RedisDelegate一致
+    redis_pool为第一个节点的连接池，广播总线、PUBLISH及订阅等与key无关的功能固定使用该节点
+    近端缓存按节点分别建立失效通知连接，读写按key路由到所在节点
+    """
+
+    def __init__(self, replicas=160):
+
+        super().__init__()
+
+        self._replicas = replicas
+        self._hash_ring = HashRing(replicas=replicas)
+        self._redis_pools = {}
+
+        self._pool_config = {}
+
+    @property
+    def hash_ring(self) -> HashRing:
+        return self._hash_ring
+
+    @property
+    def redis_pools(self):
+        return dict(self._redis_pools)
+
+    @staticmethod
+    def _node_name(host, port=6379, db=0, **_):
+        return f'{host}:{port}/{db}'
+
+    def set_redis_key_prefix(self, value):
+        for pool in self._redis_pools.values():
+            pool.key_prefix = value
+
+    async def async_init_redis(
+            self,
+            nodes: List[dict],
+            min_connections: Optional[int] = 1,
+            max_connections: Optional[int] = 32,
+            timeout: Optional[int] = 20,
+            **kwargs
+    ):
+        """初始化各节点的连接池
+        nodes: 节点配置列表，如[{'host': '127.0.0.1', 'port': 6379, 'db': 0, 'password': None}]
+        """
+
+        self._pool_config = dict(
+            min_connections=min_connections,
+            max_connections=max_connections,
+            timeout=timeout,
+            **kwargs
+        )
+
+        for node in nodes:
+            await self.add_redis_node(**node)
+
+        return self._redis_pool
+
+    async def add_redis_node(self, host, port=6379, db=0, password=None, **kwargs):
+        """增加节点，只有哈希环上相邻区间的key会迁移到新节点"""
+
+        name = self._node_name(host, port, db)
+
+        if name in self._redis_pools:
+            return self._redis_pools[name]
+
+        config = dict(self._pool_config, **kwargs)
+
+        pool = await BlockingRedisPool(host, port, db=db, password=password, **config).initialize()
+
+        if self._redis_pool is not None:
+            pool.key_prefix = self._redis_pool.key_prefix
+            pool.key_builder = self._redis_pool.key_builder
+            pool.serializer = self._redis_pool.serializer
+        else:
+            self._redis_pool = pool
+
+        self._redis_pools[name] = pool
+        self._hash_ring.add_node(name)
+
+        if self._near_cache is not None:
+            await self._near_cache.add_node(name, pool)
+
+        return pool
+
+    async def remove_redis_node(self, host, port=6379, db=0):
+        """移除节点，该节点上的key由哈希环上的下一个节点接管"""
+
+        name = self._node_name(host, port, db)
+
+        pool = self._redis_pools.pop(name, None)
+
+        if pool is None:
+            return
+
+        self._hash_ring.remove_node(name)
+
+        if self._near_cache is not None:
+            await self._near_cache.remove_node(name)
+
+        if pool is self._redis_pool:
+            self._redis_pool = next(iter(self._redis_pools.values()), None)
+
+        await pool.disconnect()
+
+    def get_node_pool(self, key):
+        """获取key所在节点的连接池"""
+        return self._redis_pools[self._hash_ring.get_node(key)]
+
+    async def enable_near_cache(self, maxsize=1024, ttl=60, *, mode=r'tracking'):
+        """开启近端缓存，每个节点使用独立的本地缓存与失效通知连接，需在设置key_prefix之后调用
+        """
+        if self._near_cache is None:
+            self._near_cache = ShardedNearCache(self, maxsize, ttl, mode=mode)
+
+            for name, pool in self._redis_pools.items():
+                await self._near_cache.add_node(name, pool)
+
+        return self._near_cache
+
+    async def async_close_redis(self):
+
+        if self._near_cache is not None:
+            await self._near_cache.close()
+            self._near_cache = None
+
+        for pool in self._redis_pools.values():
+            await pool.disconnect()
+
+        self._redis_pools.clear()
+        self._hash_ring = HashRing(replicas=self._replicas)
+        self._redis_pool = None
+
+    async def get_cache_client(self, *args, **kwargs):
+        """提供分片redis客户端
+        """
+        client = None
+
+        if self._redis_pool is not None:
+            client = await ShardedCacheClient(self, *args, **kwargs)
+
+        return client
+
 
 class _PoolMixin(AsyncContextManager):
 
@@ -82,11 +298,61 @@ class _PoolMixin(AsyncContextManager):
 
         self._name = Utils.uuid1()[:8]
         self._key_prefix = None
+        self._key_builder = SignKeyBuilder()
+        self._serializer = LegacySerializer()
+        self._metrics = None
+        self._auto_pipeline = None
+        self._scripts = ScriptRegistry()
         self._min_connections = min_connections if min_connections else 0
 
+        self._waiter_limit = 8
+        self._waiter_client = None
+        self._waiter_semaphore = None
+
     async def _context_release(self):
         pass
 
+    @property
+    def waiter_limit(self):
+        return self._waiter_limit
+
+    @waiter_limit.setter
+    def waiter_limit(self, value):
+        """阻塞等待(如公平锁的BLPOP)可同时占用的独立连接数，需在首次使用前设置"""
+        self._waiter_limit = value
+
+    @property
+    def waiter_client(self) -> Redis:
+        """阻塞等待专用的客户端，使用独立的连接池，不占用业务连接"""
+        if self._waiter_client is None:
+            self._waiter_client = Redis(
+                connection_pool=BlockingConnectionPool(
+                    max_connections=self._waiter_limit, timeout=None, **self.connection_kwargs
+                )
+            )
+
+        return self._waiter_client
+
+    @property
+    def waiter_semaphore(self) -> asyncio.Semaphore:
+        """限制同时占用等待连接的数量，获取不到时应改为轮询"""
+        if self._waiter_semaphore is None:
+            self._waiter_semaphore = asyncio.Semaphore(self._waiter_limit)
+
+        return self._waiter_semaphore
+
+    async def _close_waiter_client(self):
+
+        if self._waiter_client is not None:
+            await self._waiter_client.connection_pool.disconnect()
+            self._waiter_client = None
+
+    async def _close_auto_pipeline(self):
+
+        if self._auto_pipeline is not None:
+            auto_pipeline, self._auto_pipeline = self._auto_pipeline, None
+            await auto_pipeline.close()
+
     def get_safe_key(self, key, *args, **kwargs):
 
         if self._key_prefix:
@@ -95,7 +361,7 @@ class _PoolMixin(AsyncContextManager):
             _key = key
 
         if args or kwargs:
-            _key = f'{_key}:{Utils.params_sign(*args, **kwargs)}'
+            _key = f'{_key}:{self._key_builder.build(None, args, kwargs)}'
 
         return _key
 
@@ -107,8 +373,65 @@ class _PoolMixin(AsyncContextManager):
     def key_prefix(self, value):
         self._key_prefix = value
 
-    async def get_client(self, *args, **kwargs):
-        return await CacheClient(self, *args, **kwargs)
+    @property
+    def key_builder(self):
+        return self._key_builder
+
+    @key_builder.setter
+    def key_builder(self, value: KeyBuilder):
+        """默认兼容旧版本的key值，没有历史数据时可设置为DigestKeyBuilder提高性能"""
+        self._key_builder = value
+
+    @property
+    def serializer(self) -> Serializer:
+        return self._serializer
+
+    @serializer.setter
+    def serializer(self, value: Serializer):
+        """get_obj & set_obj默认使用的序列化器
+        默认写入旧版本格式(pickle+zlib)，读取同时兼容带数据头的新格式，保证滚动升级期间旧版本服务可以读取新服务写入的数据，
+        所有服务升级完成后再设置为Serializer(可指定编解码器与压缩阈值)切换到新格式
+        """
+        self._serializer = value
+
+    @property
+    def metrics(self) -> CacheMetrics:
+        """连接池的缓存指标，按redis地址命名，记录get_obj的命中情况与对象读写耗时"""
+        if self._metrics is None:
+            config = self.connection_kwargs
+            self._metrics = MetricsRegistry().cache_metrics(
+                f"redis:{config.get(r'host')}:{config.get(r'port')}:{config.get(r'db', 0)}"
+            )
+
+        return self._metrics
+
+    @property
+    def scripts(self) -> ScriptRegistry:
+        return self._scripts
+
+    async def _load_scripts(self):
+        with catch_error():
+            cache = await self.get_client()
+
+            try:
+                await self._scripts.load(cache)
+            finally:
+                await cache.release()
+
+    @property
+    def auto_pipeline(self) -> r'AutoPipeline':
+        """连接池共享的自动管道，首次使用时创建"""
+        if self._auto_pipeline is None:
+            self._auto_pipeline = AutoPipeline(self)
+
+        return self._auto_pipeline
+
+    async def get_client(self, *args, auto_pipeline=False, **kwargs):
+        """auto_pipeline为True时返回AutoPipelineClient，多个客户端共享少量连接"""
+        if auto_pipeline:
+            return await AutoPipelineClient(self, *args, **kwargs)
+        else:
+            return await CacheClient(self, *args, **kwargs)
 
 
 class RedisPool(ConnectionPool, _PoolMixin):
@@ -149,9 +472,17 @@ class RedisPool(ConnectionPool, _PoolMixin):
             for connection in connections:
                 await self.release(connection)
 
+    async def disconnect(self, *args, **kwargs):
+
+        await self._close_auto_pipeline()
+        await self._close_waiter_client()
+
+        return await super().disconnect(*args, **kwargs)
+
     async def initialize(self):
 
         await self._init_connection()
+        await self._load_scripts()
 
         config = self.connection_kwargs
 
@@ -201,9 +532,17 @@ class BlockingRedisPool(BlockingConnectionPool, _PoolMixin):
             for connection in connections:
                 await self.release(connection)
 
+    async def disconnect(self, *args, **kwargs):
+
+        await self._close_auto_pipeline()
+        await self._close_waiter_client()
+
+        return await super().disconnect(*args, **kwargs)
+
     async def initialize(self):
 
         await self._init_connection()
+        await self._load_scripts()
 
         config = self.connection_kwargs
 
@@ -222,10 +561,12 @@ class CacheClient(Redis, AsyncContextManager):
         1.decode_responses=True会造成意想不到的结果，所以除使用get_obj & set_obj外，使用Redis的方法时需将结果进行解码
     """
 
+    SINGLE_CONNECTION = True
+
     def __init__(self, pool, *args, **kwargs):
         super().__init__(
             connection_pool=pool,
-            single_connection_client=True,
+            single_connection_client=self.SINGLE_CONNECTION,
             *args,
             **kwargs
         )
@@ -257,13 +598,154 @@ class CacheClient(Redis, AsyncContextManager):
             thread_local=thread_local
         )
 
-    async def get_obj(self, name):
+    def allocate_fair_lock(self, key, expire=60, *, blocking=True, blocking_timeout=None, waiter_ttl=10):
+        """获取基于通知的公平分布式锁
+        默认阻塞
+        """
+        return FairLock(
+            self, self.get_safe_key(key), expire,
+            blocking=blocking, blocking_timeout=blocking_timeout, waiter_ttl=waiter_ttl
+        )
+
+    async def get_obj(self, name, *, serializer: Optional[Serializer] = None):
+        """读取对象缓存，可读取任意序列化器写入的数据"""
+        metrics = self._pool.metrics
+        begin_time = time.perf_counter()
+
         result = await super().get(name)
-        return Utils.pickle_loads(result) if result else result
 
-    async def set_obj(self, name, value, ex=3600, nx=False, xx=False):
-        value = Utils.pickle_dumps(value)
-        return await super().set(name, value, ex=ex, nx=nx, xx=xx)
+        metrics.observe(r'latency_seconds', time.perf_counter() - begin_time)
+
+        if result:
+            metrics.hit()
+            return (serializer or self._pool.serializer).loads(result)
+        else:
+            metrics.miss()
+            return result
+
+    async def set_obj(self, name, value, ex=3600, nx=False, xx=False, *, serializer: Optional[Serializer] = None):
+        """写入对象缓存，serializer为空时使用连接池的序列化器"""
+        begin_time = time.perf_counter()
+
+        value = (serializer or self._pool.serializer).dumps(value)
+        result = await super().set(name, value, ex=ex, nx=nx, xx=xx)
+
+        self._pool.metrics.observe(r'latency_seconds', time.perf_counter() - begin_time)
+
+        return result
+
+    async def eval_script(self, name, keys=(), args=()):
+        """通过EVALSHA执行连接池中注册的Lua脚本"""
+        return await self._pool.scripts.execute(self, name, keys, args)
+
+    async def incr_with_expire(self, name, amount=1, expire=0) -> int:
+        """原子的自增并设置有效期"""
+        return await self.eval_script(r'incr_with_expire', (name,), (amount, expire))
+
+    async def compare_and_delete(self, name, value) -> bool:
+        """值与value相等时删除"""
+        return bool(await self.eval_script(r'compare_and_delete', (name,), (value,)))
+
+    async def get_or_lock(self, name, lock_name, token, lock_expire=60, *, serializer: Optional[Serializer] = None):
+        """读取对象缓存，未命中时尝试获取锁
+        返回(value, acquired)，命中时value不为None；未命中时acquired表示是否获得锁
+        """
+        result = await self.eval_script(
+            r'get_or_lock', (name, lock_name), (token, int(lock_expire * 1000))
+        )
+
+        if result[0] == 0:
+            return (serializer or self._pool.serializer).loads(result[1]), False
+        else:
+            return None, result[0] == 1
+
+    async def sliding_window(self, name, window, limit) -> (bool, int):
+        """滑动窗口计数，window秒内最多通过limit次
+        返回(allowed, count)，count为窗口内已通过的次数
+        """
+        now = int(time.time() * 1000)
+
+        allowed, count = await self.eval_script(
+            r'sliding_window', (name,), (now, int(window * 1000), limit, f'{now}:{Utils.uuid1()}')
+        )
+
+        return allowed == 1, count
+
+    async def mget_obj(self, keys, *, serializer: Optional[Serializer] = None) -> dict:
+        """批量读取对象缓存，keys会经过get_safe_key处理，返回{key: value}，未命中的key不在结果中"""
+        if not keys:
+            return {}
+
+        metrics = self._pool.metrics
+        serializer = serializer or self._pool.serializer
+
+        begin_time = time.perf_counter()
+
+        values = await super().mget([self.get_safe_key(key) for key in keys])
+
+        metrics.observe(r'latency_seconds', time.perf_counter() - begin_time)
+
+        result = {key: serializer.loads(value) for key, value in zip(keys, values) if value}
+
+        metrics.hit(len(result))
+        metrics.miss(len(keys) - len(result))
+
+        return result
+
+    async def mset_obj(self, mapping: dict, ex=3600, *, ttls: Optional[dict] = None,
+                       serializer: Optional[Serializer] = None):
+        """批量写入对象缓存，在一个pipeline中完成，keys会经过get_safe_key处理
+        ttls: 按key指定有效期，未指定的key使用ex
+        """
+        if not mapping:
+            return []
+
+        serializer = serializer or self._pool.serializer
+        ttls = ttls or {}
+
+        begin_time = time.perf_counter()
+
+        async with self.pipeline(transaction=False) as pipeline:
+
+            for key, value in mapping.items():
+                pipeline.set(self.get_safe_key(key), serializer.dumps(value), ex=ttls.get(key, ex))
+
+            result = await pipeline.execute()
+
+        self._pool.metrics.observe(r'latency_seconds', time.perf_counter() - begin_time)
+
+        return result
+
+    async def delete_many(self, keys):
+        """批量删除缓存，keys会经过get_safe_key处理"""
+        if not keys:
+            return 0
+
+        return await super().delete(*[self.get_safe_key(key) for key in keys])
+
+    async def get_or_load_many(self, keys, loader, ex=3600, *, serializer: Optional[Serializer] = None) -> dict:
+        """批量读取对象缓存，只将未命中的key交给loader一次性加载，加载结果在一个pipeline中写回缓存
+        loader: loader(keys)，返回{key: value}字典或与keys顺序一致的列表，值为None时不写入缓存
+        返回{key: value}，无法加载的key值为None
+        """
+        result = await self.mget_obj(keys, serializer=serializer)
+
+        misses = [key for key in dict.fromkeys(keys) if key not in result]
+
+        if misses:
+
+            loaded = await Utils.awaitable_wrapper(loader(misses))
+
+            if not isinstance(loaded, dict):
+                loaded = dict(zip(misses, loaded))
+
+            loaded = {key: val for key, val in loaded.items() if val is not None}
+
+            await self.mset_obj(loaded, ex, serializer=serializer)
+
+            result.update(loaded)
+
+        return {key: result.get(key) for key in keys}
 
     @property
     def pool(self):
@@ -273,95 +755,1336 @@ class CacheClient(Redis, AsyncContextManager):
         return self.pubsub(**kwargs)
 
 
-class ShareCache(AsyncContextManager):
-    """共享缓存，使用with进行上下文管理
-
-    基于分布式锁实现的一个缓存共享逻辑，保证在分布式环境下，同一时刻业务逻辑只执行一次，其运行结果会通过缓存被共享
-    该共享缓存中的分布式锁采用阻塞式，阻塞时间取决于业务逻辑执行时间，默认为60秒
+class AutoPipeline:
+    """自动管道
+    同一轮事件循环中各协程发出的命令合并为一批写入共享连接，再按顺序将回复分发给各调用方
+    connections: 最多占用的连接数，每个连接同一时刻只有一批命令在途
+    max_batch_size: 单批命令的最大数量
     """
 
-    def __init__(self, redis_client, share_key, lock_expire=60, lock_blocking_timeout=60):
-        """
-        redis_client： CacheClient对象
-        share_key: 共享缓存key值
-        lock_expire: 分布式锁的生命周期
-        lock_blocking_timeout: 获取分布式锁的最大阻塞时间
-        """
+    def __init__(self, pool, connections=1, max_batch_size=1024):
 
-        self._redis_client = redis_client
-        self._share_key = redis_client.get_safe_key(share_key)
+        self._pool = pool
+        self._max_batch_size = max_batch_size
 
-        self._lock = self._redis_client.allocate_lock(
-            f'share_cache:{share_key}',
-            expire=lock_expire, blocking=True, blocking_timeout=lock_blocking_timeout
-        )
+        self._pending = deque()
+        self._idle = deque(None for _ in range(max(connections, 1)))
+        self._flush_handle = None
 
-        self.result = None
+        # 在途批次的任务及其命令，关闭时用于通知调用方
+        self._batches = {}
 
-    async def _context_release(self):
+        self._metrics = MetricsRegistry().get(f'{pool.metrics.name}:auto_pipeline')
 
-        await self.release()
+    @property
+    def metrics(self):
+        return self._metrics
 
-    async def get(self):
+    async def execute(self, client: Redis, *args, **options):
 
-        result = await self._redis_client.get_obj(self._share_key)
+        future = asyncio.get_running_loop().create_future()
 
-        if result is None:
+        self._pending.append((client, args, options, future))
 
-            if await self._lock.acquire():
-                result = await self._redis_client.get_obj(self._share_key)
+        if self._flush_handle is None:
+            self._flush_handle = Utils.call_soon(self._flush)
 
-        return result
+        return await future
 
-    async def set(self, value, expire=None):
+    def _flush(self):
 
-        return await self._redis_client.set_obj(self._share_key, value, expire)
+        self._flush_handle = None
 
-    async def delete(self):
-        """非必要不需进行手动删除"""
-        await self._redis_client.delete(self._share_key)
+        while self._pending and self._idle:
 
-    async def release(self):
+            batch = []
 
-        if self._lock:
-            await self._lock.release()
+            while self._pending and len(batch) < self._max_batch_size:
+                batch.append(self._pending.popleft())
 
-        await self._redis_client.close()
-        self._redis_client = self._lock = None
+            task = Utils.create_task(self._do_batch(self._idle.popleft(), batch))
 
+            self._batches[task] = batch
+            task.add_done_callback(self._batch_done)
 
-class PeriodCounter:
-    MIN_EXPIRE = 60
+    def _batch_done(self, task):
 
-    def __init__(self, redis_client, key_prefix, time_slice: int):
-        self._redis_client = redis_client
+        self._batches.pop(task, None)
 
-        self._key_prefix = key_prefix
-        self._time_slice = time_slice
+    async def _do_batch(self, connection, batch):
 
-    def _get_key(self) -> str:
-        timestamp = Utils.timestamp()
+        self._metrics.incr(r'batch_total')
+        self._metrics.observe(r'batch_size', len(batch))
 
-        time_period = Utils.math.floor(timestamp / self._time_slice)
+        try:
 
-        return self._redis_client.get_safe_key(f'{self._key_prefix}:{time_period}')
+            if connection is None:
+                connection = await self._pool.get_connection(r'_')
 
-    async def _execute(self, key: str, val: int) -> int:
-        res = None
+            await connection.send_packed_command(
+                connection.pack_commands(args for _, args, _, _ in batch)
+            )
 
-        async with self._redis_client as cache:
-            pipeline = cache.pipeline(transaction=False)
-            await pipeline.incrby(key, val)
-            await pipeline.expire(key, max(self._time_slice, self.MIN_EXPIRE))
-            res, _ = await pipeline.execute()
+            for index, (client, args, options, future) in enumerate(batch):
 
-        return res
+                try:
+                    result = await client.parse_response(connection, args[0], **options)
+                except (RedisConnectionError, RedisTimeoutError, asyncio.CancelledError, OSError):
+                    batch = batch[index:]
+                    raise
+                except Exception as err:
+                    if not future.done():
+                        future.set_exception(err)
+                else:
+                    if not future.done():
+                        future.set_result(result)
 
-    async def incr(self, val: int = 1):
-        return await self._execute(self._get_key(), val)
+        except BaseException as err:
 
-    async def decr(self, val: int = 1) -> int:
-        return await self._execute(self._get_key(), -val)
+            if connection is not None:
+                await connection.disconnect()
+
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(err)
+
+            if isinstance(err, asyncio.CancelledError):
+                raise
+
+        finally:
+
+            self._idle.append(connection)
+
+            if self._pending and self._flush_handle is None:
+                self._flush_handle = Utils.call_soon(self._flush)
 
     async def release(self):
-        await self._redis_client.close()
+        """将空闲连接归还连接池"""
+        connections = [conn for conn in self._idle if conn is not None]
+
+        self._idle = deque(None for _ in self._idle)
+
+        for connection in connections:
+            await self._pool.release(connection)
+
+    async def close(self):
+        """连接池断开时调用，待发送与在途命令的调用方收到ConnectionError，空闲连接归还连接池"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        err = RedisConnectionError(r'Auto pipeline closed')
+
+        batches = [self._pending, *self._batches.values()]
+        tasks = list(self._batches)
+
+        self._pending = deque()
+
+        for batch in batches:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(err)
+
+        for task in tasks:
+            task.cancel()
+
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        await self.release()
+
+
+class AutoPipelineClient(CacheClient):
+    """自动管道模式的Redis客户端
+    普通命令经由连接池共享的AutoPipeline批量发送，不独占连接
+    阻塞、订阅、事务等依赖连接状态的命令仍从连接池获取独立连接执行
+    """
+
+    SINGLE_CONNECTION = False
+
+    EXCLUDED_COMMANDS = frozenset({
+        r'BLPOP', r'BRPOP', r'BRPOPLPUSH', r'BLMOVE', r'BLMPOP', r'BZPOPMIN', r'BZPOPMAX', r'BZMPOP',
+        r'SUBSCRIBE', r'PSUBSCRIBE', r'SSUBSCRIBE', r'UNSUBSCRIBE', r'PUNSUBSCRIBE', r'SUNSUBSCRIBE',
+        r'MULTI', r'EXEC', r'DISCARD', r'WATCH', r'UNWATCH',
+        r'MONITOR', r'WAIT', r'SELECT', r'AUTH', r'HELLO', r'RESET', r'QUIT', r'CLIENT',
+    })
+
+    BLOCKING_OPTION_COMMANDS = frozenset({r'XREAD', r'XREADGROUP'})
+
+    def _is_excluded(self, args):
+
+        command = str(args[0]).split(r' ', 1)[0].upper()
+
+        if command in self.EXCLUDED_COMMANDS:
+            return True
+
+        if command in self.BLOCKING_OPTION_COMMANDS:
+            return any(isinstance(arg, (str, bytes)) and arg.upper() in (r'BLOCK', b'BLOCK') for arg in args)
+
+        return False
+
+    async def execute_command(self, *args, **options):
+
+        if self._is_excluded(args):
+            return await super().execute_command(*args, **options)
+        else:
+            return await self._pool.auto_pipeline.execute(self, *args, **options)
+
+
+class NearCache:
+    """Redis近端缓存
+    在进程内缓存最近读取的对象，由Redis推送的失效通知及时淘汰已变更的key
+    mode:
+        tracking: 客户端缓存追踪(CLIENT TRACKING BCAST)，需Redis 6+，不支持时自动降级为keyspace
+        keyspace: 键空间通知，需服务端开启notify-keyspace-events(至少包含K、g、$)，FLUSHDB不会产生通知
+    remarks:
+        1.只追踪连接池key_prefix下的key，其它key不会收到失效通知，读取时直接访问Redis不写入本地，
+          读取返回的对象为本地共享引用，请勿修改
+        2.通知连接断开期间会清空并停止写入本地缓存，重连成功后恢复
+    """
+
+    MODE_TRACKING = r'tracking'
+    MODE_KEYSPACE = r'keyspace'
+
+    INVALIDATE_CHANNEL = r'__redis__:invalidate'
+
+    def __init__(self, redis_pool, maxsize=1024, ttl=60, *, mode=MODE_TRACKING, name=None):
+
+        self._redis_pool = redis_pool
+        self._mode = mode
+
+        self._cache = StackCache(maxsize, ttl, name=name or f'near_cache:{redis_pool.metrics.name}')
+
+        self._version = 0
+        self._connection = None
+        self._listener = None
+        self._subscribed = False
+
+        self._key_prefix = r''
+
+    @property
+    def mode(self):
+        return self._mode
+
+    def is_tracked(self, name):
+        """key是否在失效通知的追踪范围内"""
+        if isinstance(name, bytes):
+            name = name.decode()
+
+        return name.startswith(self._key_prefix)
+
+    @property
+    def metrics(self) -> CacheMetrics:
+        return self._cache.metrics
+
+    @property
+    def hit_ratio(self):
+        return self._cache.metrics.hit_ratio
+
+    def size(self):
+        return self._cache.size()
+
+    async def open(self):
+
+        self._connection = await self._redis_pool.get_connection(r'_')
+
+        try:
+            await self._subscribe()
+        except ResponseError as err:
+            if self._mode != self.MODE_TRACKING:
+                raise
+            Utils.log.warning(f'near cache client tracking unsupported ({err}), fallback to keyspace notifications')
+            self._mode = self.MODE_KEYSPACE
+            await self._subscribe()
+
+        self._listener = Utils.create_task(self._listen())
+
+        return self
+
+    async def close(self):
+
+        self._subscribed = False
+
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+        if self._connection is not None:
+            await self._connection.disconnect()
+            await self._redis_pool.release(self._connection)
+            self._connection = None
+
+        self._cache.clear()
+
+    async def _execute(self, *args):
+
+        await self._connection.send_command(*args)
+
+        return await self._connection.read_response()
+
+    async def _subscribe(self):
+
+        key_prefix = self._key_prefix = f'{self._redis_pool.key_prefix}:' if self._redis_pool.key_prefix else r''
+
+        if self._mode == self.MODE_TRACKING:
+            client_id = await self._execute(r'CLIENT', r'ID')
+            await self._execute(
+                r'CLIENT', r'TRACKING', r'ON', r'REDIRECT', client_id, r'BCAST',
+                *([r'PREFIX', key_prefix] if key_prefix else [])
+            )
+            await self._execute(r'SUBSCRIBE', self.INVALIDATE_CHANNEL)
+        else:
+            db = self._redis_pool.connection_kwargs.get(r'db', 0)
+            await self._execute(r'PSUBSCRIBE', f'__keyspace@{db}__:{key_prefix}*')
+
+        self._subscribed = True
+
+    async def _listen(self):
+
+        while True:
+
+            try:
+
+                self._on_message(await self._connection.read_response())
+
+            except (RedisConnectionError, RedisTimeoutError, OSError):
+
+                self._subscribed = False
+                self._invalidate(None)
+
+                Utils.log.warning(r'near cache invalidation connection lost, trying again in 1 second')
+                await Utils.sleep(1)
+
+                with catch_error():
+                    await self._connection.disconnect()
+                    await self._subscribe()
+
+    def _on_message(self, message):
+
+        if not isinstance(message, list):
+            return
+
+        if message[0] == b'message':
+            # 追踪模式的数据为key列表，None表示整库失效
+            keys = message[2]
+            self._invalidate(None if keys is None else [key.decode() for key in keys])
+        elif message[0] == b'pmessage':
+            self._invalidate([message[2].decode().split(r'__:', 1)[1]])
+
+    def _invalidate(self, keys):
+
+        self._version += 1
+
+        if keys is None:
+            self._cache.clear()
+        else:
+            for key in keys:
+                if self._cache.has(key):
+                    self._cache.delete(key)
+
+    async def get_obj(self, name):
+        """读取对象缓存，本地未命中时从Redis读取并写入本地，不在追踪范围内的key直接从Redis读取"""
+        tracked = self.is_tracked(name)
+
+        result = self._cache.get(name) if tracked else None
+
+        if result is None:
+
+            # 读取期间收到任何失效通知时不写入本地，避免缓存旧值
+            version = self._version
+
+            cache = await self._redis_pool.get_client()
+
+            try:
+                result = await cache.get_obj(name)
+            finally:
+                await cache.release()
+
+            if tracked and self._subscribed and version == self._version:
+                self._cache.set(name, result)
+
+        return result
+
+    async def set_obj(self, name, value, ex=3600, nx=False, xx=False):
+
+        cache = await self._redis_pool.get_client()
+
+        try:
+            result = await cache.set_obj(name, value, ex, nx, xx)
+        finally:
+            await cache.release()
+
+        self._invalidate([name])
+
+        return result
+
+    async def delete(self, *names):
+
+        cache = await self._redis_pool.get_client()
+
+        try:
+            result = await cache.delete(*names)
+        finally:
+            await cache.release()
+
+        self._invalidate(names)
+
+        return result
+
+
+class ShardedNearCache:
+    """分片Redis近端缓存
+    每个节点对应一个NearCache，读写按key路由到所在节点，失效通知由各节点的连接分别接收
+    """
+
+    def __init__(self, delegate: ShardedRedisDelegate, maxsize=1024, ttl=60, *, mode=NearCache.MODE_TRACKING):
+
+        self._delegate = delegate
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._mode = mode
+
+        self._near_caches = {}
+
+    @property
+    def near_caches(self):
+        return dict(self._near_caches)
+
+    @property
+    def hit_ratio(self):
+
+        hits = sum(near_cache.metrics.get_counter(r'hits') for near_cache in self._near_caches.values())
+        total = hits + sum(near_cache.metrics.get_counter(r'misses') for near_cache in self._near_caches.values())
+
+        return hits / total if total else 0
+
+    def size(self):
+        return sum(near_cache.size() for near_cache in self._near_caches.values())
+
+    async def add_node(self, name, redis_pool):
+
+        if name not in self._near_caches:
+            self._near_caches[name] = await NearCache(redis_pool, self._maxsize, self._ttl, mode=self._mode).open()
+
+    async def remove_node(self, name):
+
+        near_cache = self._near_caches.pop(name, None)
+
+        if near_cache is not None:
+            await near_cache.close()
+
+    async def close(self):
+
+        near_caches, self._near_caches = self._near_caches, {}
+
+        for near_cache in near_caches.values():
+            await near_cache.close()
+
+    def get_near_cache(self, key) -> NearCache:
+        return self._near_caches[self._delegate.hash_ring.get_node(key)]
+
+    async def get_obj(self, name):
+        return await self.get_near_cache(name).get_obj(name)
+
+    async def set_obj(self, name, value, ex=3600, nx=False, xx=False):
+        return await self.get_near_cache(name).set_obj(name, value, ex, nx, xx)
+
+    async def delete(self, *names):
+
+        groups = {}
+
+        for name in names:
+            groups.setdefault(self.get_near_cache(name), []).append(name)
+
+        return sum(await asyncio.gather(*(near_cache.delete(*_names) for near_cache, _names in groups.items())))
+
+
+class FairLock:
+    """基于通知的公平分布式锁
+    等待者按到达顺序进入等待队列，并阻塞在各自的通知列表(BLPOP)上，持有者释放锁时立即唤醒队首等待者
+    每次阻塞不超过锁的剩余有效期，持有者异常退出未释放时，锁过期后队首等待者即可获得锁
+    等待者需每waiter_ttl内刷新一次存活时间，异常退出的等待者超时后会被移出队列
+
+    redis_client: CacheClient对象，阻塞等待使用连接池的独立等待连接(waiter_limit)，不占用业务连接，
+        同时等待的数量超过waiter_limit时改为每POLL_INTERVAL秒轮询，等待顺序仍由等待队列保证
+    name: 锁key值，需自行处理key前缀
+    expire: 锁的生命周期
+    """
+
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, redis_client, name, expire=60, *, blocking=True, blocking_timeout=None, waiter_ttl=10):
+
+        self._redis_client = redis_client
+        self._name = name
+
+        self._expire = expire
+        self._blocking = blocking
+        self._blocking_timeout = blocking_timeout
+        self._waiter_ttl = waiter_ttl
+
+        self._queue_key = f'{name}:queue'
+        self._waiter_key = f'{name}:waiters'
+        self._notify_prefix = f'{name}:notify:'
+
+        self._token = None
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def token(self):
+        return self._token
+
+    async def __aenter__(self):
+
+        if await self.acquire():
+            return self
+
+        raise LockError(r'Unable to acquire lock within the time specified')
+
+    async def __aexit__(self, exc_type, exc_value, _traceback):
+
+        await self.release()
+
+    async def _try_acquire(self, token, enqueue):
+
+        return await self._redis_client.eval_script(
+            r'fair_lock_acquire',
+            (self._name, self._queue_key, self._waiter_key),
+            (token, int(self._expire * 1000), int(self._waiter_ttl * 1000), 1 if enqueue else 0)
+        )
+
+    async def _leave(self, token):
+
+        await self._redis_client.eval_script(
+            r'fair_lock_leave',
+            (self._name, self._queue_key, self._waiter_key),
+            (token, self._notify_prefix, int(self._waiter_ttl * 1000))
+        )
+
+    async def acquire(self, blocking=None, blocking_timeout=None) -> bool:
+
+        blocking = self._blocking if blocking is None else blocking
+        blocking_timeout = self._blocking_timeout if blocking_timeout is None else blocking_timeout
+
+        token = Utils.uuid1()
+
+        result = await self._try_acquire(token, blocking)
+
+        if result[0] != 1 and blocking:
+
+            deadline = None if blocking_timeout is None else Utils.loop_time() + blocking_timeout
+
+            pool = self._redis_client.pool
+
+            waiter = None
+
+            if not pool.waiter_semaphore.locked():
+                await pool.waiter_semaphore.acquire()
+                waiter = pool.waiter_client
+
+            try:
+
+                while result[0] != 1:
+
+                    # 阻塞时间不超过锁的剩余有效期与存活刷新间隔
+                    timeout = self._waiter_ttl / 3
+
+                    if result[1] >= 0:
+                        timeout = min(timeout, result[1] / 1000)
+
+                    if deadline is not None:
+                        remaining = deadline - Utils.loop_time()
+                        if remaining <= 0:
+                            break
+                        timeout = min(timeout, remaining)
+
+                    if waiter is not None:
+                        await waiter.blpop(f'{self._notify_prefix}{token}', max(timeout, 0.01))
+                    else:
+                        await Utils.sleep(min(timeout, self.POLL_INTERVAL))
+
+                    result = await self._try_acquire(token, True)
+
+            finally:
+
+                if waiter is not None:
+                    pool.waiter_semaphore.release()
+
+                if result[0] != 1:
+                    await self._leave(token)
+
+        if result[0] == 1:
+            self._token = token
+            return True
+        else:
+            return False
+
+    async def release(self):
+
+        token, self._token = self._token, None
+
+        if token is None:
+            raise LockError(r'Cannot release an unlocked lock')
+
+        released = await self._redis_client.eval_script(
+            r'fair_lock_release',
+            (self._name, self._queue_key),
+            (token, self._notify_prefix, int(self._waiter_ttl * 1000))
+        )
+
+        if not released:
+            raise LockNotOwnedError(r'Cannot release a lock that\'s no longer owned')
+
+    async def extend(self, expire=None):
+        """重置锁的生命周期"""
+        if self._token is None:
+            raise LockError(r'Cannot extend an unlocked lock')
+
+        expire = self._expire if expire is None else expire
+
+        if not await self._redis_client.eval_script(
+                r'compare_and_expire', (self._name,), (self._token, int(expire * 1000))
+        ):
+            raise LockNotOwnedError(r'Cannot extend a lock that\'s no longer owned')
+
+        return True
+
+    async def locked(self) -> bool:
+        return await self._redis_client.exists(self._name) == 1
+
+    async def owned(self) -> bool:
+
+        if self._token is None:
+            return False
+
+        return await self._redis_client.get(self._name) == Utils.utf8(self._token)
+
+
+class ShardedCacheClient(CacheClient):
+    """分片Redis客户端
+    单key命令按key路由到对应节点，MGET/MSET/DEL/EXISTS等多key命令按节点拆分后并行执行再合并结果
+    其它多key命令(含XREAD/XREADGROUP的多个stream)与Lua脚本的key需通过{tag}分配到同一节点，分布在多个节点时抛出CROSSSLOT异常
+    无key命令及PUBLISH在第一个节点执行(与订阅所在节点一致)，FLUSHDB等命令在所有节点执行，
+    KEYS合并所有节点的结果，SCAN依次遍历各节点，返回的游标中编码了节点序号
+    """
+
+    SINGLE_CONNECTION = False
+
+    BROADCAST_COMMANDS = frozenset({r'FLUSHDB', r'FLUSHALL', r'SCRIPT LOAD', r'SCRIPT FLUSH'})
+
+    SUM_COMMANDS = frozenset({r'DEL', r'UNLINK', r'EXISTS', r'TOUCH'})
+
+    KEYLESS_COMMANDS = frozenset({
+        r'PUBLISH', r'PING', r'ECHO', r'INFO', r'TIME', r'LASTSAVE', r'RANDOMKEY', r'WAIT', r'SELECT', r'SWAPDB',
+    })
+
+    KEYLESS_PREFIXES = (r'CLIENT', r'CONFIG', r'PUBSUB', r'ACL', r'SLOWLOG', r'COMMAND')
+
+    # key不是第一个参数或有多个key的命令，值为key参数的切片范围
+    KEY_SLICES = {
+        r'OBJECT': (2, 3), r'BITOP': (2, None),
+        r'BLPOP': (1, -1), r'BRPOP': (1, -1), r'BZPOPMIN': (1, -1), r'BZPOPMAX': (1, -1),
+        r'SUNION': (1, None), r'SINTER': (1, None), r'SDIFF': (1, None),
+        r'SUNIONSTORE': (1, None), r'SINTERSTORE': (1, None), r'SDIFFSTORE': (1, None),
+        r'PFCOUNT': (1, None), r'PFMERGE': (1, None),
+        r'RENAME': (1, 3), r'RENAMENX': (1, 3), r'SMOVE': (1, 3), r'COPY': (1, 3),
+        r'RPOPLPUSH': (1, 3), r'BRPOPLPUSH': (1, 3), r'LMOVE': (1, 3), r'BLMOVE': (1, 3),
+        r'ZRANGESTORE': (1, 3), r'GEOSEARCHSTORE': (1, 3),
+    }
+
+    # 参数中指定key数量的命令，值为key数量参数的位置，key紧随其后
+    NUMKEYS_COMMANDS = {
+        r'EVAL': 2, r'EVALSHA': 2, r'EVAL_RO': 2, r'EVALSHA_RO': 2, r'FCALL': 2, r'FCALL_RO': 2,
+        r'ZUNION': 1, r'ZINTER': 1, r'ZDIFF': 1, r'ZINTERCARD': 1, r'SINTERCARD': 1, r'LMPOP': 1, r'ZMPOP': 1,
+        r'BLMPOP': 2, r'BZMPOP': 2, r'ZUNIONSTORE': 2, r'ZINTERSTORE': 2, r'ZDIFFSTORE': 2,
+    }
+
+    # 第一个参数为目标key的NUMKEYS_COMMANDS
+    STORE_COMMANDS = frozenset({r'ZUNIONSTORE', r'ZINTERSTORE', r'ZDIFFSTORE'})
+
+    def __init__(self, delegate: ShardedRedisDelegate, *args, **kwargs):
+
+        super().__init__(delegate.redis_pool, *args, **kwargs)
+
+        self._delegate = delegate
+        self._shards = {}
+
+    def get_shard(self, key=None) -> CacheClient:
+        """获取key所在节点的客户端，key为空时返回第一个节点的客户端"""
+        return self.get_shard_by_pool(self._pool if key is None else self._delegate.get_node_pool(key))
+
+    def get_shard_by_pool(self, pool) -> CacheClient:
+
+        client = self._shards.get(pool)
+
+        if client is None:
+            client = self._shards[pool] = CacheClient(pool)
+
+        return client
+
+    @classmethod
+    def _command_keys(cls, args):
+        """解析命令参数中的全部key"""
+        command = str(args[0]).upper()
+
+        if command in cls.KEYLESS_COMMANDS or command.startswith(cls.KEYLESS_PREFIXES):
+            return ()
+
+        if command in (r'XREAD', r'XREADGROUP'):
+            # STREAMS之后依次为全部key与全部id，XREADGROUP跳过GROUP group consumer
+            for index in range(4 if command == r'XREADGROUP' else 1, len(args)):
+                if isinstance(args[index], (str, bytes)) and args[index].upper() in (r'STREAMS', b'STREAMS'):
+                    streams = args[index + 1:]
+                    return streams[:len(streams) // 2]
+            return ()
+
+        if command in cls.NUMKEYS_COMMANDS:
+            index = cls.NUMKEYS_COMMANDS[command]
+            keys = args[index + 1:index + 1 + int(args[index])]
+            return (args[1], *keys) if command in cls.STORE_COMMANDS else keys
+
+        if command in cls.KEY_SLICES:
+            begin, end = cls.KEY_SLICES[command]
+            return args[begin:end]
+
+        return args[1:2]
+
+    def _route_key(self, args):
+        """获取命令路由的key，多个key不在同一节点时抛出异常"""
+        keys = self._command_keys(args)
+
+        if not keys:
+            return None
+
+        if len(keys) > 1:
+            pool = self._delegate.get_node_pool(keys[0])
+
+            if any(self._delegate.get_node_pool(key) is not pool for key in keys[1:]):
+                raise ResponseError(f'CROSSSLOT Keys in request don\'t hash to the same node: {args[0]}')
+
+        return keys[0]
+
+    def _node_pools(self):
+        """按节点名称排序的连接池，SCAN按该顺序遍历"""
+        pools = self._delegate.redis_pools
+
+        return [pools[name] for name in sorted(pools)]
+
+    async def _scan(self, cursor, *args, **options):
+
+        pools = self._node_pools()
+
+        index, node_cursor = int(cursor) % len(pools), int(cursor) // len(pools)
+
+        node_cursor, keys = await self.get_shard_by_pool(pools[index]).execute_command(
+            r'SCAN', node_cursor, *args, **options
+        )
+
+        if node_cursor:
+            cursor = node_cursor * len(pools) + index
+        elif index + 1 < len(pools):
+            cursor = index + 1
+        else:
+            cursor = 0
+
+        return cursor, keys
+
+    def _group_keys(self, keys):
+
+        groups = {}
+
+        for index, key in enumerate(keys):
+            groups.setdefault(self.get_shard(key), []).append(index)
+
+        return groups
+
+    async def execute_command(self, *args, **options):
+
+        command = str(args[0]).upper()
+
+        if command in self.BROADCAST_COMMANDS:
+
+            results = await asyncio.gather(*(
+                self.get_shard_by_pool(pool).execute_command(*args, **options)
+                for pool in self._delegate.redis_pools.values()
+            ))
+
+            return results[0]
+
+        if command == r'SCRIPT EXISTS':
+
+            results = await asyncio.gather(*(
+                self.get_shard_by_pool(pool).execute_command(*args, **options)
+                for pool in self._delegate.redis_pools.values()
+            ))
+
+            return [all(items) for items in zip(*results)]
+
+        if command == r'KEYS':
+
+            results = await asyncio.gather(*(
+                self.get_shard_by_pool(pool).execute_command(*args, **options)
+                for pool in self._delegate.redis_pools.values()
+            ))
+
+            return [key for keys in results for key in keys]
+
+        if command == r'SCAN':
+
+            return await self._scan(*args[1:], **options)
+
+        if command == r'DBSIZE':
+
+            return sum(await asyncio.gather(*(
+                self.get_shard_by_pool(pool).execute_command(*args, **options)
+                for pool in self._delegate.redis_pools.values()
+            )))
+
+        if command == r'MGET' or command in self.SUM_COMMANDS:
+
+            keys = args[1:]
+            groups = self._group_keys(keys)
+
+            if len(groups) == 1:
+                return await next(iter(groups)).execute_command(*args, **options)
+
+            indexes = list(groups.values())
+
+            results = await asyncio.gather(*(
+                shard.execute_command(command, *(keys[index] for index in _indexes), **options)
+                for shard, _indexes in groups.items()
+            ))
+
+            if command in self.SUM_COMMANDS:
+                return sum(results)
+
+            values = [None] * len(keys)
+
+            for _indexes, _values in zip(indexes, results):
+                for index, value in zip(_indexes, _values):
+                    values[index] = value
+
+            return values
+
+        if command == r'MSET':
+
+            pairs = list(zip(args[1::2], args[2::2]))
+            groups = self._group_keys([key for key, _ in pairs])
+
+            results = await asyncio.gather(*(
+                shard.execute_command(
+                    command, *(item for index in _indexes for item in pairs[index]), **options
+                )
+                for shard, _indexes in groups.items()
+            ))
+
+            return all(results)
+
+        return await self.get_shard(self._route_key(args)).execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return ShardedPipeline(self, transaction)
+
+    def allocate_fair_lock(self, key, expire=60, *, blocking=True, blocking_timeout=None, waiter_ttl=10):
+        """公平锁的等待连接需与锁在同一节点，由所在节点的客户端创建"""
+        return self.get_shard(self.get_safe_key(key)).allocate_fair_lock(
+            key, expire, blocking=blocking, blocking_timeout=blocking_timeout, waiter_ttl=waiter_ttl
+        )
+
+    async def close(self, close_connection_pool=None):
+        """释放各节点客户端占用的连接，async with退出时由Redis.__aexit__调用"""
+        shards, self._shards = self._shards, {}
+
+        for client in shards.values():
+            await client.close()
+
+        await super().close(close_connection_pool)
+
+
+class ShardedPipeline(AsyncCoreCommands):
+    """分片管道
+    命令按key分组到各节点的管道中并行执行，结果按命令顺序返回
+    transaction为True时只保证同一节点内的命令在同一事务中执行
+    """
+
+    def __init__(self, client: ShardedCacheClient, transaction=True):
+
+        self._client = client
+        self._transaction = transaction
+        self._commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, _traceback):
+        self.reset()
+
+    def __await__(self):
+        return self._self().__await__()
+
+    async def _self(self):
+        return self
+
+    def __len__(self):
+        return len(self._commands)
+
+    def reset(self):
+        self._commands = []
+
+    def execute_command(self, *args, **options):
+
+        self._commands.append((args, options))
+
+        return self
+
+    async def _execute_shard(self, shard, commands, raise_on_error):
+
+        async with shard.pipeline(self._transaction) as pipeline:
+
+            for args, options in commands:
+                pipeline.execute_command(*args, **options)
+
+            return await pipeline.execute(raise_on_error)
+
+    async def execute(self, raise_on_error=True):
+
+        commands, self._commands = self._commands, []
+
+        groups = {}
+
+        for index, (args, options) in enumerate(commands):
+            shard = self._client.get_shard(self._client._route_key(args))
+            groups.setdefault(shard, []).append(index)
+
+        results = await asyncio.gather(*(
+            self._execute_shard(shard, [commands[index] for index in indexes], raise_on_error)
+            for shard, indexes in groups.items()
+        ))
+
+        values = [None] * len(commands)
+
+        for indexes, _values in zip(groups.values(), results):
+            for index, value in zip(indexes, _values):
+                values[index] = value
+
+        return values
+
+
+class ShareCache(AsyncContextManager):
+    """共享缓存，使用with进行上下文管理
+
+    基于分布式锁实现的一个缓存共享逻辑，保证在分布式环境下，同一时刻业务逻辑只执行一次，其运行结果会通过缓存被共享
+    该共享缓存中的分布式锁采用阻塞式，阻塞时间取决于业务逻辑执行时间，默认为60秒
+
+    xfetch_beta大于0时开启提前重算模式(XFetch):
+        缓存值与计算耗时、逻辑过期时间一起保存，redis中的有效期为逻辑过期时间再延长stale_ttl
+        临近逻辑过期时，get以随剩余时间减少而升高的概率返回None，并以非阻塞方式获取锁，获得锁的调用方负责重算并set
+        其余调用方在新值写入前继续获得旧值，只有缓存完全不存在时才会阻塞在锁上
+        xfetch_beta越大越倾向于提前重算，通常取1
+    """
+
+    def __init__(self, redis_client, share_key, lock_expire=60, lock_blocking_timeout=60, *,
+                 xfetch_beta=0, stale_ttl=None):
+        """
+        redis_client： CacheClient对象
+        share_key: 共享缓存key值
+        lock_expire: 分布式锁的生命周期
+        lock_blocking_timeout: 获取分布式锁的最大阻塞时间
+        xfetch_beta: 提前重算系数，为0时不开启
+        stale_ttl: 逻辑过期后旧值的保留时间，为空时与set的expire相同
+        """
+
+        self._redis_client = redis_client
+        self._share_key = redis_client.get_safe_key(share_key)
+
+        self._lock = self._redis_client.allocate_lock(
+            f'share_cache:{share_key}',
+            expire=lock_expire, blocking=True, blocking_timeout=lock_blocking_timeout
+        )
+
+        self._xfetch_beta = xfetch_beta
+        self._stale_ttl = stale_ttl
+        self._compute_begin = None
+
+        self.result = None
+
+    async def _context_release(self):
+
+        await self.release()
+
+    async def get(self):
+
+        if self._xfetch_beta > 0:
+            return await self._xfetch_get()
+
+        result = await self._redis_client.get_obj(self._share_key)
+
+        if result is None:
+
+            if await self._lock.acquire():
+                result = await self._redis_client.get_obj(self._share_key)
+
+        return result
+
+    async def _xfetch_get(self):
+
+        envelope = await self._redis_client.get_obj(self._share_key)
+
+        if envelope is None:
+
+            if await self._lock.acquire():
+                envelope = await self._redis_client.get_obj(self._share_key)
+
+            if envelope is None:
+                self._compute_begin = time.time()
+                return None
+
+        elif envelope[r'expiry'] is not None:
+
+            # 提前量为计算耗时*beta*(-ln(rand))，越接近过期越可能触发重算
+            early = envelope[r'delta'] * self._xfetch_beta * -math.log(1 - random.random())
+
+            if time.time() + early >= envelope[r'expiry'] and await self._lock.acquire(blocking=False):
+                self._compute_begin = time.time()
+                return None
+
+        return envelope[r'value']
+
+    async def set(self, value, expire=None):
+
+        if self._xfetch_beta <= 0:
+            return await self._redis_client.set_obj(self._share_key, value, expire)
+
+        now = time.time()
+
+        envelope = {
+            r'value': value,
+            r'delta': now - self._compute_begin if self._compute_begin is not None else 0,
+            r'expiry': now + expire if expire else None,
+        }
+
+        if expire:
+            expire += expire if self._stale_ttl is None else self._stale_ttl
+
+        return await self._redis_client.set_obj(self._share_key, envelope, expire)
+
+    async def delete(self):
+        """非必要不需进行手动删除"""
+        await self._redis_client.delete(self._share_key)
+
+    async def release(self):
+
+        if self._lock and self._lock.local.token is not None:
+            await self._lock.release()
+
+        await self._redis_client.close()
+        self._redis_client = self._lock = None
+
+
+class PeriodCounter:
+    MIN_EXPIRE = 60
+
+    def __init__(self, redis_client, key_prefix, time_slice: int):
+        self._redis_client = redis_client
+
+        self._key_prefix = key_prefix
+        self._time_slice = time_slice
+
+    def _get_key(self) -> str:
+        timestamp = Utils.timestamp()
+
+        time_period = Utils.math.floor(timestamp / self._time_slice)
+
+        return self._redis_client.get_safe_key(f'{self._key_prefix}:{time_period}')
+
+    async def _execute(self, key: str, val: int) -> int:
+        res = None
+
+        async with self._redis_client as cache:
+            res = await cache.incr_with_expire(key, val, max(self._time_slice, self.MIN_EXPIRE))
+
+        return res
+
+    async def incr(self, val: int = 1):
+        return await self._execute(self._get_key(), val)
+
+    async def decr(self, val: int = 1) -> int:
+        return await self._execute(self._get_key(), -val)
+
+    async def release(self):
+        await self._redis_client.close()
+
+
+class BufferedPeriodCounter(PeriodCounter):
+    """本地预聚合的周期计数器
+    incr/decr只在本地按时间片key累加，每flush_interval秒或每flush_count次增量通过一个pipeline写入redis
+    remarks:
+        1.incr/decr及value返回本地估算值: 最近一次写入后redis返回的值 + 写入中与待写入的增量
+        2.在第一次写入完成前估算值不包含其他进程的计数，需要精确值时先调用flush
+        3.写入失败的增量会合并回本地等待下一次写入
+        4.写入过程串行执行，避免较早返回的远端值覆盖较新的远端值
+    """
+
+    def __init__(self, redis_client, key_prefix, time_slice: int, *, flush_interval=1, flush_count=1000):
+
+        super().__init__(redis_client, key_prefix, time_slice)
+
+        self._pending = {}
+        self._flushing = {}
+        self._remote = {}
+
+        self._flush_lock = asyncio.Lock()
+
+        self._buffer = QueueBuffer(
+            self._flush, flush_count,
+            timeout=flush_interval, task_limit=1, data_limit=flush_count
+        )
+        self._buffer.start()
+
+    def _value(self, key) -> int:
+        return self._remote.get(key, 0) + self._flushing.get(key, 0) + self._pending.get(key, 0)
+
+    async def _execute(self, key: str, val: int) -> int:
+
+        self._pending[key] = self._pending.get(key, 0) + val
+        self._buffer.append(key)
+
+        return self._value(key)
+
+    async def _flush(self, _=None):
+
+        async with self._flush_lock:
+            await self._flush_pending()
+
+    async def _flush_pending(self):
+
+        if not self._pending:
+            return
+
+        deltas, self._pending = self._pending, {}
+
+        for key, val in deltas.items():
+            self._flushing[key] = self._flushing.get(key, 0) + val
+
+        results = None
+        expire = max(self._time_slice, self.MIN_EXPIRE)
+
+        try:
+
+            async with self._redis_client as cache:
+                pipeline = cache.pipeline(transaction=False)
+
+                for key, val in deltas.items():
+                    pipeline.incrby(key, val)
+                    pipeline.expire(key, expire)
+
+                results = await pipeline.execute()
+
+        except Exception as err:
+
+            Utils.log.error(f'BufferedPeriodCounter flush error: {err}')
+
+        for key, val in deltas.items():
+            self._flushing[key] -= val
+            if not self._flushing[key]:
+                del self._flushing[key]
+
+        if results is None:
+            for key, val in deltas.items():
+                self._pending[key] = self._pending.get(key, 0) + val
+        else:
+            # 只保留本次写入的时间片，过期时间片的远端值不再需要
+            self._remote = dict(zip(deltas.keys(), results[::2]))
+
+    def value(self) -> int:
+        """当前时间片的本地估算值"""
+        return self._value(self._get_key())
+
+    def pending(self) -> int:
+        """当前时间片尚未写入redis的增量"""
+        key = self._get_key()
+
+        return self._flushing.get(key, 0) + self._pending.get(key, 0)
+
+    async def flush(self):
+        """立即将本地增量写入redis"""
+        await self._flush()
+
+    async def release(self):
+
+        await self._buffer.stop()
+
+        await self._flush()
+
+        await super().release()
+
+
+class RedisFuncCache(FuncCache):
+    """二级函数缓存
+
+    进程内的堆栈缓存(L1)叠加redis缓存(L2)，L1未命中时读取L2，L2未命中时通过分布式锁保证同一时刻只有一个进程执行函数
+    同一进程内的并发未命中会共享同一次加载，调用被装饰函数的invalidate方法会删除L2缓存，
+    并通过bind_event_dispatcher绑定的分布式事件总线通知所有进程清理L1缓存
+
+    redis_delegate: RedisDelegate对象，调用时才获取连接池，可在连接池初始化前进行装饰，连接池未初始化时只使用L1缓存
+    ttl: L1缓存有效期
+    redis_ttl: L2缓存有效期
+    name: 指标名称，透传给FuncCache
+    """
+
+    INVALIDATE_EVENT = r'redis_func_cache_invalidate'
+
+    _instances = weakref.WeakSet()
+    _event_dispatcher = None
+
+    def __init__(self, redis_delegate, maxsize=0xff, ttl=10, redis_ttl=60,
+                 includes: Optional[List[str]] = None,
+                 excludes: Optional[List[str]] = None,
+                 *, key_builder: Optional[KeyBuilder] = None, key_func=None,
+                 stale_ttl=0, refresh_ahead=0, refresh_hits=2, max_weight=0, weigher=None, ttl_jitter=0, name=None,
+                 lock_expire=60, lock_blocking_timeout=60
+                 ):
+
+        # 不同进程中函数对象地址不同，默认使用基于函数全名的摘要保证L2缓存的key值一致
+        super().__init__(
+            maxsize, ttl, includes, excludes,
+            key_builder=key_builder if key_builder is not None else DigestKeyBuilder(), key_func=key_func,
+            stale_ttl=stale_ttl, refresh_ahead=refresh_ahead, refresh_hits=refresh_hits,
+            max_weight=max_weight, weigher=weigher, ttl_jitter=ttl_jitter, name=name
+        )
+
+        self._redis_delegate = redis_delegate
+        self._redis_ttl = redis_ttl
+
+        self._lock_expire = lock_expire
+        self._lock_blocking_timeout = lock_blocking_timeout
+
+        self._loading = {}
+
+        self._instances.add(self)
+
+    @classmethod
+    def bind_event_dispatcher(cls, event_dispatcher):
+        """绑定分布式事件总线，所有实例共用一个监听器
+        """
+
+        if cls._event_dispatcher is not None:
+            cls._event_dispatcher.remove_listener(cls.INVALIDATE_EVENT, cls._event_invalidate)
+
+        cls._event_dispatcher = event_dispatcher
+
+        if event_dispatcher is not None:
+            event_dispatcher.add_listener(cls.INVALIDATE_EVENT, cls._event_invalidate)
+
+    @classmethod
+    def _event_invalidate(cls, func_sign):
+
+        for inst in cls._instances:
+            inst._local_invalidate(func_sign)
+
+    def _local_invalidate(self, func_sign):
+
+        if self._cache.has(func_sign):
+            self._cache.delete(func_sign)
+
+    async def _load(self, func_sign, func, args, kwargs):
+
+        future = self._loading.get(func_sign)
+
+        if future is None:
+
+            future = self._loading[func_sign] = Utils.create_task(
+                self._load_from_redis(func_sign, func, args, kwargs)
+            )
+
+            future.add_done_callback(
+                Utils.func_partial(self._clear_loading, func_sign)
+            )
+
+        return await asyncio.shield(future)
+
+    def _clear_loading(self, func_sign, _):
+
+        self._loading.pop(func_sign, None)
+
+    async def _load_from_redis(self, func_sign, func, args, kwargs):
+
+        cache = await self._redis_delegate.get_cache_client()
+
+        if cache is None:
+            return await super()._load(func_sign, func, args, kwargs)
+
+        try:
+
+            cache_key = self._redis_key(cache, func_sign)
+
+            result = await cache.get_obj(cache_key)
+
+            if result is None:
+
+                lock = cache.allocate_lock(
+                    f'func_cache_lock:{func_sign}',
+                    expire=self._lock_expire, blocking=True, blocking_timeout=self._lock_blocking_timeout
+                )
+
+                locked = await lock.acquire()
+
+                try:
+
+                    # 等待锁期间其它进程可能已经写入缓存
+                    if locked:
+                        result = await cache.get_obj(cache_key)
+
+                    if result is None:
+
+                        result = await super()._load(func_sign, func, args, kwargs)
+
+                        if result is not None:
+                            await cache.set_obj(cache_key, result, self._redis_ttl)
+
+                finally:
+
+                    if locked:
+                        await lock.release()
+
+        finally:
+
+            await cache.release()
+
+        return result
+
+    @staticmethod
+    def _redis_key(cache, func_sign):
+
+        return cache.get_safe_key(f'func_cache:{func_sign}')
+
+    async def _invalidate(self, func_sign):
+
+        self._local_invalidate(func_sign)
+
+        cache = await self._redis_delegate.get_cache_client()
+
+        if cache is not None:
+            try:
+                await cache.delete(self._redis_key(cache, func_sign))
+            finally:
+                await cache.release()
+
+        if self._event_dispatcher is not None:
+            await self._event_dispatcher.dispatch(self.INVALIDATE_EVENT, func_sign)
+
+    def __call__(self, func):
+
+        _wrapper = super().__call__(func)
+
+        async def _invalidate(*args, **kwargs):
+            await self._invalidate(
+                self._get_func_sign(func, *args, **kwargs)
+            )
+
+        _wrapper.invalidate = _invalidate
+
+        return _wrapper
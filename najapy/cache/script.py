@@ -0,0 +1,222 @@
+from redis.exceptions import NoScriptError
+
+from najapy.common.async_base import Utils
+
+
+class LuaScript:
+    """Lua脚本
+    sha在本地计算，与SCRIPT LOAD返回值一致
+    """
+
+    def __init__(self, name, source):
+
+        self._name = name
+        self._source = source
+        self._sha = Utils.sha1(source)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def source(self):
+        return self._source
+
+    @property
+    def sha(self):
+        return self._sha
+
+
+# KEYS[1]: 计数key ARGV[1]: 增量 ARGV[2]: 有效期(秒)，小于等于0时不设置
+INCR_WITH_EXPIRE = LuaScript(
+    r'incr_with_expire',
+    r'''
+local val = redis.call('INCRBY', KEYS[1], ARGV[1])
+if tonumber(ARGV[2]) > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return val
+'''
+)
+
+# KEYS[1]: key ARGV[1]: 期望值，相等时才删除
+COMPARE_AND_DELETE = LuaScript(
+    r'compare_and_delete',
+    r'''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+'''
+)
+
+# KEYS[1]: 数据key KEYS[2]: 锁key ARGV[1]: 锁标识 ARGV[2]: 锁有效期(毫秒)
+# 返回: {0, 数据} 命中 {1} 未命中且获得锁 {2} 未命中且锁被占用
+GET_OR_LOCK = LuaScript(
+    r'get_or_lock',
+    r'''
+local val = redis.call('GET', KEYS[1])
+if val then
+    return {0, val}
+end
+if redis.call('SET', KEYS[2], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return {1}
+end
+return {2}
+'''
+)
+
+# KEYS[1]: 窗口zset ARGV[1]: 当前时间(毫秒) ARGV[2]: 窗口长度(毫秒) ARGV[3]: 窗口内上限 ARGV[4]: 本次请求标识
+# 返回: {1, 计数} 通过 {0, 计数} 超限
+SLIDING_WINDOW = LuaScript(
+    r'sliding_window',
+    r'''
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local count = redis.call('ZCARD', KEYS[1])
+if count < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], now, ARGV[4])
+    redis.call('PEXPIRE', KEYS[1], window)
+    return {1, count + 1}
+end
+return {0, count}
+'''
+)
+
+# KEYS[1]: key ARGV[1]: 期望值 ARGV[2]: 有效期(毫秒)，相等时才设置有效期
+COMPARE_AND_EXPIRE = LuaScript(
+    r'compare_and_expire',
+    r'''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+'''
+)
+
+# KEYS[1]: 锁key KEYS[2]: 等待队列zset(入队时间) KEYS[3]: 等待者存活zset(截止时间)
+# ARGV[1]: 锁标识 ARGV[2]: 锁有效期(毫秒) ARGV[3]: 等待者存活时间(毫秒) ARGV[4]: 未获得锁时是否入队(1/0)
+# 返回: {1} 获得锁 {0, 锁剩余有效期(毫秒)，锁空闲但未轮到时为-2}
+FAIR_LOCK_ACQUIRE = LuaScript(
+    r'fair_lock_acquire',
+    r'''
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local stale = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now)
+for _, token in ipairs(stale) do
+    redis.call('ZREM', KEYS[2], token)
+    redis.call('ZREM', KEYS[3], token)
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    local head = redis.call('ZRANGE', KEYS[2], 0, 0)
+    if #head == 0 or head[1] == ARGV[1] then
+        redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+        redis.call('ZREM', KEYS[2], ARGV[1])
+        redis.call('ZREM', KEYS[3], ARGV[1])
+        return {1}
+    end
+end
+if ARGV[4] == '1' then
+    if not redis.call('ZSCORE', KEYS[2], ARGV[1]) then
+        redis.call('ZADD', KEYS[2], tonumber(time[1]) * 1000000 + tonumber(time[2]), ARGV[1])
+    end
+    redis.call('ZADD', KEYS[3], now + tonumber(ARGV[3]), ARGV[1])
+    redis.call('PEXPIRE', KEYS[2], ARGV[3])
+    redis.call('PEXPIRE', KEYS[3], ARGV[3])
+end
+return {0, redis.call('PTTL', KEYS[1])}
+'''
+)
+
+# KEYS[1]: 锁key KEYS[2]: 等待队列zset ARGV[1]: 锁标识 ARGV[2]: 通知key前缀 ARGV[3]: 通知有效期(毫秒)
+# 持有者释放锁并通知队首等待者，返回是否释放成功
+FAIR_LOCK_RELEASE = LuaScript(
+    r'fair_lock_release',
+    r'''
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+local head = redis.call('ZRANGE', KEYS[2], 0, 0)
+if #head > 0 then
+    redis.call('RPUSH', ARGV[2] .. head[1], 1)
+    redis.call('PEXPIRE', ARGV[2] .. head[1], ARGV[3])
+end
+return 1
+'''
+)
+
+# KEYS[1]: 锁key KEYS[2]: 等待队列zset KEYS[3]: 等待者存活zset ARGV[1]: 锁标识 ARGV[2]: 通知key前缀 ARGV[3]: 通知有效期(毫秒)
+# 等待者放弃等待时离开队列，锁空闲时将通知转交给新的队首
+FAIR_LOCK_LEAVE = LuaScript(
+    r'fair_lock_leave',
+    r'''
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('DEL', ARGV[2] .. ARGV[1])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    local head = redis.call('ZRANGE', KEYS[2], 0, 0)
+    if #head > 0 then
+        redis.call('RPUSH', ARGV[2] .. head[1], 1)
+        redis.call('PEXPIRE', ARGV[2] .. head[1], ARGV[3])
+    end
+end
+return 1
+'''
+)
+
+BUILTIN_SCRIPTS = (
+    INCR_WITH_EXPIRE, COMPARE_AND_DELETE, COMPARE_AND_EXPIRE, GET_OR_LOCK, SLIDING_WINDOW,
+    FAIR_LOCK_ACQUIRE, FAIR_LOCK_RELEASE, FAIR_LOCK_LEAVE,
+)
+
+
+class ScriptRegistry:
+    """Lua脚本注册表
+    脚本声明一次，连接池初始化时通过SCRIPT LOAD预加载，执行时使用EVALSHA，
+    服务端脚本缓存丢失(NOSCRIPT)时重新加载并重试一次
+    """
+
+    def __init__(self):
+
+        self._scripts = {}
+
+        for script in BUILTIN_SCRIPTS:
+            self.register(script)
+
+    def register(self, script: LuaScript):
+
+        self._scripts[script.name] = script
+
+        return script
+
+    def get(self, name) -> LuaScript:
+
+        script = self._scripts.get(name)
+
+        if script is None:
+            raise KeyError(f'Unknown lua script: {name}')
+
+        return script
+
+    def __contains__(self, name):
+        return name in self._scripts
+
+    def __iter__(self):
+        return iter(self._scripts.values())
+
+    async def load(self, client):
+        """将全部脚本加载到服务端"""
+        for script in self._scripts.values():
+            await client.script_load(script.source)
+
+    async def execute(self, client, name, keys=(), args=()):
+
+        script = self.get(name)
+
+        try:
+            return await client.evalsha(script.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            await client.script_load(script.source)
+            return await client.evalsha(script.sha, len(keys), *keys, *args)
@@ -0,0 +1,387 @@
+"""跨进程共享内存缓存"""
+import fcntl
+import hashlib
+import os
+import pickle
+import struct
+import tempfile
+import time
+
+from najapy.common.base import ContextManager
+from najapy.common.metrics import MetricsRegistry
+from najapy.common.process import SharedByteArray
+
+
+class SharedMemoryCache(ContextManager):
+    """共享内存缓存
+
+    同一主机上的所有进程共用一块共享内存，适合存放枚举表、配置、租户映射等读多写少的数据
+    内存由固定数量的槽位(开放寻址哈希表)与一个环形数据区组成，数据区写满后从头覆盖，被覆盖的缓存项自动失效
+    读操作无锁，通过槽位的序列号(seqlock)与数据区写入位置校验读取结果，写操作通过文件锁在进程间互斥
+    共享内存创建后不随进程退出而删除(创建与连接的进程均不向resource_tracker登记)，需要时调用destroy删除
+    get读取时会反序列化出新的对象，set_bytes写入的原始字节可通过get_view零拷贝读取
+
+    name: 共享内存名称，同名的缓存共享数据
+    slot_count: 槽位数量，即最大缓存项数量
+    arena_size: 数据区字节数，单个缓存项(key+value)不能超过该值
+    probe: 冲突探测长度，探测范围内没有空闲槽位时淘汰其中最旧的缓存项
+    """
+
+    _MAGIC = b'NJSC'
+    _VERSION = 1
+
+    # magic, version, slot_count, probe, arena_size, arena_head
+    _HEADER = struct.Struct(r'=4sIIIQQ')
+    _HEADER_SIZE = 64
+
+    # seq, key_len, key_hash, offset, value_len, flags, expire
+    _SLOT = struct.Struct(r'=IIQQIId')
+    _HEAD = struct.Struct(r'=Q')
+    _SEQ = struct.Struct(r'=I')
+
+    _RETRY_TIMES = 3
+
+    # 值为原始字节，未经过pickle序列化
+    _FLAG_RAW = 1
+
+    def __init__(self, name, slot_count=4096, arena_size=0x1000000, probe=8, *, metrics_name=None):
+
+        self._name = name
+
+        self._lock_fd = os.open(
+            os.path.join(self._lock_dir(), f'najapy_shm_{name}.lock'),
+            os.O_RDWR | os.O_CREAT, 0o600
+        )
+
+        with self._write_lock():
+
+            size = self._HEADER_SIZE + self._SLOT.size * slot_count + arena_size
+
+            try:
+                self._byte_array = SharedByteArray(name, True, size)
+            except FileExistsError:
+                self._byte_array = SharedByteArray(name)
+
+            # 共享内存由主机上的所有进程共用，创建或连接的进程退出时均不能删除
+            self._byte_array.detach()
+
+            self._buf = self._byte_array.buf
+
+            magic, version, _slot_count, _probe, _arena_size, _ = self._HEADER.unpack_from(self._buf, 0)
+
+            if magic != self._MAGIC or version != self._VERSION:
+                self._buf[:size] = bytes(size)
+                self._HEADER.pack_into(self._buf, 0, self._MAGIC, self._VERSION, slot_count, probe, arena_size, 0)
+            else:
+                slot_count, probe, arena_size = _slot_count, _probe, _arena_size
+
+        self._slot_count = slot_count
+        self._probe = min(probe, slot_count)
+        self._arena_size = arena_size
+
+        self._slot_offset = self._HEADER_SIZE
+        self._arena_offset = self._HEADER_SIZE + self._SLOT.size * slot_count
+
+        self._head_offset = self._HEADER.size - self._HEAD.size
+
+        self._metrics = None
+
+        if metrics_name is not None:
+            self._metrics = MetricsRegistry().cache_metrics(metrics_name)
+            self._metrics.bind_size(self.size)
+
+    @staticmethod
+    def _lock_dir():
+
+        return r'/dev/shm' if os.path.isdir(r'/dev/shm') else tempfile.gettempdir()
+
+    def _context_release(self):
+
+        self.release()
+
+    def _write_lock(self):
+
+        return _FileLock(self._lock_fd)
+
+    @staticmethod
+    def _encode_key(key):
+
+        return key if isinstance(key, bytes) else str(key).encode(r'utf-8')
+
+    @staticmethod
+    def _hash_key(key_bytes):
+
+        return int.from_bytes(hashlib.blake2b(key_bytes, digest_size=8).digest(), r'little')
+
+    def _slot_pos(self, index):
+
+        return self._slot_offset + self._SLOT.size * index
+
+    def _probe_slots(self, key_hash):
+
+        home = key_hash % self._slot_count
+
+        for step in range(self._probe):
+            yield (home + step) % self._slot_count
+
+    def _read_head(self):
+
+        return self._HEAD.unpack_from(self._buf, self._head_offset)[0]
+
+    def _is_valid(self, offset, head):
+        # 数据区的写入位置超过缓存项一整圈后，缓存项已被覆盖
+        return head <= offset + self._arena_size
+
+    @classmethod
+    def _decode(cls, view, flags):
+
+        return bytes(view) if flags & cls._FLAG_RAW else pickle.loads(view)
+
+    def _read(self, key_bytes, key_hash, decoder=None):
+
+        decoder = decoder or self._decode
+
+        for index in self._probe_slots(key_hash):
+
+            pos = self._slot_pos(index)
+
+            for _ in range(self._RETRY_TIMES):
+
+                seq, key_len, _hash, offset, value_len, flags, expire = self._SLOT.unpack_from(self._buf, pos)
+
+                if seq & 1:
+                    continue
+
+                if key_len == 0 or _hash != key_hash:
+                    break
+
+                data_pos = self._arena_offset + offset % self._arena_size
+
+                try:
+                    matched = self._buf[data_pos:data_pos + key_len] == key_bytes
+                    value = decoder(self._buf[data_pos + key_len:data_pos + key_len + value_len], flags) if matched else None
+                except Exception as _:
+                    matched = value = None
+
+                if self._SEQ.unpack_from(self._buf, pos)[0] != seq or not self._is_valid(offset, self._read_head()):
+                    continue
+
+                if not matched:
+                    break
+
+                if expire and expire <= time.time():
+                    return False, None
+
+                return True, value
+
+        return False, None
+
+    def get(self, key, default=None):
+
+        found, value = self._read(*self._key_info(key))
+
+        if self._metrics is not None:
+            if found:
+                self._metrics.hit()
+            else:
+                self._metrics.miss()
+
+        return value if found else default
+
+    def get_view(self, key):
+        """零拷贝读取set_bytes写入的原始字节，返回共享内存的memoryview
+        视图直接引用数据区，该缓存项被覆盖后内容会改变，需在使用前调用has确认或尽快复制
+        调用release前需释放所有视图
+        """
+        found, value = self._read(*self._key_info(key), decoder=lambda view, _: view)
+
+        return value if found else None
+
+    def has(self, key):
+
+        return self._read(*self._key_info(key))[0]
+
+    def _key_info(self, key):
+
+        key_bytes = self._encode_key(key)
+
+        return key_bytes, self._hash_key(key_bytes)
+
+    def _write_slot(self, pos, *values):
+
+        seq = self._SEQ.unpack_from(self._buf, pos)[0]
+
+        self._SEQ.pack_into(self._buf, pos, (seq + 1) & 0xffffffff)
+        self._SLOT.pack_into(self._buf, pos, (seq + 1) & 0xffffffff, *values)
+        self._SEQ.pack_into(self._buf, pos, (seq + 2) & 0xffffffff)
+
+    def _find_slot(self, key_bytes, key_hash, head):
+        """查找写入的槽位，返回(槽位位置, 淘汰原因)
+        """
+
+        free_pos = victim_pos = None
+        victim_offset = None
+
+        now = time.time()
+
+        for index in self._probe_slots(key_hash):
+
+            pos = self._slot_pos(index)
+
+            _, key_len, _hash, offset, _, _, expire = self._SLOT.unpack_from(self._buf, pos)
+
+            if key_len == 0 or not self._is_valid(offset, head):
+                if free_pos is None:
+                    free_pos = pos
+                continue
+
+            if _hash == key_hash:
+                data_pos = self._arena_offset + offset % self._arena_size
+                if self._buf[data_pos:data_pos + key_len] == key_bytes:
+                    return pos, None
+
+            if expire and expire <= now:
+                if free_pos is None:
+                    free_pos = pos
+                continue
+
+            if victim_offset is None or offset < victim_offset:
+                victim_pos, victim_offset = pos, offset
+
+        if free_pos is not None:
+            return free_pos, None
+
+        return victim_pos, r'size'
+
+    def set(self, key, value, ttl=0):
+
+        self._write(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), 0, ttl)
+
+    def set_bytes(self, key, value: bytes, ttl=0):
+        """写入原始字节，get返回bytes副本，get_view返回零拷贝视图
+        """
+        self._write(key, value, self._FLAG_RAW, ttl)
+
+    def _write(self, key, value_bytes, flags, ttl):
+
+        key_bytes = self._encode_key(key)
+        key_hash = self._hash_key(key_bytes)
+
+        length = len(key_bytes) + len(value_bytes)
+
+        if length > self._arena_size:
+            raise ValueError(f'Shared memory cache item too large: {length}')
+
+        with self._write_lock():
+
+            head = self._read_head()
+
+            pos = head % self._arena_size
+
+            if pos + length > self._arena_size:
+                head += self._arena_size - pos
+                pos = 0
+
+            offset = head
+
+            # 先发布新的写入位置再写入数据，读取方据此判断数据是否正在被覆盖
+            self._HEAD.pack_into(self._buf, self._head_offset, head + length)
+
+            data_pos = self._arena_offset + pos
+            self._buf[data_pos:data_pos + len(key_bytes)] = key_bytes
+            self._buf[data_pos + len(key_bytes):data_pos + length] = value_bytes
+
+            slot_pos, reason = self._find_slot(key_bytes, key_hash, head + length)
+
+            self._write_slot(
+                slot_pos, len(key_bytes), key_hash, offset, len(value_bytes), flags,
+                time.time() + ttl if ttl > 0 else 0
+            )
+
+        if reason is not None and self._metrics is not None:
+            self._metrics.evict(reason)
+
+    def delete(self, key):
+
+        key_bytes, key_hash = self._key_info(key)
+
+        with self._write_lock():
+
+            slot_pos, reason = self._find_slot(key_bytes, key_hash, self._read_head())
+
+            if reason is None:
+                _, key_len, _hash, *_ = self._SLOT.unpack_from(self._buf, slot_pos)
+
+                if key_len and _hash == key_hash:
+                    self._write_slot(slot_pos, 0, 0, 0, 0, 0, 0)
+                    return True
+
+        return False
+
+    def size(self):
+
+        head = self._read_head()
+        now = time.time()
+
+        result = 0
+
+        for index in range(self._slot_count):
+
+            _, key_len, _, offset, _, _, expire = self._SLOT.unpack_from(self._buf, self._slot_pos(index))
+
+            if key_len and self._is_valid(offset, head) and not (expire and expire <= now):
+                result += 1
+
+        return result
+
+    def clear(self):
+
+        with self._write_lock():
+            for index in range(self._slot_count):
+                self._write_slot(self._slot_pos(index), 0, 0, 0, 0, 0, 0)
+
+    def release(self):
+        """断开当前进程与共享内存的连接
+        """
+
+        if self._byte_array is not None:
+            self._buf = None
+            self._byte_array.close()
+            self._byte_array = None
+
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def destroy(self):
+        """删除共享内存，其它进程已建立的连接不受影响
+        """
+
+        if self._byte_array is not None:
+            self._byte_array.destroy()
+
+        self.release()
+
+        try:
+            os.remove(os.path.join(self._lock_dir(), f'najapy_shm_{self._name}.lock'))
+        except FileNotFoundError:
+            pass
+
+
+class _FileLock:
+    """基于flock的进程间互斥锁
+    """
+
+    def __init__(self, fd):
+
+        self._fd = fd
+
+    def __enter__(self):
+
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, _traceback):
+
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
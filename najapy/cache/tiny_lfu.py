@@ -0,0 +1,330 @@
+"""W-TinyLFU缓存引擎"""
+import sys
+import time
+from collections import OrderedDict
+
+from najapy.common.async_base import Utils
+
+
+def sizeof_weigher(key, value):
+    """按对象自身占用的字节数计算权重(不递归计算容器内的元素)
+    """
+
+    return sys.getsizeof(key) + sys.getsizeof(value)
+
+
+class FrequencySketch:
+    """频率估算器
+
+    基于Count-Min Sketch实现，每个计数器上限为15，累计记录次数达到采样上限后所有计数减半，使历史热度逐渐衰减
+    """
+
+    _SEEDS = (0x97CB3127, 0xB492B66F, 0x9AE16A3B, 0xCBF29CE4)
+
+    _MAX_COUNT = 15
+
+    _HALF_TABLE = bytes(val >> 1 for val in range(256))
+
+    def __init__(self, capacity):
+
+        width = 16
+
+        while width < capacity:
+            width <<= 1
+
+        self._mask = width - 1
+        self._table = [bytearray(width) for _ in self._SEEDS]
+
+        self._sample_size = width * 10
+        self._size = 0
+
+    def _indexes(self, key):
+
+        _hash = hash(key)
+
+        for seed in self._SEEDS:
+            val = (_hash * seed) & 0xffffffffffffffff
+            yield (val ^ (val >> 32)) & self._mask
+
+    def increment(self, key):
+
+        for row, index in zip(self._table, self._indexes(key)):
+            if row[index] < self._MAX_COUNT:
+                row[index] += 1
+
+        self._size += 1
+
+        if self._size >= self._sample_size:
+            self._reset()
+
+    def frequency(self, key):
+
+        return min(row[index] for row, index in zip(self._table, self._indexes(key)))
+
+    def _reset(self):
+
+        self._table = [bytearray(row.translate(self._HALF_TABLE)) for row in self._table]
+        self._size >>= 1
+
+
+class _Node:
+
+    __slots__ = [r'value', r'weight', r'expire']
+
+    def __init__(self, value, weight, expire):
+
+        self.value = value
+        self.weight = weight
+        self.expire = expire
+
+
+class TinyLFUCache:
+    """W-TinyLFU缓存引擎
+
+    新数据先进入窗口区(LRU)，被挤出窗口区后需要与主区(分段LRU)的淘汰候选比较访问频率，频率更高才能进入主区，
+    因此一次性的冷数据扫描不会冲掉热点数据
+    容量按权重计算，配合weigher可实现按字节数限制内存占用
+
+    max_weight: 总权重上限
+    ttl: 默认有效期(秒)，0为永不过期
+    weigher: 权重计算函数weigher(key, value)，默认每项权重为1
+    ttl_jitter: 有效期随机抖动比例(0~1)，避免同一时刻写入的数据同时过期
+    on_evict: 淘汰回调on_evict(reason, count)，reason为size或expired
+    """
+
+    def __init__(self, max_weight, ttl=0, *, weigher=None, ttl_jitter=0, window_ratio=0.01, protected_ratio=0.8,
+                 on_evict=None):
+
+        self.on_evict = on_evict
+
+        self._max_weight = max_weight
+        self._ttl = ttl
+        self._weigher = weigher
+        self._ttl_jitter = Utils.interval_limit(ttl_jitter, 0, 1)
+
+        self._window_max = max(int(max_weight * window_ratio), 1)
+        self._main_max = max(max_weight - self._window_max, 1)
+        self._protected_max = int(self._main_max * protected_ratio)
+
+        self._window = OrderedDict()
+        self._probation = OrderedDict()
+        self._protected = OrderedDict()
+
+        self._window_weight = 0
+        self._probation_weight = 0
+        self._protected_weight = 0
+
+        self._sketch = FrequencySketch(max_weight if weigher is None else min(max_weight, 0xffff))
+
+    @property
+    def max_weight(self):
+
+        return self._max_weight
+
+    @property
+    def weight(self):
+
+        return self._window_weight + self._probation_weight + self._protected_weight
+
+    def _get_expire(self, ttl):
+
+        if ttl is None:
+            ttl = self._ttl
+
+        if ttl <= 0:
+            return None
+
+        if self._ttl_jitter > 0:
+            ttl *= 1 + Utils.random.uniform(-self._ttl_jitter, self._ttl_jitter)
+
+        return time.monotonic() + ttl
+
+    def _find(self, key):
+
+        for segment in (self._window, self._probation, self._protected):
+            node = segment.get(key)
+            if node is not None:
+                return segment, node
+
+        return None, None
+
+    def _remove(self, segment, key):
+
+        node = segment.pop(key)
+
+        if segment is self._window:
+            self._window_weight -= node.weight
+        elif segment is self._probation:
+            self._probation_weight -= node.weight
+        else:
+            self._protected_weight -= node.weight
+
+        return node
+
+    def _get_node(self, key):
+
+        segment, node = self._find(key)
+
+        if node is not None and node.expire is not None and node.expire <= time.monotonic():
+            self._remove(segment, key)
+            self._notify_evict(r'expired')
+            return None, None
+
+        return segment, node
+
+    def _notify_evict(self, reason, count=1):
+
+        if self.on_evict is not None and count > 0:
+            self.on_evict(reason, count)
+
+    def _on_hit(self, segment, key, node):
+
+        if segment is self._probation:
+
+            self._remove(segment, key)
+
+            self._protected[key] = node
+            self._protected_weight += node.weight
+
+            while self._protected_weight > self._protected_max and len(self._protected) > 1:
+                demote_key, demote_node = self._protected.popitem(last=False)
+                self._protected_weight -= demote_node.weight
+
+                self._probation[demote_key] = demote_node
+                self._probation_weight += demote_node.weight
+
+        else:
+
+            segment.move_to_end(key)
+
+    def _evict(self):
+
+        while self._window_weight > self._window_max and self._window:
+            key, node = self._window.popitem(last=False)
+            self._window_weight -= node.weight
+
+            self._admit(key, node)
+
+    def _admit(self, key, node):
+
+        while self._probation_weight + self._protected_weight + node.weight > self._main_max:
+
+            segment = self._probation if self._probation else self._protected
+
+            if not segment:
+                self._notify_evict(r'size')
+                return
+
+            victim_key, victim_node = next(iter(segment.items()))
+
+            if victim_node.expire is not None and victim_node.expire <= time.monotonic():
+                self._remove(segment, victim_key)
+                self._notify_evict(r'expired')
+            elif self._sketch.frequency(key) > self._sketch.frequency(victim_key):
+                self._remove(segment, victim_key)
+                self._notify_evict(r'size')
+            else:
+                self._notify_evict(r'size')
+                return
+
+        self._probation[key] = node
+        self._probation_weight += node.weight
+
+    def get(self, key, default=None):
+
+        self._sketch.increment(key)
+
+        segment, node = self._get_node(key)
+
+        if node is None:
+            return default
+
+        self._on_hit(segment, key, node)
+
+        return node.value
+
+    def set(self, key, value, ttl=None):
+        """写入缓存，ttl为空时使用默认有效期
+        """
+
+        weight = 1 if self._weigher is None else self._weigher(key, value)
+
+        segment, _ = self._find(key)
+
+        if segment is not None:
+            self._remove(segment, key)
+
+        if weight > self._max_weight:
+            self._notify_evict(r'size')
+            return
+
+        self._window[key] = _Node(value, weight, self._get_expire(ttl))
+        self._window_weight += weight
+
+        self._evict()
+
+    def pop(self, key, default=None):
+
+        segment, node = self._get_node(key)
+
+        if node is None:
+            return default
+
+        self._remove(segment, key)
+
+        return node.value
+
+    def expire(self):
+        """清理所有已过期的缓存项
+        """
+
+        now = time.monotonic()
+
+        for segment in (self._window, self._probation, self._protected):
+
+            keys = [key for key, node in segment.items() if node.expire is not None and node.expire <= now]
+
+            for key in keys:
+                self._remove(segment, key)
+
+            self._notify_evict(r'expired', len(keys))
+
+    def clear(self):
+
+        for segment in (self._window, self._probation, self._protected):
+            segment.clear()
+
+        self._window_weight = self._probation_weight = self._protected_weight = 0
+
+    def __contains__(self, key):
+
+        return self._get_node(key)[1] is not None
+
+    def __getitem__(self, key):
+
+        segment, node = self._get_node(key)
+
+        if node is None:
+            raise KeyError(key)
+
+        self._sketch.increment(key)
+        self._on_hit(segment, key, node)
+
+        return node.value
+
+    def __setitem__(self, key, value):
+
+        self.set(key, value)
+
+    def __delitem__(self, key):
+
+        segment, _ = self._find(key)
+
+        if segment is None:
+            raise KeyError(key)
+
+        self._remove(segment, key)
+
+    def __len__(self):
+
+        return len(self._window) + len(self._probation) + len(self._protected)
@@ -323,6 +323,91 @@ class FutureWithTimeout(asyncio.Future):
             self._timeout_handle = None
 
 
+class TimerWheel:
+    """时间轮
+
+    所有定时项共用一个按tick推进的定时器，添加与删除均为O(1)，适合管理大量的超时
+    超时精度为tick，没有定时项时定时器停止
+
+    """
+
+    def __init__(self, tick, callback, slot_count=512):
+
+        self._tick = tick
+        self._callback = callback
+
+        self._slots = [{} for _ in range(slot_count)]
+        self._index = {}
+        self._cursor = 0
+
+        self._timer_handle = None
+
+    def __len__(self):
+
+        return len(self._index)
+
+    def __contains__(self, key):
+
+        return key in self._index
+
+    def add(self, key, timeout):
+
+        self.remove(key)
+
+        ticks = max(int(-(-timeout // self._tick)), 1)
+
+        slot = (self._cursor + ticks) % len(self._slots)
+
+        # 超过一圈的定时项记录剩余圈数
+        self._slots[slot][key] = (ticks - 1) // len(self._slots)
+        self._index[key] = slot
+
+        if self._timer_handle is None:
+            self._timer_handle = Utils.call_later(self._tick, self._on_tick)
+
+    def remove(self, key):
+
+        slot = self._index.pop(key, None)
+
+        if slot is not None:
+            del self._slots[slot][key]
+
+    def stop(self):
+
+        if self._timer_handle is not None:
+            self._timer_handle.cancel()
+            self._timer_handle = None
+
+    def _on_tick(self):
+
+        self._timer_handle = None
+
+        self._cursor = (self._cursor + 1) % len(self._slots)
+
+        slot = self._slots[self._cursor]
+
+        expired = []
+
+        for key, rounds in slot.items():
+            if rounds > 0:
+                slot[key] = rounds - 1
+            else:
+                expired.append(key)
+
+        for key in expired:
+            del slot[key]
+            del self._index[key]
+
+        if self._index:
+            self._timer_handle = Utils.call_later(self._tick, self._on_tick)
+
+        for key in expired:
+            try:
+                self._callback(key)
+            except Exception as err:
+                Utils.log.error(err)
+
+
 class FuncWrapper(_FuncWrapper):
     """非阻塞异步函数包装器
 
@@ -336,6 +421,28 @@ class FuncWrapper(_FuncWrapper):
             Utils.call_soon(func, *args, **kwargs)
 
 
+class AwaitableFuncWrapper(_FuncWrapper):
+    """可等待的异步函数包装器
+
+    将多个同步或异步函数包装成一个可等待对象，调用后依次执行全部函数，单个函数的异常记录日志后继续执行，
+    返回全部函数是否均执行成功
+
+    """
+
+    async def __call__(self, *args, **kwargs):
+
+        result = True
+
+        for func in self._callables:
+            try:
+                await Utils.awaitable_wrapper(func(*args, **kwargs))
+            except Exception as err:
+                Utils.log.error(err)
+                result = False
+
+        return result
+
+
 class MultiTasks:
     """多任务并发管理器
 
@@ -1,12 +1,27 @@
+import asyncio
+import os
+import sys
+import time
+from collections import deque
 from typing import Callable
 
 from najapy.common.async_base import Utils
-from najapy.common.task import IntervalTask
+from najapy.common.metrics import Metrics, MetricsRegistry
+from najapy.common.spill import DiskSpill
+
+
+class _SpillItem:
+    """从磁盘读回的数据，seq为读回顺序，处理完成后据此按顺序确认"""
+    __slots__ = (r'seq', r'data')
+
+    def __init__(self, seq, data):
+        self.seq = seq
+        self.data = data
 
 
 class _BufferAbs:
     def __init__(self):
-        self._buffer = []
+        self._buffer = deque()
 
     def _consume_buffer(self):
         raise NotImplementedError
@@ -15,7 +30,7 @@ class _BufferAbs:
         if not self._buffer:
             return None
 
-        buffer, self._buffer = self._buffer, []
+        buffer, self._buffer = self._buffer, deque()
 
         return buffer
 
@@ -45,15 +60,20 @@ class DadaQueue(_BufferAbs):
             if not self._create_task():
                 break
 
+    def _pop_datas(self):
+        if len(self._buffer) <= self._data_limit:
+            datas = list(self._buffer)
+            self._buffer.clear()
+        else:
+            datas = [self._buffer.popleft() for _ in range(self._data_limit)]
+
+        return datas
+
     def _create_task(self):
         result = False
 
         if len(self._buffer) > 0:
-            datas = self._buffer[0: self._data_limit]
-            for data in datas:
-                if len(self._buffer) <= 0:
-                    break
-                self._buffer.remove(data)
+            datas = self._pop_datas()
 
             task = Utils.create_task(
                 self._handler(datas)
@@ -73,38 +93,400 @@ class DadaQueue(_BufferAbs):
 
         self._consume_buffer()
 
+    def pop_oldest(self):
+        """丢弃最早的一条待处理数据"""
+        return self._buffer.popleft()
+
+    def task_size(self):
+        return len(self._tasks)
+
+    @property
+    def data_limit(self):
+        return self._data_limit
+
+    @data_limit.setter
+    def data_limit(self, value):
+        self._data_limit = value
+
+    async def join(self):
+        """等待全部数据处理完成"""
+        while self._buffer or self._tasks:
+            if self._tasks:
+                await asyncio.wait(set(self._tasks))
+            else:
+                self._consume_buffer()
+
 
 class QueueBuffer(_BufferAbs):
-    def __init__(self, handler: Callable, size_limit, *, timeout=1, task_limit=1, data_limit=1):
+    OVERFLOW_BLOCK = r'block'
+    OVERFLOW_DROP_OLDEST = r'drop_oldest'
+    OVERFLOW_DROP_NEWEST = r'drop_newest'
+
+    def __init__(self, handler: Callable, size_limit, *, timeout=1, task_limit=1, data_limit=1,
+                 high_water=0, overflow=OVERFLOW_BLOCK, name=None,
+                 max_bytes=0, sizer: Callable = None,
+                 adaptive=False, target_latency=0.1, max_data_limit=1000,
+                 spill_path=None, spill_threshold=10000, spill_segment_size=0x4000000):
         """
         handler: 处理数据的callable
         size_limit: buffer最大尺寸
-        timeout: 超时时间，即每间隔timeout时间处理一次buffer中的数据
+        timeout: 超时时间，start后buffer中最早的数据停留超过timeout时处理buffer中的数据
         task_limit: 处理数据最大任务数
         data_limit: 每个任务批量处理的最大数据量
+        high_water: 待处理数据(不含处理中的数据)的上限，为0时不限制
+        overflow: 达到high_water时的处理策略
+            block: put等待至低于high_water，append仍直接写入
+            drop_oldest: 丢弃最早的数据
+            drop_newest: 丢弃新写入的数据
+        name: 指标名称，不为空时注册到MetricsRegistry
+        max_bytes: buffer中数据的最大字节数，为0时不限制
+        sizer: 计算数据字节数的callable，默认为sys.getsizeof
+        adaptive: 根据handler耗时自动调整data_limit，耗时低于target_latency且批次已满时翻倍，超过时减半
+        max_data_limit: 自动调整时data_limit的上限
+        spill_path: 磁盘溢出目录，不为空时内存中的数据达到spill_threshold后写入磁盘段文件，
+            不再按overflow策略阻塞或丢弃，handler处理跟上后按顺序读回，读回的数据在handler执行完成后才在磁盘中确认，
+            重启后继续处理未确认的数据
+        spill_segment_size: 磁盘段文件大小(字节)
         """
         super().__init__()
 
         self._size_limit = size_limit
-        self._data_queue = DadaQueue(handler, task_limit, data_limit=data_limit)
+        self._data_queue = DadaQueue(self._handle_datas, task_limit, data_limit=data_limit)
+
+        self._handler = handler
+
+        self._high_water = high_water
+        self._overflow = overflow
+        self._space_waiters = deque()
+
+        self._metrics = MetricsRegistry().get(f'queue_buffer:{name}') if name else Metrics(r'queue_buffer')
+
+        self._timeout = timeout
+        self._timer_handle = None
+        self._started = False
+        self._oldest_time = None
 
-        self._interval_task = IntervalTask.create(timeout, self._do_consume_buffer)
+        self._max_bytes = max_bytes
+        self._sizer = sizer or sys.getsizeof
+        self._bytes = 0
+
+        self._adaptive = adaptive
+        self._target_latency = target_latency
+        self._min_data_limit = data_limit
+        self._max_data_limit = max(max_data_limit, data_limit)
+
+        self._spill = DiskSpill(spill_path, spill_segment_size) if spill_path else None
+        self._spill_threshold = spill_threshold
+
+        # 读回数据的顺序号，乱序完成的批次在之前的数据全部完成后再确认
+        self._spill_seq = 0
+        self._spill_ack_seq = 0
+        self._spill_handled = set()
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    @property
+    def data_limit(self):
+        return self._data_queue.data_limit
 
     def _consume_buffer(self):
-        if self.size() >= self._size_limit:
+        if self.size() >= self._size_limit or 0 < self._max_bytes <= self._bytes:
             self._do_consume_buffer()
+        elif self._started and self._timer_handle is None and self._buffer:
+            self._set_timer()
+
+    def _set_timer(self):
+        delay = self._timeout - (Utils.loop_time() - self._oldest_time)
+
+        self._timer_handle = Utils.call_later(max(delay, 0), self._on_timer)
+
+    def _on_timer(self):
+        self._timer_handle = None
+        self._do_consume_buffer()
+
+    def _cancel_timer(self):
+        if self._timer_handle is not None:
+            self._timer_handle.cancel()
+            self._timer_handle = None
 
     def _do_consume_buffer(self):
+        self._cancel_timer()
+
         buffer = self._get_buffer()
 
+        self._bytes = 0
+        self._oldest_time = None
+
         if buffer:
             self._data_queue.extent(buffer)
 
+    async def _handle_datas(self, datas):
+        # 数据已离开队列，唤醒等待空间的写入方
+        self._notify_space()
+
+        spill_seqs = None
+
+        if self._spill is not None:
+            spill_seqs = [data.seq for data in datas if type(data) is _SpillItem]
+            if spill_seqs:
+                datas = [data.data if type(data) is _SpillItem else data for data in datas]
+
+        begin_time = time.perf_counter()
+
+        try:
+            return await self._handler(datas)
+        finally:
+            if spill_seqs:
+                self._ack_spill(spill_seqs)
+
+            latency = time.perf_counter() - begin_time
+
+            self._metrics.observe(r'handle_latency_seconds', latency)
+            self._metrics.observe(r'batch_size', len(datas))
+
+            if self._adaptive:
+                self._adjust_data_limit(len(datas), latency)
+
+            self._replay_spill()
+
+    def _replay_spill(self):
+        """内存中的数据低于spill_threshold时从磁盘读回"""
+        if not self._spill:
+            return
+
+        space = self._spill_threshold - self._memory_size()
+
+        if space > 0:
+
+            datas = self._spill.pop(space)
+
+            if datas:
+                self._metrics.incr(r'replayed', len(datas))
+                self._data_queue.extent(_SpillItem(self._spill_seq + index, data) for index, data in enumerate(datas))
+                self._spill_seq += len(datas)
+
+    def _ack_spill(self, seqs):
+        """确认已处理完成的读回数据，只确认从最早未确认数据开始连续完成的部分"""
+        self._spill_handled.update(seqs)
+
+        count = 0
+
+        while self._spill_ack_seq in self._spill_handled:
+            self._spill_handled.remove(self._spill_ack_seq)
+            self._spill_ack_seq += 1
+            count += 1
+
+        if count > 0:
+            self._spill.ack(count)
+
+    def _spill_data(self, data) -> bool:
+        """内存中的数据达到spill_threshold或磁盘中有未读回的数据时写入磁盘，保证数据顺序"""
+        if len(self._spill) == 0:
+
+            if self._memory_size() < self._spill_threshold:
+                return False
+
+            # 先将buffer中的数据交给处理任务，读回的数据排在其后
+            self._do_consume_buffer()
+
+        self._spill.append(data)
+        self._metrics.incr(r'spilled')
+
+        return True
+
+    def _adjust_data_limit(self, size, latency):
+        data_limit = self._data_queue.data_limit
+
+        if latency > self._target_latency:
+            data_limit = max(data_limit // 2, self._min_data_limit)
+        elif size >= data_limit:
+            data_limit = min(data_limit * 2, self._max_data_limit)
+
+        self._data_queue.data_limit = data_limit
+
+    def _memory_size(self):
+        return self.size() + self._data_queue.size()
+
+    def _is_full(self):
+        return 0 < self._high_water <= self._memory_size()
+
+    def _notify_space(self):
+        while self._space_waiters and not self._is_full():
+            waiter = self._space_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+
+    def _accept(self):
+        """根据溢出策略决定是否接收新数据"""
+        if not self._is_full() or self._overflow == self.OVERFLOW_BLOCK:
+            return True
+
+        if self._overflow == self.OVERFLOW_DROP_NEWEST:
+            self._metrics.incr(r'dropped', reason=r'newest')
+            return False
+
+        if self._data_queue.size() > 0:
+            data = self._data_queue.pop_oldest()
+            if type(data) is _SpillItem:
+                self._ack_spill([data.seq])
+        else:
+            data = self._buffer.popleft()
+            if self._max_bytes > 0:
+                self._bytes -= self._sizer(data)
+
+        self._metrics.incr(r'dropped', reason=r'oldest')
+
+        return True
+
+    def append(self, data):
+        if self._spill is not None and self._spill_data(data):
+            return
+
+        if self._accept():
+
+            if not self._buffer:
+                self._oldest_time = Utils.loop_time()
+
+            if self._max_bytes > 0:
+                self._bytes += self._sizer(data)
+
+            super().append(data)
+
+    def extent(self, data_list):
+        for data in data_list:
+            self.append(data)
+
+    async def put(self, data):
+        """写入数据，block策略下达到high_water时等待"""
+        if self._spill is None and self._overflow == self.OVERFLOW_BLOCK and self._is_full():
+
+            self._metrics.incr(r'blocked')
+
+            # 将缓冲区数据交给处理任务，避免未达到size_limit时无法释放空间
+            self._do_consume_buffer()
+
+            while self._is_full():
+                waiter = asyncio.get_running_loop().create_future()
+                self._space_waiters.append(waiter)
+                await waiter
+
+        self.append(data)
+
+    def pending_size(self):
+        return self._memory_size() + (len(self._spill) if self._spill else 0)
+
+    def spill_size(self):
+        return len(self._spill) if self._spill else 0
+
     def data_queue_size(self):
         return self._data_queue.size()
 
     def start(self):
-        self._interval_task.start()
+        """开启按数据停留时间处理"""
+        self._started = True
+
+        self._replay_spill()
+
+        if self._buffer and self._timer_handle is None:
+            self._set_timer()
 
     def stop(self):
-        self._interval_task.stop()
+        """停止按时间处理，并将buffer中的全部数据交给处理任务
+        返回Task，可等待全部数据处理完成
+        """
+        self._started = False
+
+        self._do_consume_buffer()
+        self._replay_spill()
+
+        return Utils.create_task(self._join())
+
+    async def _join(self):
+
+        await self._data_queue.join()
+
+        if self._spill is not None:
+            self._spill.flush()
+
+    def close(self):
+        """关闭磁盘段文件，未处理的数据保留在磁盘中"""
+        if self._spill is not None:
+            self._spill.close()
+
+
+class PartitionedQueueBuffer:
+    """按key分区的缓冲区
+    数据按key_fn计算的key哈希到partitions个分区，每个分区为task_limit=1的QueueBuffer，
+    同一时刻只有一个处理中的批次，因此同一key的数据按写入顺序处理，不同分区并发处理
+    """
+
+    def __init__(self, handler: Callable, partitions, key_fn: Callable, size_limit, **kwargs):
+        """
+        handler: 处理数据的callable
+        partitions: 分区数
+        key_fn: 根据数据计算分区key的callable
+        size_limit: 每个分区buffer最大尺寸
+        kwargs: 其它参数传递给每个分区的QueueBuffer，task_limit固定为1，
+            spill_path不为空时每个分区使用其下以分区序号命名的子目录
+        """
+        if partitions < 1:
+            raise ValueError(f'Invalid partitions: {partitions}')
+
+        kwargs[r'task_limit'] = 1
+
+        name = kwargs.pop(r'name', None)
+        spill_path = kwargs.pop(r'spill_path', None)
+
+        self._key_fn = key_fn
+
+        self._partitions = [
+            QueueBuffer(
+                handler, size_limit, name=f'{name}:{index}' if name else None,
+                spill_path=os.path.join(spill_path, str(index)) if spill_path else None, **kwargs
+            )
+            for index in range(partitions)
+        ]
+
+    @property
+    def partitions(self):
+        return list(self._partitions)
+
+    def get_partition(self, data) -> QueueBuffer:
+        key = self._key_fn(data)
+
+        return self._partitions[Utils.md5_u32(str(key)) % len(self._partitions)]
+
+    def size(self):
+        return sum(partition.size() for partition in self._partitions)
+
+    def pending_size(self):
+        return sum(partition.pending_size() for partition in self._partitions)
+
+    def append(self, data):
+        self.get_partition(data).append(data)
+
+    def extent(self, data_list):
+        for data in data_list:
+            self.append(data)
+
+    async def put(self, data):
+        await self.get_partition(data).put(data)
+
+    def start(self):
+        for partition in self._partitions:
+            partition.start()
+
+    def stop(self):
+        """停止全部分区，返回Task，可等待全部数据处理完成"""
+        return Utils.create_task(self._join([partition.stop() for partition in self._partitions]))
+
+    @staticmethod
+    async def _join(tasks):
+        await asyncio.gather(*tasks)
+
+    def close(self):
+        """关闭全部分区的磁盘段文件，未处理的数据保留在磁盘中"""
+        for partition in self._partitions:
+            partition.close()
@@ -0,0 +1,306 @@
+"""指标统计工具集"""
+import math
+import time
+import weakref
+from bisect import bisect_left
+
+from najapy.common.metaclass import Singleton
+
+
+def _escape_label(val):
+
+    return str(val).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+class Histogram:
+    """固定分桶直方图
+    """
+
+    DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, buckets=None):
+
+        self._buckets = tuple(sorted(buckets)) if buckets else self.DEFAULT_BUCKETS
+        self._counts = [0] * (len(self._buckets) + 1)
+
+        self._sum = 0
+        self._count = 0
+
+    @property
+    def count(self):
+
+        return self._count
+
+    @property
+    def sum(self):
+
+        return self._sum
+
+    def observe(self, val):
+
+        self._counts[bisect_left(self._buckets, val)] += 1
+
+        self._sum += val
+        self._count += 1
+
+    def cumulative(self):
+        """返回(上界, 累计数量)列表，最后一项上界为inf
+        """
+
+        result = []
+
+        total = 0
+
+        for bound, count in zip(self._buckets + (float(r'inf'),), self._counts):
+            total += count
+            result.append((bound, total))
+
+        return result
+
+    def to_dict(self):
+
+        return {
+            r'count': self._count,
+            r'sum': self._sum,
+            r'avg': self._sum / self._count if self._count else 0,
+        }
+
+
+class Metrics:
+    """指标组
+
+    同一名称下的一组计数器、直方图与仪表盘，计数器可附带一个reason标签，仪表盘的值可以是callable
+    所有操作都是简单的内存运算，可在生产环境常开
+    """
+
+    TYPE = r'metrics'
+
+    def __init__(self, name):
+
+        self._name = name
+
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    @property
+    def name(self):
+
+        return self._name
+
+    def incr(self, field, val=1, reason=None):
+
+        key = field if reason is None else (field, reason)
+
+        self._counters[key] = self._counters.get(key, 0) + val
+
+    def get_counter(self, field, reason=None):
+
+        return self._counters.get(field if reason is None else (field, reason), 0)
+
+    def observe(self, field, val, buckets=None):
+
+        histogram = self._histograms.get(field)
+
+        if histogram is None:
+            histogram = self._histograms[field] = Histogram(buckets)
+
+        histogram.observe(val)
+
+    def set_gauge(self, field, val):
+
+        self._gauges[field] = val
+
+    def get_gauge(self, field):
+
+        val = self._gauges.get(field, 0)
+
+        return val() if callable(val) else val
+
+    def to_dict(self):
+
+        result = {}
+
+        for key, val in self._counters.items():
+
+            if isinstance(key, tuple):
+                result.setdefault(key[0], {})[key[1]] = val
+            else:
+                result[key] = val
+
+        for field, histogram in self._histograms.items():
+            result[field] = histogram.to_dict()
+
+        for field in self._gauges:
+            result[field] = self.get_gauge(field)
+
+        return result
+
+    def samples(self, prefix):
+        """生成prometheus样本(指标名, 类型, 标签, 值)
+        """
+
+        base_name = f'{prefix}_{self.TYPE}'
+        labels = {r'name': self._name}
+
+        for key, val in self._counters.items():
+
+            if isinstance(key, tuple):
+                yield f'{base_name}_{key[0]}_total', r'counter', dict(labels, reason=key[1]), val
+            else:
+                yield f'{base_name}_{key}_total', r'counter', labels, val
+
+        for field, histogram in self._histograms.items():
+
+            metric = f'{base_name}_{field}'
+
+            for bound, count in histogram.cumulative():
+                yield f'{metric}_bucket', r'histogram', dict(labels, le=r'+Inf' if math.isinf(bound) else str(bound)), count
+
+            yield f'{metric}_sum', r'histogram', labels, histogram.sum
+            yield f'{metric}_count', r'histogram', labels, histogram.count
+
+        for field in self._gauges:
+            yield f'{base_name}_{field}', r'gauge', labels, self.get_gauge(field)
+
+
+class CacheMetrics(Metrics):
+    """缓存指标
+
+    hits & misses: 命中与未命中次数
+    evictions: 按原因(size/expired/explicit)统计的淘汰次数
+    load_seconds: 回源加载耗时直方图
+    inflight_loads: 正在进行的回源加载数
+    size: 当前缓存项数量(需绑定size_func)
+    """
+
+    TYPE = r'cache'
+
+    def __init__(self, name):
+
+        super().__init__(name)
+
+        self._inflight = 0
+
+        self.set_gauge(r'inflight_loads', lambda: self._inflight)
+
+    def bind_size(self, size_func):
+        """绑定方法使用弱引用，注册表中的指标不会延长缓存对象的生命周期，对象回收后size为0"""
+        if hasattr(size_func, r'__self__'):
+
+            ref = weakref.WeakMethod(size_func)
+
+            def _size():
+                func = ref()
+                return 0 if func is None else func()
+
+            self.set_gauge(r'size', _size)
+
+        else:
+
+            self.set_gauge(r'size', size_func)
+
+    def hit(self, val=1):
+
+        self.incr(r'hits', val)
+
+    def miss(self, val=1):
+
+        self.incr(r'misses', val)
+
+    def evict(self, reason, val=1):
+
+        self.incr(r'evictions', val, reason)
+
+    def load_begin(self):
+
+        self._inflight += 1
+
+        return time.perf_counter()
+
+    def load_end(self, begin_time):
+
+        self._inflight -= 1
+
+        self.observe(r'load_seconds', time.perf_counter() - begin_time)
+
+    @property
+    def hit_ratio(self):
+
+        hits = self.get_counter(r'hits')
+        total = hits + self.get_counter(r'misses')
+
+        return hits / total if total else 0
+
+    def to_dict(self):
+
+        result = super().to_dict()
+        result[r'hit_ratio'] = self.hit_ratio
+
+        return result
+
+
+class MetricsRegistry(Singleton):
+    """指标注册表(单例)
+
+    按名称管理指标组，可导出为字典(用于健康检查接口)或prometheus文本格式
+    """
+
+    def __init__(self):
+
+        self._metrics = {}
+
+    def get(self, name, metrics_class=Metrics):
+        """获取指定名称的指标组，不存在时创建
+        """
+
+        metrics = self._metrics.get(name)
+
+        if metrics is None:
+            metrics = self._metrics[name] = metrics_class(name)
+
+        return metrics
+
+    def cache_metrics(self, name) -> CacheMetrics:
+
+        return self.get(name, CacheMetrics)
+
+    def remove(self, name):
+
+        return self._metrics.pop(name, None)
+
+    def clear(self):
+
+        self._metrics.clear()
+
+    def to_dict(self):
+
+        return {name: metrics.to_dict() for name, metrics in self._metrics.items()}
+
+    def to_prometheus(self, prefix=r'najapy'):
+
+        types = {}
+        samples = {}
+
+        for metrics in self._metrics.values():
+            for metric, _type, labels, val in metrics.samples(prefix):
+
+                family = metric
+
+                if _type == r'histogram':
+                    family = metric.rsplit(r'_', 1)[0]
+
+                types.setdefault(family, _type)
+                samples.setdefault(family, []).append((metric, labels, val))
+
+        lines = []
+
+        for family, _type in types.items():
+
+            lines.append(f'# TYPE {family} {_type}')
+
+            for metric, labels, val in samples[family]:
+                label_str = r','.join(f'{key}="{_escape_label(label)}"' for key, label in labels.items())
+                lines.append(f'{metric}{{{label_str}}} {val}')
+
+        return '\n'.join(lines) + '\n'
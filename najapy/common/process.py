@@ -1,4 +1,5 @@
 import os
+from multiprocessing import resource_tracker
 from multiprocessing.shared_memory import SharedMemory
 
 from najapy.common.async_base import Utils
@@ -24,6 +25,23 @@ class SharedByteArray(SharedMemory, ByteArrayAbstract, ContextManager):
         if (self._flags & os.O_CREAT) != 0:
             self.unlink()
 
+    def detach(self):
+        """解除共享内存与当前进程的生命周期关联，release及进程退出时均不删除共享内存
+        """
+
+        self._flags &= ~os.O_CREAT
+
+        resource_tracker.unregister(self._name, r'shared_memory')
+
+    def destroy(self):
+        """删除detach后的共享内存，其它进程已建立的连接不受影响
+        """
+
+        # unlink会向resource_tracker注销，先重新登记避免注销不存在的记录
+        resource_tracker.register(self._name, r'shared_memory')
+
+        self.unlink()
+
     def read(self, size):
 
         return self._buf[:size]
@@ -0,0 +1,277 @@
+import mmap
+import os
+import pickle
+import struct
+import zlib
+from collections import deque
+from typing import Callable
+
+
+class SpillSegment:
+    """磁盘溢出段文件
+    文件按capacity预分配并通过mmap只追加写入，文件头记录已确认的偏移，pop只移动内存中的读取位置，ack后才写入文件头，
+    每条记录为: 数据长度(4字节) + crc32(4字节) + 数据，长度为0表示结束，
+    打开已有文件时从已消费的偏移开始校验，遇到长度越界或crc不一致(写入中断)时视为结束
+    """
+
+    HEADER = struct.Struct(r'<Q')
+    RECORD = struct.Struct(r'<II')
+
+    def __init__(self, path, capacity=0):
+
+        self._path = path
+
+        exists = os.path.exists(path)
+
+        self._file = open(path, r'r+b' if exists else r'w+b')
+
+        if not exists:
+            self._file.truncate(max(capacity, self.HEADER.size + self.RECORD.size))
+
+        self._capacity = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+
+        self._count = 0
+        self._unacked = 0
+
+        if exists:
+            self._read_offset = min(max(self.HEADER.unpack_from(self._mmap)[0], self.HEADER.size), self._capacity)
+            self._write_offset = self._scan()
+        else:
+            self._read_offset = self._write_offset = self.HEADER.size
+            self.HEADER.pack_into(self._mmap, 0, self._read_offset)
+
+        self._pop_offset = self._read_offset
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def unacked(self):
+        return self._unacked
+
+    def _read_record(self, offset):
+
+        if offset + self.RECORD.size > self._capacity:
+            return None
+
+        length, checksum = self.RECORD.unpack_from(self._mmap, offset)
+
+        begin = offset + self.RECORD.size
+
+        if length == 0 or begin + length > self._capacity:
+            return None
+
+        payload = self._mmap[begin:begin + length]
+
+        if zlib.crc32(payload) != checksum:
+            return None
+
+        return payload
+
+    def _scan(self):
+
+        offset = self._read_offset
+
+        while True:
+
+            payload = self._read_record(offset)
+
+            if payload is None:
+                break
+
+            offset += self.RECORD.size + len(payload)
+            self._count += 1
+
+        return offset
+
+    def append(self, payload) -> bool:
+
+        end = self._write_offset + self.RECORD.size + len(payload)
+
+        if end > self._capacity:
+            return False
+
+        self.RECORD.pack_into(self._mmap, self._write_offset, len(payload), zlib.crc32(payload))
+        self._mmap[self._write_offset + self.RECORD.size:end] = payload
+
+        # 写入结束标记，避免重启后读到中断写入残留的数据
+        if end + self.RECORD.size <= self._capacity:
+            self.RECORD.pack_into(self._mmap, end, 0, 0)
+
+        self._write_offset = end
+        self._count += 1
+
+        return True
+
+    def pop(self):
+
+        if self._count == 0:
+            return None
+
+        payload = self._read_record(self._pop_offset)
+
+        self._pop_offset += self.RECORD.size + len(payload)
+        self._count -= 1
+        self._unacked += 1
+
+        return payload
+
+    def ack(self) -> bool:
+        """确认最早一条已读出的数据，将已确认的偏移写入文件头"""
+        if self._unacked == 0:
+            return False
+
+        length, _ = self.RECORD.unpack_from(self._mmap, self._read_offset)
+
+        self._read_offset += self.RECORD.size + length
+        self._unacked -= 1
+
+        self.HEADER.pack_into(self._mmap, 0, self._read_offset)
+
+        return True
+
+    def flush(self):
+        self._mmap.flush()
+
+    def close(self):
+
+        if not self._mmap.closed:
+            self._mmap.close()
+            self._file.close()
+
+    def remove(self):
+
+        self.close()
+
+        os.remove(self._path)
+
+
+class DiskSpill:
+    """磁盘溢出队列
+    数据序列化后按顺序写入目录下的段文件，段文件写满后创建新的段文件，数据全部确认的段文件被删除，
+    进程重启后打开同一目录即可按顺序读取未确认的数据
+    remarks:
+        1.mmap写入在进程崩溃后由操作系统落盘，需要抵御掉电时调用flush
+        2.pop读出的数据需在处理完成后调用ack按读出顺序确认，未确认的数据重启后会被重新读出
+    """
+
+    SUFFIX = r'.seg'
+
+    def __init__(self, path, segment_size=0x4000000, *, dumps: Callable = None, loads: Callable = None):
+        """
+        path: 段文件目录
+        segment_size: 段文件大小(字节)，单条数据超过时按数据大小创建段文件
+        dumps/loads: 序列化/反序列化的callable，默认为pickle
+        """
+        self._path = path
+        self._segment_size = segment_size
+
+        self._dumps = dumps or (lambda data: pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+        self._loads = loads or pickle.loads
+
+        os.makedirs(path, exist_ok=True)
+
+        names = sorted(name for name in os.listdir(path) if name.endswith(self.SUFFIX))
+
+        self._segments = deque(SpillSegment(os.path.join(path, name)) for name in names)
+        self._seq = int(names[-1][:-len(self.SUFFIX)]) + 1 if names else 0
+
+        # 删除已消费完的段文件，保留最后一个继续写入
+        while len(self._segments) > 1 and self._segments[0].count == 0:
+            self._segments.popleft().remove()
+
+        self._size = sum(segment.count for segment in self._segments)
+
+    @property
+    def path(self):
+        return self._path
+
+    def size(self):
+        """未读出的数据量"""
+        return self._size
+
+    def unacked_size(self):
+        """已读出但未确认的数据量"""
+        return sum(segment.unacked for segment in self._segments)
+
+    def __len__(self):
+        return self._size
+
+    def _new_segment(self, capacity):
+
+        segment = SpillSegment(
+            os.path.join(self._path, f'{self._seq:016d}{self.SUFFIX}'),
+            max(capacity, self._segment_size)
+        )
+
+        self._seq += 1
+        self._segments.append(segment)
+
+        return segment
+
+    def append(self, data):
+
+        payload = self._dumps(data)
+
+        if not self._segments or not self._segments[-1].append(payload):
+            self._new_segment(SpillSegment.HEADER.size + SpillSegment.RECORD.size * 2 + len(payload)).append(payload)
+
+        self._size += 1
+
+    def pop(self, count=1):
+
+        datas = []
+
+        for segment in self._segments:
+
+            while len(datas) < count:
+
+                payload = segment.pop()
+
+                if payload is None:
+                    break
+
+                datas.append(self._loads(payload))
+                self._size -= 1
+
+            if len(datas) >= count:
+                break
+
+        return datas
+
+    def ack(self, count=1):
+        """按读出顺序确认count条数据，删除数据全部确认的段文件(保留最后一个继续写入)"""
+        while count > 0 and self._segments:
+
+            segment = self._segments[0]
+
+            if segment.ack():
+                count -= 1
+            elif segment.count > 0 or len(self._segments) == 1:
+                break
+
+            if segment.count == 0 and segment.unacked == 0 and len(self._segments) > 1:
+                self._segments.popleft().remove()
+
+    def flush(self):
+
+        for segment in self._segments:
+            segment.flush()
+
+    def close(self):
+        """关闭段文件，数据已全部确认时删除段文件"""
+        acked = self._size == 0 and self.unacked_size() == 0
+
+        for segment in self._segments:
+            if acked:
+                segment.remove()
+            else:
+                segment.close()
+
+        self._segments.clear()
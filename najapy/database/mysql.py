@@ -3,10 +3,12 @@ import asyncio
 import aiomysql
 from aiomysql.sa import SAConnection, Engine
 from aiomysql.sa.engine import _dialect as dialect
+from sqlalchemy.sql import select
 from sqlalchemy.sql.selectable import Select
 from sqlalchemy.sql.dml import Insert, Update, Delete
 from pymysql.err import Warning, DataError, IntegrityError, ProgrammingError
 
+from najapy.cache.base import BatchLoader
 from najapy.common.async_base import Utils, AsyncContextManager, AsyncCirculator
 from najapy.common.base import WeakContextVar
 from najapy.common.error import MySQLReadOnlyError, MySQLClientDestroyed
@@ -205,6 +207,8 @@ class MySQLDelegate:
         self._mysql_rw_client_context = WeakContextVar(f'mysql_rw_client_{context_uuid}')
         self._mysql_ro_client_context = WeakContextVar(f'mysql_ro_client_{context_uuid}')
 
+        self._batch_loaders = {}
+
     @property
     def mysql_rw_pool(self):
 
@@ -297,6 +301,38 @@ class MySQLDelegate:
 
         return client
 
+    def batch_loader(self, column, max_batch_size=100, *, readonly=True, batch_delay=0):
+        """提供按列批量查询的BatchLoader，合并后的查询为select ... where column in (...)
+
+        column: sqlalchemy的Column对象，加载结果为{列值: 记录}
+        相同参数返回同一个BatchLoader
+        """
+
+        # Column重载了==运算符，使用"表名.列名"作为缓存key
+        loader_key = (str(column), max_batch_size, readonly, batch_delay)
+
+        loader = self._batch_loaders.get(loader_key)
+
+        if loader is not None:
+            return loader
+
+        async def _batch_fn(keys):
+
+            client = self.get_db_client(readonly, alone=True)
+
+            try:
+                records = await client.select(
+                    select([column.table]).where(column.in_(keys))
+                )
+            finally:
+                await client.release()
+
+            return {record[column.name]: record for record in records}
+
+        loader = self._batch_loaders[loader_key] = BatchLoader(_batch_fn, max_batch_size, batch_delay=batch_delay)
+
+        return loader
+
     def get_db_transaction(self):
 
         _client = self._mysql_rw_client_context.get()
@@ -1,7 +1,15 @@
+import asyncio
+import os
+import socket
+import time
+
 import redis
+from redis.asyncio.client import PubSub
 
-from najapy.common.async_base import Utils, FutureWithTimeout, FuncWrapper
+from najapy.cache.codec import Codec, MsgpackCodec, Serializer
+from najapy.common.async_base import Utils, FutureWithTimeout, FuncWrapper, AwaitableFuncWrapper, TimerWheel
 from najapy.common.base import catch_error
+from najapy.common.metrics import MetricsRegistry
 from najapy.event.event import EventDispatcher as _EventDispatcher
 
 
@@ -15,9 +23,20 @@ class EventDispatcher(_EventDispatcher):
 
 class DistributedEvent(EventDispatcher):
     """Redis实现的消息广播总线
+    所有频道共用一个订阅连接，首次连接失败或断线后按指数退避重连并重新订阅全部频道，无法解析的消息记录日志后丢弃
+    batch_delay大于0时开启批量发送，batch_delay秒内同一频道的事件合并为一个消息，所有频道在一个pipeline中发布
+    批量消息使用带数据头的Serializer格式(默认msgpack)，接收端同时兼容旧版本的pickle+zlib单事件消息，
+    但旧版本的接收端无法读取批量消息，滚动升级完成后再开启
+
+    batch_size: 单个频道待发送的事件达到该数量时立即发送
+    codec: 批量消息的编解码器，事件参数无法被msgpack序列化时可使用PickleCodec
     """
 
-    def __init__(self, redis_pool, channel_name, channel_count):
+    RECONNECT_DELAY = 1
+    MAX_RECONNECT_DELAY = 30
+
+    def __init__(self, redis_pool, channel_name, channel_count, *,
+                 batch_delay=0, batch_size=100, codec: Codec = None):
 
         super().__init__()
 
@@ -25,42 +44,83 @@ class DistributedEvent(EventDispatcher):
 
         self._channels = [f'event_bus_{Utils.md5_u32(channel_name)}_{index}' for index in range(channel_count)]
 
-        for channel in self._channels:
-            Utils.create_task(self._event_listener(channel))
+        self._serializer = Serializer(codec or MsgpackCodec())
+        self._metrics = MetricsRegistry().get(f'event_bus:{channel_name}')
 
-    async def _event_listener(self, channel):
-        with catch_error():
-            cache = await self._redis_pool.get_client()
+        self._batch_delay = batch_delay
+        self._batch_size = batch_size
+        self._batches = {}
+        self._flush_handle = None
 
-            async with cache.get_pub_sub() as pub_sub:
-                await pub_sub.subscribe(channel)
-                Utils.log.info(f'event bus channel({channel}) receiver created.')
+        self._pub_sub = None
+        self._extra_channels = set()
 
-                while True:
-                    try:
+        self._listener = Utils.create_task(self._event_listener())
+
+    async def _event_listener(self):
+
+        delay = self.RECONNECT_DELAY
+
+        while True:
+            try:
+                # 直接从连接池创建订阅对象，只占用一个连接
+                async with PubSub(self._redis_pool) as pub_sub:
+                    self._pub_sub = pub_sub
+                    await pub_sub.subscribe(*self._channels, *self._extra_channels)
+                    Utils.log.info(f'event bus channels({len(self._channels)}) receiver created.')
+
+                    delay = self.RECONNECT_DELAY
+
+                    while True:
                         message = await pub_sub.get_message(
                             ignore_subscribe_messages=True, timeout=None
                         )
                         if message:
                             await self._event_assigner(message)
 
-                    except redis.ConnectionError:
-                        try:
-                            await pub_sub.connection.disconnect()
-                            await pub_sub.connection.connect()
-                        except redis.ConnectionError:
-                            Utils.log.warning('Could not reconnect, trying again in 1 second')
-                            await Utils.sleep(1)
+            except Exception as err:
+                # 首次连接失败或断线后重新创建订阅对象并订阅全部频道
+                self._pub_sub = None
+
+                Utils.log.warning(f'event bus receiver error: {err}, trying again in {delay} second')
+                await Utils.sleep(delay)
+
+                delay = min(delay * 2, self.MAX_RECONNECT_DELAY)
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    async def subscribe(self, channel):
+        """在同一订阅连接上额外订阅一个频道，如进程专属的应答频道"""
+
+        if channel in self._extra_channels:
+            return
+
+        self._extra_channels.add(channel)
+
+        if self._pub_sub is not None:
+            await self._pub_sub.subscribe(channel)
 
     async def _event_assigner(self, message):
-        data = Utils.pickle_loads(message[r'data'])
 
-        _type = data.get(r'type', r'')
-        args = data.get(r'args', [])
-        kwargs = data.get(r'kwargs', {})
+        # 无法解析的消息记录日志后丢弃，不影响监听任务
+        with catch_error():
+            data = self._serializer.loads(message[r'data'])
 
-        if _type in self._observers:
-            self._observers[_type](*args, **kwargs)
+            # 单事件消息为字典，批量消息为[type, args, kwargs]列表
+            if isinstance(data, dict):
+                events = [(data.get(r'type', r''), data.get(r'args', []), data.get(r'kwargs', {}))]
+            else:
+                events = data
+
+            self._metrics.incr(r'receive_total', len(events))
+
+            for event in events:
+                with catch_error():
+                    _type, args, kwargs = event
+                    if _type in self._observers:
+                        self._observers[_type](*args, **kwargs)
 
     def _gen_observer(self):
         return FuncWrapper()
@@ -68,7 +128,16 @@ class DistributedEvent(EventDispatcher):
     async def dispatch(self, _type, *args, **kwargs):
 
         channel = self._channels[Utils.md5_u32(_type) % len(self._channels)]
-        Utils.log.info(f"dispatch channel({channel}):{_type}")
+
+        self._metrics.incr(r'dispatch_total')
+
+        if self._batch_delay > 0:
+            return await self._batch_dispatch(channel, _type, args, kwargs)
+
+        return await self.publish(channel, _type, *args, **kwargs)
+
+    async def publish(self, channel, _type, *args, **kwargs):
+        """向指定频道发布单个事件"""
 
         message = {
             r'type': _type,
@@ -76,13 +145,416 @@ class DistributedEvent(EventDispatcher):
             r'kwargs': kwargs,
         }
 
+        result = None
+        begin_time = time.perf_counter()
+
         async with await self._redis_pool.get_client() as cache:
-            return await cache.publish(channel, Utils.pickle_dumps(message))
+            result = await cache.publish(channel, Utils.pickle_dumps(message))
+
+        self._metrics.observe(r'publish_latency_seconds', time.perf_counter() - begin_time)
+
+        return result
+
+    async def _batch_dispatch(self, channel, _type, args, kwargs):
+
+        batch = self._batches.get(channel)
+
+        if batch is None:
+            batch = self._batches[channel] = ([], asyncio.get_running_loop().create_future())
+
+        events, future = batch
+
+        events.append((_type, args, kwargs))
+
+        if len(events) >= self._batch_size:
+            Utils.create_task(self._publish({channel: self._batches.pop(channel)}))
+        elif self._flush_handle is None:
+            self._flush_handle = Utils.call_later(self._batch_delay, self._flush)
+
+        # 同一批次的调用方共享发布结果，单个调用方取消等待不影响其它调用方
+        return await asyncio.shield(future)
+
+    def _flush(self):
+
+        self._flush_handle = None
+
+        if self._batches:
+            batches, self._batches = self._batches, {}
+            Utils.create_task(self._publish(batches))
+
+    async def _publish(self, batches):
+
+        channels = []
+        begin_time = time.perf_counter()
+
+        try:
+
+            async with await self._redis_pool.get_client() as cache:
+                pipeline = cache.pipeline(transaction=False)
+
+                for channel, (events, future) in batches.items():
+
+                    try:
+                        message = self._serializer.dumps(events)
+                    except Exception as err:
+                        # 编码失败只影响该频道的批次
+                        future.set_exception(err)
+                        continue
+
+                    channels.append(channel)
+                    pipeline.publish(channel, message)
+                    self._metrics.observe(r'batch_size', len(events))
+
+                results = await pipeline.execute() if channels else []
+
+            self._metrics.observe(r'publish_latency_seconds', time.perf_counter() - begin_time)
+
+            for channel, result in zip(channels, results):
+                future = batches[channel][1]
+                if not future.done():
+                    future.set_result(result)
+
+        except Exception as err:
+
+            Utils.log.error(f'event bus publish error: {err}')
+
+            for _, future in batches.values():
+                if not future.done():
+                    future.set_exception(err)
+
+        finally:
+
+            # 未设置结果的调用方不会无限等待
+            for _, future in batches.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(r'event bus publish failed'))
+
+    def close(self):
+
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
 
     def gen_event_waiter(self, event_type, delay_time):
         return EventWaiter(self, event_type, delay_time)
 
 
+class StreamEvent(EventDispatcher):
+    """Redis Streams实现的可靠消息总线
+    事件通过XADD写入stream并按maxlen近似裁剪，监听任务断线重连后从上次位置继续读取，不会丢失事件
+    默认使用消费组，同一消费组内每个事件只被一个进程处理，批量XREADGROUP读取后等待监听函数执行完成再批量XACK确认，
+    监听函数抛出异常的事件不确认，与其它消费者(如已退出的进程)超过claim_idle秒未确认的事件一起通过XAUTOCLAIM重新处理
+    broadcast为True时不使用消费组，每个进程都会收到全部事件
+
+    stream_name: stream名称
+    group_name: 消费组名称，消费组首次创建时从最新位置开始消费，消费组被删除(NOGROUP)时自动重建
+    consumer_name: 消费者名称，默认为主机名与进程号，进程重启后使用相同名称可继续处理未确认的事件
+    claim_idle: 转移其它消费者未确认事件的空闲时间(秒)，为0时不转移
+    """
+
+    def __init__(self, redis_pool, stream_name, *,
+                 group_name=r'default', consumer_name=None, broadcast=False,
+                 maxlen=10000, batch_size=100, block_timeout=1, claim_idle=60):
+
+        super().__init__()
+
+        self._redis_pool = redis_pool
+
+        self._stream = f'event_stream:{stream_name}'
+        self._group_name = group_name
+        self._consumer_name = consumer_name or f'{socket.gethostname()}:{os.getpid()}'
+        self._broadcast = broadcast
+
+        self._maxlen = maxlen
+        self._batch_size = batch_size
+        self._block_timeout = block_timeout
+
+        self._claim_idle = claim_idle
+        self._claim_time = 0
+
+        self._listener = Utils.create_task(self._event_listener())
+
+    @property
+    def stream(self):
+        return self._stream
+
+    @property
+    def consumer_name(self):
+        return self._consumer_name
+
+    async def _create_group(self, cache):
+
+        try:
+            await cache.xgroup_create(self._stream, self._group_name, r'$', mkstream=True)
+        except redis.ResponseError as err:
+            if r'BUSYGROUP' not in str(err):
+                raise
+
+    async def _claim_entries(self, cache):
+        """转移其它消费者超时未确认的事件，全部转移完成后每claim_idle秒最多执行一次
+        """
+
+        if self._claim_idle <= 0 or Utils.loop_time() < self._claim_time:
+            return []
+
+        self._claim_time = Utils.loop_time() + self._claim_idle
+
+        result = await cache.xautoclaim(
+            self._stream, self._group_name, self._consumer_name,
+            int(self._claim_idle * 1000), r'0-0', count=self._batch_size
+        )
+
+        # 未转移完的事件在下一次空闲时继续转移
+        if result[0] not in (b'0-0', r'0-0'):
+            self._claim_time = 0
+
+        return result[1]
+
+    async def _event_listener(self):
+        with catch_error():
+            cache = await self._redis_pool.get_client()
+
+            try:
+
+                if self._broadcast:
+                    # 广播模式记录已读位置，重连后从该位置继续读取
+                    last_id = (await cache.xinfo_stream(self._stream))[r'last-generated-id'] \
+                        if await cache.exists(self._stream) else r'0-0'
+                else:
+                    await self._create_group(cache)
+                    # 先处理本消费者已读取但未确认的事件
+                    last_id = r'0'
+
+                Utils.log.info(f'event stream({self._stream}) receiver created.')
+
+                while True:
+                    try:
+                        if self._broadcast:
+                            messages = await cache.xread(
+                                {self._stream: last_id}, self._batch_size, int(self._block_timeout * 1000)
+                            )
+                        else:
+                            messages = await cache.xreadgroup(
+                                self._group_name, self._consumer_name, {self._stream: last_id},
+                                self._batch_size, int(self._block_timeout * 1000)
+                            )
+
+                        entries = messages[0][1] if messages else []
+
+                        if not entries:
+                            if not self._broadcast:
+                                last_id = r'>'
+                                entries = await self._claim_entries(cache)
+                            if not entries:
+                                continue
+
+                        handled = [_id for _id, fields in entries if not fields or await self._event_assigner(fields)]
+
+                        if self._broadcast:
+                            last_id = entries[-1][0]
+                        elif handled:
+                            await cache.xack(self._stream, self._group_name, *handled)
+
+                    except redis.ConnectionError:
+                        Utils.log.warning('Could not reconnect, trying again in 1 second')
+                        await Utils.sleep(1)
+
+                        # 重连后先读取本消费者未确认的事件
+                        if not self._broadcast:
+                            last_id = r'0'
+
+                        with catch_error():
+                            if not self._broadcast:
+                                await self._create_group(cache)
+
+                    except redis.ResponseError as err:
+
+                        if r'NOGROUP' in str(err) and not self._broadcast:
+                            # stream或消费组被删除，重建后继续读取
+                            Utils.log.warning(f'event stream({self._stream}) group recreated: {err}')
+                            with catch_error():
+                                await self._create_group(cache)
+                            last_id = r'0'
+                        else:
+                            Utils.log.error(f'event stream({self._stream}) error: {err}')
+                            await Utils.sleep(1)
+
+                    except Exception as err:
+                        Utils.log.error(f'event stream({self._stream}) error: {err}')
+                        await Utils.sleep(1)
+
+            finally:
+                await cache.release()
+
+    async def _event_assigner(self, fields):
+        """返回事件是否处理完成，无法解析的事件记录日志后视为完成，监听函数抛出异常时返回False"""
+        try:
+            data = Utils.pickle_loads(fields[b'data'])
+            _type, args, kwargs = data.get(r'type', r''), data.get(r'args', []), data.get(r'kwargs', {})
+        except Exception as err:
+            Utils.log.error(f'event stream({self._stream}) invalid event: {err}')
+            return True
+
+        if _type in self._observers:
+            return await self._observers[_type](*args, **kwargs)
+
+        return True
+
+    def _gen_observer(self):
+        return AwaitableFuncWrapper()
+
+    async def dispatch(self, _type, *args, **kwargs):
+
+        message = {
+            r'type': _type,
+            r'args': args,
+            r'kwargs': kwargs,
+        }
+
+        async with await self._redis_pool.get_client() as cache:
+            return await cache.xadd(
+                self._stream, {r'data': Utils.pickle_dumps(message)},
+                maxlen=self._maxlen, approximate=True
+            )
+
+    def close(self):
+
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+    def gen_event_waiter(self, event_type, delay_time):
+        return EventWaiter(self, event_type, delay_time)
+
+
+class EventRPCError(Exception):
+    """远端处理请求时发生的异常"""
+
+
+class EventRPC:
+    """基于DistributedEvent的请求/响应调用
+
+    请求通过dispatch发布，携带调用标识与本进程专属的应答频道，处理方将结果发布到该应答频道
+    等待中的请求保存在以调用标识为key的字典中，应答只需一次字典查找，超时由一个时间轮统一管理
+    多个进程注册了同一请求类型时，以最先到达的应答为准
+
+    dispatcher: DistributedEvent对象
+    tick: 超时精度(秒)
+    """
+
+    REPLY_EVENT = r'event_rpc_reply'
+
+    def __init__(self, dispatcher: DistributedEvent, *, tick=0.1):
+
+        self._dispatcher = dispatcher
+
+        self._reply_channel = f'event_rpc_reply_{Utils.uuid1()}'
+        self._subscribed = False
+
+        self._waiters = {}
+        self._handlers = {}
+
+        self._timer_wheel = TimerWheel(tick, self._on_timeout)
+
+        self._dispatcher.add_listener(self.REPLY_EVENT, self._on_reply)
+
+    @property
+    def reply_channel(self):
+        return self._reply_channel
+
+    def waiter_count(self):
+        return len(self._waiters)
+
+    async def open(self):
+        """订阅应答频道，首次调用call时会自动执行"""
+
+        if not self._subscribed:
+            self._subscribed = True
+            await self._dispatcher.subscribe(self._reply_channel)
+
+        return self
+
+    def close(self):
+
+        self._timer_wheel.stop()
+
+        self._dispatcher.remove_listener(self.REPLY_EVENT, self._on_reply)
+
+        for _type, handler in self._handlers.items():
+            self._dispatcher.remove_listener(_type, handler)
+
+        self._handlers.clear()
+
+        for future in self._waiters.values():
+            if not future.done():
+                future.cancel()
+
+        self._waiters.clear()
+
+    def register(self, _type, handler):
+        """注册请求处理函数，handler(payload)的返回值作为应答"""
+
+        async def _handle(call_id, reply_channel, payload):
+
+            result = error = None
+
+            try:
+                result = await Utils.awaitable_wrapper(handler(payload))
+            except Exception as err:
+                error = f'{type(err).__name__}: {err}'
+
+            await self._dispatcher.publish(reply_channel, self.REPLY_EVENT, call_id, result, error)
+
+        if _type in self._handlers:
+            self._dispatcher.remove_listener(_type, self._handlers[_type])
+
+        self._handlers[_type] = _handle
+        self._dispatcher.add_listener(_type, _handle)
+
+    def unregister(self, _type):
+
+        handler = self._handlers.pop(_type, None)
+
+        if handler is not None:
+            self._dispatcher.remove_listener(_type, handler)
+
+    async def call(self, _type, payload=None, timeout=10):
+        """发起请求并等待应答，超时抛出asyncio.TimeoutError，远端异常抛出EventRPCError"""
+
+        await self.open()
+
+        call_id = Utils.uuid1()
+
+        future = self._waiters[call_id] = asyncio.get_running_loop().create_future()
+        self._timer_wheel.add(call_id, timeout)
+
+        try:
+            await self._dispatcher.dispatch(_type, call_id, self._reply_channel, payload)
+            return await future
+        finally:
+            self._waiters.pop(call_id, None)
+            self._timer_wheel.remove(call_id)
+
+    def _on_reply(self, call_id, result, error):
+
+        future = self._waiters.pop(call_id, None)
+
+        if future is None or future.done():
+            return
+
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(EventRPCError(error))
+
+    def _on_timeout(self, call_id):
+
+        future = self._waiters.pop(call_id, None)
+
+        if future is not None and not future.done():
+            future.set_exception(asyncio.TimeoutError())
+
+
 class EventWaiter(FutureWithTimeout):
     """带超时的临时消息接收器
     """
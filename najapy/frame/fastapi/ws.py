@@ -54,4 +54,4 @@ class WSConnectionManagerWithBuffer(WSConnectionManager):
         self._buffer.start()
 
     def buffer_stop(self):
-        self._buffer.stop()
+        return self._buffer.stop()
@@ -0,0 +1,132 @@
+import asyncio
+import gc
+import weakref
+
+import pytest
+
+from najapy.cache.base import BatchLoader
+from najapy.common.async_base import MultiTasks, Utils
+from najapy.common.base import WeakContextVar
+
+pytestmark = pytest.mark.asyncio
+
+
+class TestBatchLoader:
+
+    async def test_batch_loader(self):
+        batches = []
+
+        async def batch_fn(keys):
+            batches.append(keys)
+            return {key: key * 2 for key in keys if key != 3}
+
+        loader = BatchLoader(batch_fn, max_batch_size=2)
+
+        results = await MultiTasks(*[loader.load(key) for key in [1, 2, 2, 3]])
+
+        assert results == [2, 4, 4, None]
+        assert sorted(sum(batches, [])) == [1, 2, 3]
+        assert all(len(keys) <= 2 for keys in batches)
+
+    async def test_batch_loader_list(self):
+
+        async def batch_fn(keys):
+            return [str(key) for key in keys]
+
+        loader = BatchLoader(batch_fn)
+
+        assert await loader.load_many([1, 2, 3]) == [r'1', r'2', r'3']
+
+    async def test_batch_loader_exception(self):
+
+        async def batch_fn(keys):
+            raise ValueError(keys)
+
+        loader = BatchLoader(batch_fn)
+
+        results = await asyncio.gather(loader.load(1), loader.load(2), return_exceptions=True)
+
+        assert all(isinstance(result, ValueError) for result in results)
+
+    async def test_batch_loader_scope(self):
+        calls = []
+
+        def batch_fn(keys):
+            calls.extend(keys)
+            return {key: key for key in keys}
+
+        loader = BatchLoader(batch_fn)
+
+        scope = loader.scope()
+
+        assert await loader.load(1) == 1
+        assert await loader.load(1) == 1
+        assert calls == [1]
+
+        loader.clear(1)
+
+        assert await loader.load(1) == 1
+        assert calls == [1, 1]
+
+        del scope
+
+        await loader.load(1)
+        await loader.load(1)
+        assert calls == [1, 1, 1, 1]
+
+    async def test_batch_loader_delay(self):
+        batches = []
+
+        def batch_fn(keys):
+            batches.append(keys)
+            return {key: key for key in keys}
+
+        loader = BatchLoader(batch_fn, batch_delay=0.05)
+
+        async def _load(key):
+            await Utils.sleep(0.01 * key)
+            return await loader.load(key)
+
+        assert await MultiTasks(*[_load(key) for key in range(3)]) == [0, 1, 2]
+        assert batches == [[0, 1, 2]]
+
+    async def test_batch_loader_cancel(self):
+
+        async def batch_fn(keys):
+            await Utils.sleep(0.1)
+            return {key: key for key in keys}
+
+        loader = BatchLoader(batch_fn)
+
+        scope = loader.scope()
+
+        tasks = [Utils.create_task(loader.load(1)) for _ in range(3)]
+        await Utils.sleep(0.01)
+
+        # 单个调用方取消等待不影响同一key的其它调用方及作用域缓存
+        tasks[0].cancel()
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        assert isinstance(results[0], asyncio.CancelledError)
+        assert results[1:] == [1, 1]
+        assert await loader.load(1) == 1
+        assert not scope[1].cancelled()
+
+    async def test_batch_loader_release(self):
+
+        async def batch_fn(keys):
+            return {key: key for key in keys}
+
+        size = len(WeakContextVar._instances)
+
+        # 加载器不在全局注册表中留下记录，可随引用一起释放
+        loaders = [BatchLoader(batch_fn) for _ in range(10)]
+        refs = [weakref.ref(loader) for loader in loaders]
+
+        assert len(WeakContextVar._instances) == size
+
+        del loaders
+        gc.collect()
+
+        assert all(ref() is None for ref in refs)
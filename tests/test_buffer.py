@@ -1,9 +1,11 @@
+import asyncio
+import os
 import time
 
 import pytest
 
 from najapy.common.async_base import AsyncCirculator
-from najapy.common.buffer import QueueBuffer
+from najapy.common.buffer import DadaQueue, PartitionedQueueBuffer, QueueBuffer
 
 pytestmark = pytest.mark.asyncio
 
@@ -36,3 +38,326 @@ class TestBuffer:
             buffer.append(i)
 
         time.sleep(2)
+
+    async def test_data_queue_drain(self):
+        handled = []
+
+        async def _handle_data(data):
+            handled.extend(data)
+
+        queue = DadaQueue(_handle_data, task_limit=4, data_limit=100)
+
+        begin_time = time.perf_counter()
+        queue.extent(range(200000))
+
+        while queue.size() or queue.task_size():
+            await asyncio.sleep(0)
+
+        assert time.perf_counter() - begin_time < 5
+        assert sorted(handled) == list(range(200000))
+
+    async def test_queue_buffer_put_block(self):
+        release = asyncio.Event()
+        handled = []
+
+        async def _handle_data(data):
+            await release.wait()
+            handled.extend(data)
+
+        buffer = QueueBuffer(_handle_data, 1, data_limit=2, high_water=4)
+
+        for i in range(6):
+            buffer.append(i)
+
+        # 1条处理中，5条待处理，已超过high_water
+        await asyncio.sleep(0)
+        assert buffer.pending_size() == 5
+
+        task = asyncio.create_task(buffer.put(6))
+        await asyncio.sleep(0.01)
+        assert not task.done()
+        assert buffer.metrics.get_counter("blocked") == 1
+
+        release.set()
+        await asyncio.wait_for(task, 1)
+
+        while buffer.pending_size() or buffer._data_queue.task_size():
+            await asyncio.sleep(0.01)
+
+        assert sorted(handled) == list(range(7))
+
+    @pytest.mark.parametrize(
+        "overflow, expected",
+        [
+            (QueueBuffer.OVERFLOW_DROP_OLDEST, [0, 3, 4, 5, 6, 7, 8]),
+            (QueueBuffer.OVERFLOW_DROP_NEWEST, [0, 1, 2, 3, 4, 5, 6]),
+        ]
+    )
+    async def test_queue_buffer_overflow(self, overflow, expected):
+        release = asyncio.Event()
+        handled = []
+
+        async def _handle_data(data):
+            await release.wait()
+            handled.extend(data)
+
+        buffer = QueueBuffer(_handle_data, 1, data_limit=2, high_water=6, overflow=overflow)
+
+        # 1条处理中，6条待处理
+        for i in range(7):
+            await buffer.put(i)
+            await asyncio.sleep(0)
+
+        for i in range(7, 9):
+            buffer.append(i)
+
+        reason = "oldest" if overflow == QueueBuffer.OVERFLOW_DROP_OLDEST else "newest"
+        assert buffer.metrics.get_counter("dropped", reason) == 2
+
+        release.set()
+
+        while buffer.pending_size() or buffer._data_queue.task_size():
+            await asyncio.sleep(0.01)
+
+        assert sorted(handled) == expected
+
+    async def test_queue_buffer_max_age(self):
+        handled = []
+
+        async def _handle_data(data):
+            handled.append(list(data))
+
+        buffer = QueueBuffer(_handle_data, 100, timeout=0.05, data_limit=100)
+        buffer.start()
+
+        buffer.append(1)
+        await asyncio.sleep(0.03)
+        buffer.append(2)
+
+        # 按最早一条数据的停留时间处理
+        await asyncio.sleep(0.04)
+        assert handled == [[1, 2]]
+
+        await buffer.stop()
+
+    async def test_queue_buffer_max_bytes(self):
+        handled = []
+
+        async def _handle_data(data):
+            handled.append(list(data))
+
+        buffer = QueueBuffer(_handle_data, 100, data_limit=100, max_bytes=10, sizer=len)
+
+        buffer.append(b"12345")
+        await asyncio.sleep(0)
+        assert handled == []
+
+        buffer.append(b"67890")
+        await asyncio.sleep(0)
+        assert handled == [[b"12345", b"67890"]]
+
+    async def test_queue_buffer_drop_oldest_without_max_bytes(self):
+        sized = []
+
+        def _sizer(data):
+            sized.append(data)
+            return 1
+
+        async def _handle_data(data):
+            pass
+
+        buffer = QueueBuffer(
+            _handle_data, 100, data_limit=100, high_water=3,
+            overflow=QueueBuffer.OVERFLOW_DROP_OLDEST, sizer=_sizer
+        )
+
+        for i in range(5):
+            buffer.append(i)
+
+        # 未限制字节数时不计算数据大小
+        assert list(buffer._buffer) == [2, 3, 4]
+        assert buffer._bytes == 0
+        assert sized == []
+
+    async def test_queue_buffer_adaptive(self):
+        latency = 0
+
+        async def _handle_data(data):
+            await asyncio.sleep(latency)
+
+        buffer = QueueBuffer(
+            _handle_data, 1, data_limit=2, adaptive=True, target_latency=0.02, max_data_limit=8
+        )
+
+        for i in range(64):
+            buffer.append(i)
+        await buffer.stop()
+        assert buffer.data_limit == 8
+
+        latency = 0.03
+
+        for i in range(8):
+            buffer.append(i)
+        await buffer.stop()
+        assert buffer.data_limit == 2
+
+    async def test_queue_buffer_stop_drain(self):
+        handled = []
+
+        async def _handle_data(data):
+            await asyncio.sleep(0.01)
+            handled.extend(data)
+
+        buffer = QueueBuffer(_handle_data, 100, timeout=10, data_limit=3)
+        buffer.start()
+
+        buffer.extent(range(10))
+
+        await buffer.stop()
+
+        assert handled == list(range(10))
+        assert buffer.pending_size() == 0
+
+    async def test_partitioned_queue_buffer(self):
+        handled = {}
+        running = set()
+        concurrency = []
+
+        async def _handle_data(data):
+            running.add(id(data))
+            concurrency.append(len(running))
+            await asyncio.sleep(0.01)
+            running.discard(id(data))
+            for user, seq in data:
+                handled.setdefault(user, []).append(seq)
+
+        buffer = PartitionedQueueBuffer(
+            _handle_data, 4, lambda item: item[0], 1, data_limit=3
+        )
+
+        for seq in range(20):
+            for user in range(8):
+                buffer.append((user, seq))
+
+        await buffer.stop()
+
+        # 同一key按写入顺序处理，不同分区并发处理
+        assert handled == {user: list(range(20)) for user in range(8)}
+        assert max(concurrency) > 1
+        assert buffer.pending_size() == 0
+
+    async def test_queue_buffer_spill(self, tmp_path):
+        release = asyncio.Event()
+        handled = []
+
+        async def _handle_data(data):
+            await release.wait()
+            handled.extend(data)
+
+        buffer = QueueBuffer(_handle_data, 1, data_limit=4, spill_path=str(tmp_path), spill_threshold=10)
+
+        for i in range(100):
+            buffer.append(i)
+
+        # 1条处理中，内存中保留spill_threshold条，其余写入磁盘
+        await asyncio.sleep(0)
+        assert buffer.data_queue_size() == 10
+        assert buffer.spill_size() == 89
+        assert buffer.metrics.get_counter("spilled") == 89
+
+        release.set()
+        await buffer.stop()
+
+        assert handled == list(range(100))
+        assert buffer.spill_size() == 0
+
+        buffer.close()
+
+
+    async def test_queue_buffer_spill_restart(self, tmp_path):
+        handled = []
+
+        async def _block(data):
+            await asyncio.Event().wait()
+
+        async def _handle_data(data):
+            handled.extend(data)
+
+        buffer = QueueBuffer(_block, 1, data_limit=1, spill_path=str(tmp_path), spill_threshold=2)
+
+        for i in range(20):
+            buffer.append(i)
+
+        await asyncio.sleep(0)
+        buffer.close()
+
+        # 重启后读回磁盘中未确认的数据
+        buffer = QueueBuffer(_handle_data, 1, data_limit=4, spill_path=str(tmp_path), spill_threshold=2)
+        assert buffer.spill_size() == 17
+
+        await buffer.stop()
+
+        assert handled == list(range(3, 20))
+
+        buffer.close()
+
+
+    async def test_queue_buffer_spill_unacked(self, tmp_path):
+        handled = []
+
+        async def _block(data):
+            # 从磁盘读回的数据处理中不返回
+            if data[-1] >= 3:
+                await asyncio.Event().wait()
+
+        async def _handle_data(data):
+            handled.extend(data)
+
+        buffer = QueueBuffer(_block, 1, data_limit=4, spill_path=str(tmp_path), spill_threshold=2)
+
+        for i in range(20):
+            buffer.append(i)
+
+        await asyncio.sleep(0.1)
+        buffer.stop()
+
+        # 已读回内存但未处理完成的数据不被确认
+        assert buffer.spill_size() == 13
+        buffer.close()
+
+        buffer = QueueBuffer(_handle_data, 1, data_limit=4, spill_path=str(tmp_path), spill_threshold=2)
+        assert buffer.spill_size() == 17
+
+        await buffer.stop()
+
+        assert handled == list(range(3, 20))
+
+        buffer.close()
+
+    async def test_partitioned_queue_buffer_spill(self, tmp_path):
+        handled = []
+
+        async def _handle_data(data):
+            handled.extend(data)
+
+        buffer = PartitionedQueueBuffer(
+            _handle_data, 2, lambda data: data, 1, spill_path=str(tmp_path), spill_threshold=1
+        )
+
+        # 每个分区使用独立的磁盘目录
+        assert [partition._spill.path for partition in buffer.partitions] == [
+            os.path.join(str(tmp_path), str(index)) for index in range(2)
+        ]
+
+        for i in range(20):
+            buffer.append(i)
+
+        await buffer.stop()
+
+        assert sorted(handled) == list(range(20))
+
+        buffer.close()
+
+        # 数据已全部确认，关闭时删除段文件
+        for index in range(2):
+            assert os.listdir(os.path.join(str(tmp_path), str(index))) == []
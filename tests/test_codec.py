@@ -0,0 +1,52 @@
+import pytest
+
+from najapy.cache.codec import Serializer, LegacySerializer, MsgpackCodec, JsonCodec, BytesCodec, Codec, CodecRegistry
+from najapy.common.async_base import Utils
+
+
+class TestCodec:
+
+    def test_pickle(self):
+        serializer = Serializer()
+
+        data = serializer.dumps({r'a': 1})
+
+        assert data[0] == 1
+        assert serializer.loads(data) == {r'a': 1}
+
+    def test_compress_threshold(self):
+        serializer = Serializer(compress_threshold=64)
+
+        small = serializer.dumps(r'a')
+        large = serializer.dumps(r'a' * 1024)
+
+        assert small[0] & Serializer.COMPRESS_FLAG == 0
+        assert large[0] & Serializer.COMPRESS_FLAG
+        assert len(large) < 1024
+
+        assert serializer.loads(small) == r'a'
+        assert serializer.loads(large) == r'a' * 1024
+
+    def test_cross_codec(self):
+        reader = Serializer()
+
+        for codec, value in ((MsgpackCodec(), {r'a': [1, 2]}), (JsonCodec(), {r'a': [1, 2]}), (BytesCodec(), b'abc')):
+            assert reader.loads(Serializer(codec, compress_threshold=0).dumps(value)) == value
+            assert reader.loads(Serializer(codec, compress_threshold=-1).dumps(value)) == value
+
+        # 其它语言的服务只需去掉数据头
+        assert Utils.json_decode(Serializer(JsonCodec()).dumps({r'a': 1})[1:]) == {r'a': 1}
+
+    def test_legacy(self):
+        data = Utils.pickle_dumps({r'a': 1})
+
+        assert Serializer().loads(data) == {r'a': 1}
+        assert LegacySerializer().dumps({r'a': 1}) == data
+
+    def test_register(self):
+
+        class _Codec(Codec):
+            CODEC_ID = Serializer.LEGACY_HEADER
+
+        with pytest.raises(ValueError):
+            CodecRegistry.register(_Codec())
@@ -98,3 +98,86 @@ class TestFuncCache:
         assert t2 - t1 >= 500
 
         assert a != b
+
+    async def test_func_cache_stale(self):
+        calls = []
+
+        @FuncCache(ttl=0.5, stale_ttl=5)
+        async def func_1(str1):
+            calls.append(str1)
+            await Utils.sleep(0.2)
+            return len(calls)
+
+        assert await func_1('a') == 1
+
+        await Utils.sleep(0.6)
+
+        # 软过期后立即返回旧值，并且只触发一次后台刷新
+        t1 = Utils.timestamp(msec=True)
+        results = [await func_1('a') for _ in range(10)]
+        t2 = Utils.timestamp(msec=True)
+        assert t2 - t1 < 200
+        assert results == [1] * 10
+
+        await Utils.sleep(0.3)
+
+        assert await func_1('a') == 2
+        assert len(calls) == 2
+
+    async def test_func_cache_refresh_ahead(self):
+        calls = []
+
+        @FuncCache(ttl=1, refresh_ahead=0.5)
+        async def func_1(str1):
+            calls.append(str1)
+            return len(calls)
+
+        assert await func_1('a') == 1
+        assert await func_1('a') == 1
+        assert len(calls) == 1
+
+        await Utils.sleep(0.6)
+
+        assert await func_1('a') == 1
+        await Utils.sleep(0.1)
+
+        assert await func_1('a') == 2
+        assert len(calls) == 2
+
+    async def test_func_cache_stale_weigher(self):
+        weighed = []
+
+        def weigher(key, val):
+            weighed.append(val)
+            return len(val)
+
+        @FuncCache(ttl=1, stale_ttl=5, max_weight=100, weigher=weigher)
+        async def func_1(str1):
+            return str1 * 10
+
+        assert await func_1('a') == 'a' * 10
+
+        # 软过期模式下按函数结果计算权重
+        assert weighed == ['a' * 10]
+
+    async def test_func_cache_refresh_ahead_cold(self):
+        calls = []
+
+        @FuncCache(ttl=1, refresh_ahead=0.5, refresh_hits=3)
+        async def func_1(str1):
+            calls.append(str1)
+            return len(calls)
+
+        assert await func_1('a') == 1
+
+        await Utils.sleep(0.6)
+
+        # 命中次数未达到refresh_hits的冷数据不提前刷新
+        assert await func_1('a') == 1
+        await Utils.sleep(0.1)
+        assert len(calls) == 1
+
+        assert await func_1('a') == 1
+        assert await func_1('a') == 1
+        await Utils.sleep(0.1)
+        assert len(calls) == 2
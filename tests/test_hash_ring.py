@@ -0,0 +1,44 @@
+from najapy.cache.hash_ring import HashRing
+
+
+def test_hash_ring_balance():
+    ring = HashRing(["n1", "n2", "n3"])
+    keys = [f"key:{i}" for i in range(30000)]
+
+    counts = {}
+    for key in keys:
+        node = ring.get_node(key)
+        counts[node] = counts.get(node, 0) + 1
+
+    assert set(counts) == {"n1", "n2", "n3"}
+    assert all(8000 < count < 12000 for count in counts.values())
+
+
+def test_hash_ring_rebalance():
+    ring = HashRing(["n1", "n2", "n3"])
+    keys = [f"key:{i}" for i in range(30000)]
+
+    before = {key: ring.get_node(key) for key in keys}
+
+    ring.add_node("n4")
+    after = {key: ring.get_node(key) for key in keys}
+
+    moved = [key for key in keys if before[key] != after[key]]
+
+    # 只有迁移到新节点的key发生变化
+    assert all(after[key] == "n4" for key in moved)
+    assert 5000 < len(moved) < 10000
+
+    ring.remove_node("n4")
+    assert {key: ring.get_node(key) for key in keys} == before
+    assert len(ring) == 3
+
+
+def test_hash_ring_tag():
+    ring = HashRing(["n1", "n2", "n3"])
+
+    nodes = {ring.get_node(f"lock:{{user:{i}}}:{suffix}") for i in range(10) for suffix in ("a", "b")}
+    assert len({ring.get_node(f"lock:{{user:1}}:{suffix}") for suffix in ("queue", "notify", b"x")}) == 1
+    assert len(nodes) > 1
+
+    assert ring.get_node(b"key") == ring.get_node("key")
@@ -0,0 +1,70 @@
+import pytest
+
+from najapy.cache.base import FuncCache
+from najapy.cache.key_builder import SignKeyBuilder, HashKeyBuilder, DigestKeyBuilder
+from najapy.common.async_base import Utils
+
+
+def func_1(str1, str2, str3=None, str4=None):
+    return f'{str1}-{str2}-{str3}-{str4}'
+
+
+class TestKeyBuilder:
+
+    def test_sign_key_builder(self):
+        builder = SignKeyBuilder()
+
+        assert builder.build(func_1, (1, 2), {r'str3': 3}) == Utils.params_sign(func_1, 1, 2, str3=3)
+        assert builder.build(None, (1, 2), {}) == Utils.params_sign(1, 2)
+
+    def test_hash_key_builder(self):
+        builder = HashKeyBuilder()
+
+        key_1 = builder.build(func_1, (1, 2), {r'str3': 3, r'str4': 4})
+        key_2 = builder.build(func_1, (1, 2), {r'str4': 4, r'str3': 3})
+        key_3 = builder.build(func_1, (1, 2), {r'str3': 4, r'str4': 3})
+
+        assert key_1 == key_2
+        assert key_1 != key_3
+
+        # 类型不同的相等参数生成不同的key
+        assert len({builder.build(func_1, (val,), {}) for val in (1, True, 1.0)}) == 3
+        assert builder.build(func_1, (), {r'str3': 1}) != builder.build(func_1, (), {r'str3': True})
+
+        # 非基础类型的参数退回到params_sign
+        assert builder.build(func_1, ([1], {2: 2}), {}) == Utils.params_sign(func_1, [1], {2: 2})
+        assert builder.build(func_1, (object,), {}) == Utils.params_sign(func_1, object)
+
+    def test_digest_key_builder(self):
+        builder = DigestKeyBuilder()
+
+        key_1 = builder.build(func_1, (1, [2]), {r'str3': 3, r'str4': object})
+        key_2 = builder.build(func_1.__module__ + r'.' + func_1.__qualname__, (1, [2]), {r'str4': object, r'str3': 3})
+        key_3 = builder.build(func_1, (1, [3]), {r'str3': 3, r'str4': object})
+
+        assert key_1 == key_2
+        assert key_1 != key_3
+        assert len(key_1) == 32
+
+    @pytest.mark.asyncio
+    async def test_func_cache_key_func(self):
+        calls = []
+
+        @FuncCache(ttl=6, key_func=lambda user, *_, **__: user[r'id'])
+        async def func_2(user, flag=None):
+            calls.append(user)
+            return user[r'id']
+
+        assert await func_2({r'id': 1, r'name': r'a'}) == 1
+        assert await func_2({r'id': 1, r'name': r'b'}, flag=True) == 1
+        assert await func_2({r'id': 2, r'name': r'a'}) == 2
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_func_cache_arg_type(self):
+
+        @FuncCache(ttl=6)
+        async def func_2(val):
+            return repr(val)
+
+        assert [await func_2(val) for val in (1, True, 1.0)] == [r'1', r'True', r'1.0']
@@ -0,0 +1,104 @@
+import gc
+
+import pytest
+
+from najapy.cache.base import StackCache, FuncCache
+from najapy.common.metrics import MetricsRegistry, Metrics
+
+pytestmark = pytest.mark.asyncio
+
+
+class TestMetrics:
+
+    async def test_stack_cache_metrics(self):
+        cache = StackCache(maxsize=2, ttl=10, name=r'test_stack_cache')
+
+        cache.set(r'a', 1)
+        cache.get(r'a')
+        cache.get(r'b')
+
+        cache.set(r'b', 2)
+        cache.set(r'c', 3)
+        cache.delete(r'c')
+
+        metrics = MetricsRegistry().to_dict()[r'test_stack_cache']
+
+        assert metrics[r'hits'] == 1
+        assert metrics[r'misses'] == 1
+        assert metrics[r'evictions'] == {r'size': 1, r'explicit': 1}
+        assert metrics[r'size'] == 1
+        assert metrics[r'hit_ratio'] == 0.5
+
+        # clear不计入淘汰指标
+        cache.clear()
+
+        metrics = MetricsRegistry().to_dict()[r'test_stack_cache']
+
+        assert metrics[r'evictions'] == {r'size': 1, r'explicit': 1}
+        assert metrics[r'size'] == 0
+
+    async def test_func_cache_metrics(self):
+        func_cache = FuncCache(ttl=10, name=r'test_func_cache')
+
+        @func_cache
+        async def func_1(val):
+            return val
+
+        for _ in range(3):
+            await func_1(1)
+
+        metrics = func_cache.metrics.to_dict()
+
+        assert metrics[r'hits'] == 2
+        assert metrics[r'misses'] == 1
+        assert metrics[r'load_seconds'][r'count'] == 1
+        assert metrics[r'inflight_loads'] == 0
+
+        text = MetricsRegistry().to_prometheus()
+
+        assert r'najapy_cache_hits_total{name="test_func_cache"} 2' in text
+        assert r'# TYPE najapy_cache_load_seconds histogram' in text
+        assert r'najapy_cache_load_seconds_bucket{name="test_func_cache",le="+Inf"} 1' in text
+
+    async def test_custom_metrics(self):
+        metrics = MetricsRegistry().get(r'test_custom', Metrics)
+
+        metrics.incr(r'events', 2)
+        metrics.incr(r'errors', reason=r'timeout')
+        metrics.set_gauge(r'queue', lambda: 5)
+
+        assert metrics.to_dict() == {r'events': 2, r'errors': {r'timeout': 1}, r'queue': 5}
+
+    async def test_cache_metrics_weak_size(self):
+        cache = StackCache(ttl=10, name=r'test_weak_size')
+        cache.set(r'a', 1)
+
+        assert MetricsRegistry().cache_metrics(r'test_weak_size').get_gauge(r'size') == 1
+
+        # 注册表不持有缓存对象
+        del cache
+        gc.collect()
+
+        assert MetricsRegistry().cache_metrics(r'test_weak_size').get_gauge(r'size') == 0
+
+    async def test_func_cache_local_metrics(self):
+
+        def outer(val):
+            func_cache = FuncCache(ttl=10)
+
+            @func_cache
+            async def func_1():
+                return val
+
+            return func_cache, func_1
+
+        (cache_1, func_1), (cache_2, func_2) = outer(1), outer(2)
+
+        await func_1()
+        await func_2()
+        await func_2()
+
+        # 未指定name时同名闭包的指标互不影响，且不注册到MetricsRegistry
+        assert cache_1.metrics.get_counter(r'misses') == 1
+        assert cache_2.metrics.get_counter(r'hits') == 1
+        assert cache_1.metrics.name not in MetricsRegistry().to_dict()
@@ -0,0 +1,52 @@
+import asyncio
+
+from sqlalchemy import Column, Integer, MetaData, String, Table
+
+from najapy.database.mysql import MySQLDelegate
+
+users = Table(
+    "users", MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("name", String(32)),
+)
+
+
+class _MockClient:
+
+    def __init__(self, rows):
+        self.queries = []
+        self._rows = rows
+
+    async def select(self, query):
+        self.queries.append(str(query))
+        return self._rows
+
+    async def release(self):
+        pass
+
+
+async def test_mysql_batch_loader(monkeypatch):
+    delegate = MySQLDelegate()
+
+    client = _MockClient([{"id": 1, "name": "a"}, {"id": 2, "name": "b"}])
+    readonly = []
+
+    def _get_db_client(_readonly=False, *, alone=False):
+        readonly.append((_readonly, alone))
+        return client
+
+    monkeypatch.setattr(delegate, "get_db_client", _get_db_client)
+
+    loader = delegate.batch_loader(users.c.id)
+
+    # 相同参数返回同一个加载器
+    assert delegate.batch_loader(users.c.id) is loader
+    assert delegate.batch_loader(users.c.id, readonly=False) is not loader
+
+    results = await asyncio.gather(*[loader.load(key) for key in [1, 2, 2, 3]])
+
+    assert [result and result["name"] for result in results] == ["a", "b", "b", None]
+
+    # 并发的请求合并为一次使用独立只读连接的查询
+    assert len(client.queries) == 1 and "users.id IN" in client.queries[0]
+    assert readonly == [(True, True)]
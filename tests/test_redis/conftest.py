@@ -146,6 +146,27 @@ async def r(create_redis):
     return await create_redis()
 
 
+@pytest_asyncio.fixture()
+async def rd(request):
+    """创建RedisDelegate对象
+    """
+    url = urlparse(request.config.getoption("--redis-url"))
+    url_kwargs = _get_redis_params(url)
+
+    delegate = RedisDelegate()
+    pool = await delegate.async_init_redis(
+        **url_kwargs
+    )
+    pool.key_prefix = POOL_KEY_PREFIX
+
+    yield delegate
+
+    async with await delegate.get_cache_client() as client:
+        await client.flushdb()
+
+    await delegate.async_close_redis()
+
+
 @pytest_asyncio.fixture()
 async def create_pool(request):
     """创建连接池对象,该连接池为阻塞式
@@ -0,0 +1,89 @@
+import asyncio
+from urllib.parse import urlparse
+
+import pytest
+from redis.exceptions import ConnectionError, ResponseError
+
+from najapy.cache.redis import AutoPipelineClient, RedisDelegate
+from tests.test_redis.conftest import _get_redis_params
+
+
+async def test_auto_pipeline_client(rd: RedisDelegate):
+    client = await rd.get_cache_client(auto_pipeline=True)
+
+    assert isinstance(client, AutoPipelineClient)
+    assert client.connection is None
+
+    async def _task(index):
+        await client.set(f"auto_pipeline:{index}", index)
+        return int(await client.get(f"auto_pipeline:{index}"))
+
+    assert await asyncio.gather(*(_task(i) for i in range(200))) == list(range(200))
+
+    auto_pipeline = rd.redis_pool.auto_pipeline
+
+    # 400条命令合并为少量批次，且只占用一个连接
+    assert auto_pipeline.metrics.get_counter("batch_total") < 20
+    assert rd.redis_pool.pool.qsize() == rd.redis_pool.max_connections - 1
+
+    await client.release()
+
+
+async def test_auto_pipeline_error(rd: RedisDelegate):
+    client = await rd.get_cache_client(auto_pipeline=True)
+
+    await client.set("auto_pipeline:str", "value")
+
+    results = await asyncio.gather(
+        client.incr("auto_pipeline:int"),
+        client.incr("auto_pipeline:str"),
+        client.get("auto_pipeline:str"),
+        return_exceptions=True
+    )
+
+    assert results[0] == 1
+    assert isinstance(results[1], ResponseError)
+    assert results[2] == b"value"
+
+    with pytest.raises(ResponseError):
+        await client.incr("auto_pipeline:str")
+
+
+async def test_auto_pipeline_excluded(rd: RedisDelegate):
+    client = await rd.get_cache_client(auto_pipeline=True)
+
+    async def _push():
+        await asyncio.sleep(0.1)
+        await client.rpush("auto_pipeline:list", "item")
+
+    # 阻塞命令使用独立连接，不影响其他命令的管道批次
+    result, _ = await asyncio.gather(client.blpop("auto_pipeline:list", 1), _push())
+
+    assert result == (b"auto_pipeline:list", b"item")
+
+    async with client.pipeline() as pipe:
+        await pipe.watch("auto_pipeline:watch")
+        pipe.multi()
+        pipe.set("auto_pipeline:watch", 1)
+        assert await pipe.execute() == [True]
+
+
+async def test_auto_pipeline_close(request):
+    delegate = RedisDelegate()
+    pool = await delegate.async_init_redis(**_get_redis_params(urlparse(request.config.getoption("--redis-url"))))
+
+    client = await delegate.get_cache_client(auto_pipeline=True)
+    assert await client.set("auto_pipeline:close", 1)
+
+    # 在途批次阻塞在DEBUG SLEEP，其后的命令等待发送
+    inflight = asyncio.create_task(client.execute_command("DEBUG", "SLEEP", "1"))
+    await asyncio.sleep(0.1)
+    pending = asyncio.create_task(client.get("auto_pipeline:close"))
+    await asyncio.sleep(0)
+
+    await delegate.async_close_redis()
+
+    results = await asyncio.wait_for(asyncio.gather(inflight, pending, return_exceptions=True), 0.5)
+    assert all(isinstance(result, ConnectionError) for result in results)
+
+    assert pool._auto_pipeline is None
@@ -0,0 +1,19 @@
+import asyncio
+
+from najapy.cache.redis import RedisDelegate
+
+
+async def test_redis_batch_loader(rd: RedisDelegate):
+    async with await rd.get_cache_client() as cache:
+        await cache.set_obj('batch_1', {'a': 1})
+        await cache.set_obj('batch_2', [2])
+
+    loader = rd.batch_loader()
+
+    # 相同参数返回同一个加载器
+    assert rd.batch_loader() is loader
+    assert rd.batch_loader(10) is not loader
+
+    results = await asyncio.gather(*[loader.load(key) for key in ['batch_1', 'batch_2', 'batch_3']])
+
+    assert results == [{'a': 1}, [2], None]
@@ -0,0 +1,108 @@
+import asyncio
+
+from redis.exceptions import ConnectionError
+
+from najapy.cache.redis import CacheClient, BufferedPeriodCounter
+
+
+async def test_buffered_period_counter(r: CacheClient):
+    c = BufferedPeriodCounter(r, "buffered_counter", 60, flush_interval=0.1, flush_count=10)
+    key = c._get_key()
+
+    for i in range(5):
+        assert await c.incr() == i + 1
+
+    assert await c.decr(2) == 3
+    assert c.pending() == 3
+    assert await r.get(key) is None
+
+    # 达到flush_count时合并写入
+    for _ in range(5):
+        await c.incr()
+    await asyncio.sleep(0.05)
+
+    assert c.pending() == 0
+    assert int(await r.get(key)) == 8
+    assert c.value() == 8
+
+    # 到达flush_interval时写入，读取值包含其他进程的计数
+    await r.incrby(key, 100)
+    await c.incr()
+    assert c.value() == 9
+
+    await asyncio.sleep(1.2)
+    assert c.pending() == 0
+    assert c.value() == 109
+
+    await c.incr(2)
+    await c.release()
+    assert int(await r.get(key)) == 111
+
+
+async def test_buffered_period_counter_flush_error(r: CacheClient, monkeypatch):
+    c = BufferedPeriodCounter(r, "buffered_counter_error", 60, flush_interval=10, flush_count=100)
+    key = c._get_key()
+
+    await c.incr(5)
+
+    class _FailedPipeline:
+        def __getattr__(self, name):
+            return lambda *args, **kwargs: self
+
+        async def execute(self):
+            raise ConnectionError("mock error")
+
+    pipeline = r.pipeline
+    monkeypatch.setattr(r, "pipeline", lambda *args, **kwargs: _FailedPipeline())
+
+    # 写入失败的增量合并回本地
+    await c.flush()
+    assert c.pending() == 5
+    assert c.value() == 5
+    assert c._flushing == {}
+
+    monkeypatch.setattr(r, "pipeline", pipeline)
+
+    await c.flush()
+    assert c.pending() == 0
+    assert int(await r.get(key)) == 5
+
+    await c.release()
+
+
+async def test_buffered_period_counter_concurrent_flush(r: CacheClient, monkeypatch):
+    c = BufferedPeriodCounter(r, "buffered_counter_concurrent", 60, flush_interval=10, flush_count=100)
+    key = c._get_key()
+
+    pipeline = r.pipeline
+    delays = [0.2, 0]
+
+    def _pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+        delay = delays.pop(0)
+
+        async def _execute(*args, **kwargs):
+            results = await execute(*args, **kwargs)
+            # 第一次写入延迟返回，模拟较早的结果晚于较新的结果到达
+            await asyncio.sleep(delay)
+            return results
+
+        pipe.execute = _execute
+        return pipe
+
+    monkeypatch.setattr(r, "pipeline", _pipeline)
+
+    await c.incr(1)
+    task = asyncio.create_task(c.flush())
+    await asyncio.sleep(0)
+    await c.incr(2)
+    await asyncio.gather(task, c.flush())
+
+    assert c.pending() == 0
+    assert int(await r.get(key)) == 3
+    assert c.value() == 3
+
+    monkeypatch.setattr(r, "pipeline", pipeline)
+
+    await c.release()
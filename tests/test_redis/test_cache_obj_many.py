@@ -0,0 +1,28 @@
+from najapy.cache.redis import CacheClient
+
+
+async def test_cache_obj_many(r: CacheClient):
+    assert await r.mset_obj({"m1": 1, "m2": [2], "m3": {"a": 3}}, ex=60, ttls={"m1": 10}) == [True] * 3
+
+    assert await r.ttl(r.get_safe_key("m1")) <= 10
+    assert await r.get_obj(r.get_safe_key("m2")) == [2]
+
+    assert await r.mget_obj(["m1", "m2", "m4"]) == {"m1": 1, "m2": [2]}
+
+    assert await r.delete_many(["m1", "m2"]) == 2
+    assert await r.mget_obj(["m1", "m2", "m3"]) == {"m3": {"a": 3}}
+
+
+async def test_get_or_load_many(r: CacheClient):
+    loads = []
+
+    async def loader(keys):
+        loads.append(keys)
+        return {key: key * 2 for key in keys if key != "c"}
+
+    await r.mset_obj({"a": "cached"})
+
+    assert await r.get_or_load_many(["a", "b", "c"], loader) == {"a": "cached", "b": "bb", "c": None}
+    assert await r.get_or_load_many(["a", "b", "c"], loader) == {"a": "cached", "b": "bb", "c": None}
+
+    assert loads == [["b", "c"], ["c"]]
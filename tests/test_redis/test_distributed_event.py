@@ -1,6 +1,11 @@
+import asyncio
+
 import pytest
+import redis
 from pydantic import BaseModel, Field
+from redis.asyncio.client import PubSub
 
+from najapy.cache.codec import PickleCodec
 from najapy.cache.redis import BlockingRedisPool
 from najapy.common.async_base import Utils
 from najapy.enum.base_enum import BaseEnum, Enum
@@ -47,6 +52,190 @@ async def test_distributed_event_2(p2: BlockingRedisPool):
     await e.dispatch(event_name, 0, 1)
 
 
+async def test_distributed_event_multiplex(p2: BlockingRedisPool):
+    idle = p2.pool.qsize()
+
+    e = DistributedEvent(p2, "test_channel_multiplex", 16)
+    e.RECONNECT_DELAY = 0.1
+
+    await Utils.sleep(0.2)
+
+    # 16个频道只占用一个连接
+    assert idle - p2.pool.qsize() == 1
+
+    received = []
+
+    for index in range(32):
+        e.add_listener(f"test_event_{index}", lambda index=index: received.append(index))
+
+    for index in range(32):
+        await e.dispatch(f"test_event_{index}")
+
+    await Utils.sleep(0.2)
+    assert sorted(received) == list(range(32))
+
+    # 断线后重连并重新订阅全部频道
+    async with await p2.get_client() as client:
+        await client.client_kill_filter(_type="pubsub")
+
+    await Utils.sleep(0.5)
+
+    received.clear()
+    for index in range(32):
+        await e.dispatch(f"test_event_{index}")
+
+    await Utils.sleep(0.2)
+    assert sorted(received) == list(range(32))
+
+    e.close()
+
+
+async def test_distributed_event_batch(p2: BlockingRedisPool):
+    e = DistributedEvent(p2, "test_channel_batch", 4, batch_delay=0.01, batch_size=50)
+
+    await Utils.sleep(0.2)
+
+    received = []
+
+    for index in range(8):
+        e.add_listener(f"test_event_{index}", lambda num, key=None: received.append((num, key)))
+
+    results = await asyncio.gather(*(
+        e.dispatch(f"test_event_{num % 8}", num, key=str(num)) for num in range(120)
+    ))
+
+    assert all(result == 1 for result in results)
+
+    await Utils.sleep(0.2)
+    assert sorted(received) == [(num, str(num)) for num in range(120)]
+
+    # 120个事件合并为少量消息
+    assert e.metrics.get_counter("dispatch_total") == 120
+    assert e.metrics.get_counter("receive_total") == 120
+    assert e.metrics.to_dict()["batch_size"]["count"] < 10
+
+    # 兼容旧版本的单事件消息
+    legacy = DistributedEvent(p2, "test_channel_batch", 4)
+    await legacy.dispatch("test_event_0", -1)
+
+    await Utils.sleep(0.2)
+    assert received[-1] == (-1, None)
+
+    e.close()
+    legacy.close()
+
+
+async def test_distributed_event_batch_pickle(p2: BlockingRedisPool):
+    e = DistributedEvent(p2, "test_channel_batch_pickle", 1, batch_delay=0.01, codec=PickleCodec())
+
+    await Utils.sleep(0.2)
+
+    received = []
+    e.add_listener("test_event", lambda val: received.append(val))
+
+    await e.dispatch("test_event", {1, 2})
+
+    await Utils.sleep(0.2)
+    assert received == [{1, 2}]
+
+    e.close()
+
+
+async def test_distributed_event_batch_encode_error(p2: BlockingRedisPool):
+    e = DistributedEvent(p2, "test_channel_batch_encode", 1, batch_delay=0.01)
+
+    # msgpack无法序列化set，同一批次的调用方都收到异常
+    results = await asyncio.wait_for(
+        asyncio.gather(e.dispatch("test_event", {1, 2}), e.dispatch("test_event", 1), return_exceptions=True), 1
+    )
+    assert all(isinstance(result, TypeError) for result in results)
+
+    assert await asyncio.wait_for(e.dispatch("test_event", 1), 1) >= 0
+
+    e.close()
+
+
+async def test_distributed_event_batch_publish_error(p2: BlockingRedisPool, monkeypatch):
+    e = DistributedEvent(p2, "test_channel_batch_publish", 4, batch_delay=0.01)
+
+    class _FailedClient:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *args):
+            pass
+
+        def pipeline(self, *args, **kwargs):
+            return self
+
+        def publish(self, *args):
+            pass
+
+        async def execute(self):
+            raise redis.ConnectionError("mock error")
+
+    async def _get_client():
+        return _FailedClient()
+
+    monkeypatch.setattr(p2, "get_client", _get_client)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(*(e.dispatch(f"test_event_{i}", i) for i in range(8)), return_exceptions=True), 1
+    )
+    assert all(isinstance(result, redis.ConnectionError) for result in results)
+
+    e.close()
+
+
+async def test_distributed_event_invalid_message(p2: BlockingRedisPool):
+    received = []
+
+    e = DistributedEvent(p2, "test_channel_invalid", 1)
+    e.add_listener("test_event", lambda num: received.append(num))
+
+    await Utils.sleep(0.2)
+
+    # 无法解析的消息被丢弃，监听任务继续运行
+    async with await p2.get_client() as client:
+        await client.publish(e._channels[0], b"hello")
+
+    await e.dispatch("test_event", 1)
+    await Utils.sleep(0.2)
+
+    assert received == [1]
+    assert not e._listener.done()
+
+    e.close()
+
+
+async def test_distributed_event_subscribe_retry(p2: BlockingRedisPool, monkeypatch):
+    received = []
+    subscribe = PubSub.subscribe
+    failures = [redis.ConnectionError("mock error")]
+
+    async def _subscribe(self, *args, **kwargs):
+        if failures:
+            raise failures.pop()
+        return await subscribe(self, *args, **kwargs)
+
+    monkeypatch.setattr(PubSub, "subscribe", _subscribe)
+
+    e = DistributedEvent(p2, "test_channel_subscribe_retry", 1)
+    e.RECONNECT_DELAY = 0.1
+    e.add_listener("test_event", lambda num: received.append(num))
+
+    # 首次订阅失败后按退避时间重试
+    await Utils.sleep(0.5)
+    assert not failures
+
+    await e.dispatch("test_event", 1)
+    await Utils.sleep(0.2)
+
+    assert received == [1]
+
+    e.close()
+
+
 class QuestionerSelectionType(BaseEnum):
     """答题器选择题类型"""
     SINGLE = Enum(1, "单选")
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from najapy.cache.redis import BlockingRedisPool
+from najapy.common.async_base import Utils
+from najapy.event.async_event import DistributedEvent, EventRPC, EventRPCError
+
+
+async def test_event_rpc(p2: BlockingRedisPool):
+    server_dispatcher = DistributedEvent(p2, "test_rpc", 2)
+    client_dispatcher = DistributedEvent(p2, "test_rpc", 2)
+
+    server = EventRPC(server_dispatcher)
+    client = EventRPC(client_dispatcher, tick=0.01)
+
+    async def _add(payload):
+        await asyncio.sleep(0.01)
+        return payload["a"] + payload["b"]
+
+    def _error(payload):
+        raise ValueError(payload)
+
+    server.register("add", _add)
+    server.register("error", _error)
+
+    await client.open()
+    await Utils.sleep(0.2)
+
+    results = await asyncio.gather(*(client.call("add", {"a": num, "b": 1}) for num in range(100)))
+    assert results == [num + 1 for num in range(100)]
+    assert client.waiter_count() == 0
+
+    with pytest.raises(EventRPCError, match="ValueError: oops"):
+        await client.call("error", "oops")
+
+    begin_time = asyncio.get_running_loop().time()
+    with pytest.raises(asyncio.TimeoutError):
+        await client.call("undefined", timeout=0.05)
+    assert asyncio.get_running_loop().time() - begin_time < 0.2
+
+    server.unregister("add")
+    with pytest.raises(asyncio.TimeoutError):
+        await client.call("add", {"a": 1, "b": 1}, timeout=0.05)
+
+    assert client.waiter_count() == 0
+
+    server.close()
+    client.close()
+    server_dispatcher.close()
+    client_dispatcher.close()
@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+import pytest
+from redis.exceptions import LockError, LockNotOwnedError
+
+from najapy.cache.redis import RedisDelegate
+
+
+async def test_fair_lock_fifo(rd: RedisDelegate):
+    holder = await rd.get_cache_client()
+    lock = holder.allocate_fair_lock("fair_lock", 10)
+
+    assert await lock.acquire()
+    assert await lock.owned()
+
+    order = []
+    released_at = []
+
+    async def _waiter(index):
+        async with await rd.get_cache_client() as client:
+            async with client.allocate_fair_lock("fair_lock", 10):
+                order.append((index, time.perf_counter()))
+                await asyncio.sleep(0.01)
+
+    tasks = []
+    for index in range(5):
+        tasks.append(asyncio.create_task(_waiter(index)))
+        await asyncio.sleep(0.02)
+
+    released_at.append(time.perf_counter())
+    await lock.release()
+
+    await asyncio.gather(*tasks)
+
+    assert [index for index, _ in order] == list(range(5))
+    # 释放后立即唤醒，无需等待轮询间隔
+    assert order[0][1] - released_at[0] < 0.05
+
+    assert await holder.exists(lock.name, f"{lock.name}:queue", f"{lock.name}:waiters") == 0
+
+    await holder.release()
+
+
+async def test_fair_lock_expire(rd: RedisDelegate):
+    async with await rd.get_cache_client() as client:
+        lock1 = client.allocate_fair_lock("fair_lock", 0.3)
+        lock2 = client.allocate_fair_lock("fair_lock", 10)
+
+        assert await lock1.acquire()
+
+        # 持有者未释放时，锁过期后等待者获得锁
+        begin_time = time.perf_counter()
+        assert await lock2.acquire()
+        assert 0.2 < time.perf_counter() - begin_time < 0.6
+
+        with pytest.raises(LockNotOwnedError):
+            await lock1.release()
+
+        assert await lock2.extend(20)
+        assert 10000 < await client.pttl(lock2.name) <= 20000
+
+        await lock2.release()
+        assert await lock2.locked() is False
+
+
+async def test_fair_lock_timeout(rd: RedisDelegate):
+    async with await rd.get_cache_client() as client:
+        lock1 = client.allocate_fair_lock("fair_lock", 10)
+        lock2 = client.allocate_fair_lock("fair_lock", 10, blocking_timeout=0.1)
+
+        assert await lock1.acquire()
+
+        assert await lock2.acquire(blocking=False) is False
+        assert await lock2.acquire() is False
+        assert await client.zcard(f"{lock2.name}:queue") == 0
+
+        with pytest.raises(LockError):
+            async with lock2:
+                pass
+
+        with pytest.raises(LockError):
+            await lock2.release()
+
+        await lock1.release()
+        assert await lock2.acquire()
+        await lock2.release()
+
+
+async def test_fair_lock_waiter_limit(rd: RedisDelegate):
+    pool = rd.redis_pool
+    pool.waiter_limit = 2
+
+    holder = await rd.get_cache_client()
+    lock = holder.allocate_fair_lock("fair_lock_limit", 10)
+
+    assert await lock.acquire()
+
+    idle = pool.pool.qsize()
+    order = []
+
+    async def _waiter(index):
+        async with holder.allocate_fair_lock("fair_lock_limit", 10):
+            order.append(index)
+
+    tasks = []
+    for index in range(20):
+        tasks.append(asyncio.create_task(_waiter(index)))
+        await asyncio.sleep(0.01)
+
+    # 等待者不占用业务连接，超过waiter_limit的等待者轮询
+    assert pool.pool.qsize() == idle
+    assert pool.waiter_semaphore.locked()
+    assert pool.waiter_client.connection_pool.max_connections == 2
+
+    await lock.release()
+    await asyncio.wait_for(asyncio.gather(*tasks), 10)
+
+    assert order == list(range(20))
+
+    await holder.release()
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from najapy.cache.redis import RedisDelegate, NearCache
+
+
+async def _wait_for(predicate, timeout=1):
+
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return True
+        await asyncio.sleep(0.01)
+
+    return False
+
+
+async def test_near_cache_tracking(rd: RedisDelegate):
+    near_cache = await rd.enable_near_cache(16, 60)
+
+    assert near_cache.mode == NearCache.MODE_TRACKING
+
+    async with await rd.get_cache_client() as client:
+        name = client.get_safe_key("near")
+        other = client.get_safe_key("other")
+
+        await client.set_obj(name, {"v": 1})
+
+        assert await near_cache.get_obj(name) == {"v": 1}
+        assert await near_cache.get_obj(name) == {"v": 1}
+        assert near_cache.hit_ratio == 0.5
+
+        # 其他客户端修改后本地缓存失效
+        await client.set_obj(name, {"v": 2})
+        assert await _wait_for(lambda: near_cache.size() == 0)
+        assert await near_cache.get_obj(name) == {"v": 2}
+
+        await near_cache.set_obj(other, 1)
+        assert await near_cache.get_obj(other) == 1
+        assert near_cache.size() == 2
+
+        await client.flushdb()
+        assert await _wait_for(lambda: near_cache.size() == 0)
+        assert await near_cache.get_obj(name) is None
+
+    await near_cache.close()
+    assert near_cache.size() == 0
+
+
+async def test_near_cache_untracked(rd: RedisDelegate):
+    near_cache = await rd.enable_near_cache(16, 60)
+
+    async with await rd.get_cache_client() as client:
+        # key_prefix之外的key没有失效通知，不写入本地缓存
+        name = "near_untracked"
+        assert not near_cache.is_tracked(name)
+        assert near_cache.is_tracked(client.get_safe_key(name))
+
+        await client.set_obj(name, 1)
+        assert await near_cache.get_obj(name) == 1
+        assert near_cache.size() == 0
+
+        await client.set_obj(name, 2)
+        assert await near_cache.get_obj(name) == 2
+
+        await client.delete(name)
+
+    await near_cache.close()
+
+@pytest.fixture()
+async def keyspace_events(rd: RedisDelegate):
+    async with await rd.get_cache_client() as client:
+        config = (await client.config_get("notify-keyspace-events"))["notify-keyspace-events"]
+        await client.config_set("notify-keyspace-events", "KA")
+
+    yield
+
+    async with await rd.get_cache_client() as client:
+        await client.config_set("notify-keyspace-events", config)
+
+
+async def test_near_cache_keyspace(rd: RedisDelegate, keyspace_events):
+    near_cache = await rd.enable_near_cache(16, 60, mode=NearCache.MODE_KEYSPACE)
+
+    async with await rd.get_cache_client() as client:
+        name = client.get_safe_key("near")
+
+        await client.set_obj(name, [1])
+        await asyncio.sleep(0.1)
+
+        assert await near_cache.get_obj(name) == [1]
+        assert near_cache.size() == 1
+
+        await client.expire(name, 100)
+        assert await _wait_for(lambda: near_cache.size() == 0)
+
+        assert await near_cache.get_obj(name) == [1]
+        await near_cache.delete(name)
+        assert await near_cache.get_obj(name) is None
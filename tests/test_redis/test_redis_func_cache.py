@@ -0,0 +1,89 @@
+import asyncio
+
+from najapy.cache.redis import RedisDelegate, RedisFuncCache
+from najapy.common.async_base import Utils
+
+
+async def test_redis_func_cache(rd: RedisDelegate):
+    calls = []
+
+    @RedisFuncCache(rd, ttl=6, redis_ttl=6)
+    async def func_1(str1, str2=None):
+        calls.append(str1)
+        await Utils.sleep(0.1)
+        return f'{str1}-{str2}'
+
+    results = await asyncio.gather(*[func_1('a', str2='b') for _ in range(10)])
+
+    assert results == ['a-b'] * 10
+    assert len(calls) == 1
+
+    async with await rd.get_cache_client() as cache:
+        keys = await cache.keys(cache.get_safe_key('func_cache:*'))
+        assert len(keys) == 1
+
+
+async def test_redis_func_cache_l2(rd: RedisDelegate):
+    calls = []
+
+    async def func_1(str1):
+        calls.append(str1)
+        return str1 * 2
+
+    # 模拟两个进程各自的L1缓存
+    func_a = RedisFuncCache(rd, ttl=6)(func_1)
+    func_b = RedisFuncCache(rd, ttl=6)(func_1)
+
+    assert await func_a('a') == 'aa'
+    assert await func_b('a') == 'aa'
+    assert len(calls) == 1
+
+
+async def test_redis_func_cache_invalidate(rd: RedisDelegate):
+    calls = []
+
+    async def func_1(str1):
+        calls.append(str1)
+        return len(calls)
+
+    func_a = RedisFuncCache(rd, ttl=6)(func_1)
+    func_b = RedisFuncCache(rd, ttl=6)(func_1)
+
+    RedisFuncCache.bind_event_dispatcher(
+        rd.event_dispatcher('test_redis_func_cache', 1)
+    )
+
+    await Utils.sleep(0.5)
+
+    try:
+        assert await func_a('a') == 1
+        assert await func_b('a') == 1
+
+        await func_a.invalidate('a')
+        await Utils.sleep(0.5)
+
+        assert await func_b('a') == 2
+        assert await func_a('a') == 2
+    finally:
+        RedisFuncCache.bind_event_dispatcher(None)
+
+
+
+async def test_redis_func_cache_no_pool():
+    calls = []
+
+    func_cache = RedisFuncCache(RedisDelegate(), ttl=6, name='test_redis_func_cache_no_pool')
+
+    @func_cache
+    async def func_1(str1):
+        calls.append(str1)
+        return len(calls)
+
+    # 连接池未初始化时只使用L1缓存，invalidate只清理L1
+    assert await func_1('a') == 1
+    assert await func_1('a') == 1
+
+    await func_1.invalidate('a')
+
+    assert await func_1('a') == 2
+    assert func_cache.metrics.name == 'test_redis_func_cache_no_pool'
@@ -0,0 +1,62 @@
+import pytest
+from redis.exceptions import ResponseError
+
+from najapy.cache.redis import RedisDelegate, CacheClient
+from najapy.cache.script import INCR_WITH_EXPIRE
+
+
+async def test_scripts_loaded(rd: RedisDelegate):
+    async with await rd.get_cache_client() as client:
+        shas = [script.sha for script in rd.redis_pool.scripts]
+        assert await client.script_exists(*shas) == [True] * len(shas)
+
+
+async def test_noscript_reload(r: CacheClient):
+    name = r.get_safe_key("script_counter")
+
+    await r.script_flush()
+    assert await r.script_exists(INCR_WITH_EXPIRE.sha) == [False]
+
+    assert await r.incr_with_expire(name, 2, 60) == 2
+    assert await r.incr_with_expire(name) == 3
+    assert 0 < await r.ttl(name) <= 60
+
+
+async def test_register_script(rd: RedisDelegate):
+    rd.register_script("double", "return redis.call('GET', KEYS[1]) * 2")
+
+    async with await rd.get_cache_client() as client:
+        name = client.get_safe_key("double")
+        await client.set(name, 21)
+        assert await client.eval_script("double", (name,)) == 42
+
+        with pytest.raises(KeyError):
+            await client.eval_script("undefined")
+
+
+async def test_builtin_scripts(r: CacheClient):
+    name = r.get_safe_key("script_value")
+    lock_name = r.get_safe_key("script_lock")
+
+    await r.set(name, "token")
+    assert await r.compare_and_delete(name, "other") is False
+    assert await r.compare_and_delete(name, "token") is True
+    assert await r.exists(name) == 0
+
+    assert await r.get_or_lock(name, lock_name, "t1", 10) == (None, True)
+    assert await r.get_or_lock(name, lock_name, "t2", 10) == (None, False)
+    assert 0 < await r.pttl(lock_name) <= 10000
+
+    await r.set_obj(name, {"a": 1})
+    assert await r.get_or_lock(name, lock_name, "t2", 10) == ({"a": 1}, False)
+
+    window = r.get_safe_key("script_window")
+    results = [await r.sliding_window(window, 10, 3) for _ in range(4)]
+    assert results == [(True, 1), (True, 2), (True, 3), (False, 3)]
+
+
+async def test_script_error(r: CacheClient):
+    await r.set(r.get_safe_key("script_str"), "value")
+
+    with pytest.raises(ResponseError):
+        await r.incr_with_expire(r.get_safe_key("script_str"))
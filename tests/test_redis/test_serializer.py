@@ -0,0 +1,34 @@
+from najapy.cache.codec import Serializer, LegacySerializer, MsgpackCodec, PickleCodec
+from najapy.cache.redis import CacheClient
+from najapy.common.async_base import Utils
+
+
+async def test_cache_obj_serializer(r: CacheClient):
+    await r.set_obj("obj_1", {"a": 1})
+    await r.set_obj("obj_2", {"a": 2}, serializer=Serializer(MsgpackCodec()))
+    await r.set_obj("obj_3", {"a": 3}, serializer=Serializer())
+
+    # 默认写入旧版本格式，旧版本服务可直接读取
+    assert isinstance(r.pool.serializer, LegacySerializer)
+    assert Utils.pickle_loads(await r.get("obj_1")) == {"a": 1}
+    assert (await r.get("obj_2"))[0] == MsgpackCodec.CODEC_ID
+    assert (await r.get("obj_3"))[0] == PickleCodec.CODEC_ID
+
+    # 读取同时兼容两种格式
+    assert await r.get_obj("obj_1") == {"a": 1}
+    assert await r.get_obj("obj_2") == {"a": 2}
+    assert await r.get_obj("obj_3") == {"a": 3}
+
+
+async def test_cache_obj_serializer_opt_in(r: CacheClient):
+    serializer = r.pool.serializer
+
+    try:
+        r.pool.serializer = Serializer(MsgpackCodec())
+
+        await r.set_obj("obj_4", [4])
+
+        assert (await r.get("obj_4"))[0] == MsgpackCodec.CODEC_ID
+        assert await r.get_obj("obj_4") == [4]
+    finally:
+        r.pool.serializer = serializer
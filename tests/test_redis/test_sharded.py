@@ -0,0 +1,236 @@
+import asyncio
+from urllib.parse import urlparse
+
+import pytest
+import pytest_asyncio
+import redis
+
+from najapy.cache.redis import ShardedRedisDelegate, ShardedCacheClient
+from tests.test_redis.conftest import _get_redis_params, POOL_KEY_PREFIX
+
+
+@pytest_asyncio.fixture()
+async def srd(request):
+    url_kwargs = _get_redis_params(urlparse(request.config.getoption("--redis-url")))
+
+    nodes = [dict(url_kwargs, db=db) for db in (10, 11)]
+
+    delegate = ShardedRedisDelegate()
+    await delegate.async_init_redis(nodes)
+    delegate.set_redis_key_prefix(POOL_KEY_PREFIX)
+
+    yield delegate
+
+    async with await delegate.get_cache_client() as client:
+        await client.flushdb()
+
+    await delegate.async_close_redis()
+
+
+async def _node_sizes(delegate):
+    sizes = []
+
+    for pool in delegate.redis_pools.values():
+        async with await pool.get_client() as client:
+            sizes.append(await client.dbsize())
+
+    return sizes
+
+
+async def test_sharded_route(srd: ShardedRedisDelegate):
+    client = await srd.get_cache_client()
+    assert isinstance(client, ShardedCacheClient)
+
+    names = [client.get_safe_key(f"sharded:{i}") for i in range(100)]
+
+    for index, name in enumerate(names):
+        assert await client.set_obj(name, index)
+
+    for index, name in enumerate(names):
+        assert await client.get_obj(name) == index
+
+    sizes = await _node_sizes(srd)
+    assert sum(sizes) == 100 and all(size > 20 for size in sizes)
+    assert await client.dbsize() == 100
+
+    assert (await client.mget(names[:3] + ["missing"]))[3] is None
+    assert await client.exists(*names) == 100
+    assert await client.delete(*names[:50]) == 50
+
+    await client.release()
+
+
+async def test_sharded_many(srd: ShardedRedisDelegate):
+    async with await srd.get_cache_client() as client:
+        mapping = {f"many:{i}": i for i in range(50)}
+
+        assert await client.mset_obj(mapping, ttls={"many:0": 10}) == [True] * 50
+        assert await client.mget_obj(list(mapping) + ["many:x"]) == mapping
+        assert 0 < await client.ttl(client.get_safe_key("many:0")) <= 10
+
+        assert await client.delete_many(list(mapping)[:10]) == 10
+
+        async with client.pipeline(transaction=False) as pipeline:
+            for i in range(10):
+                pipeline.incrby(client.get_safe_key(f"counter:{i}"), i)
+            pipeline.get(client.get_safe_key("counter:9"))
+            assert await pipeline.execute() == list(range(10)) + [b"9"]
+
+        assert await client.incr_with_expire(client.get_safe_key("counter:1"), 1, 60) == 2
+
+
+async def test_sharded_lock(srd: ShardedRedisDelegate):
+    async with await srd.get_cache_client() as client:
+        for i in range(4):
+            lock = client.allocate_fair_lock(f"sharded_lock:{i}", 10)
+            assert await lock.acquire()
+
+            other = client.allocate_fair_lock(f"sharded_lock:{i}", 10, blocking_timeout=0.05)
+            assert await other.acquire() is False
+
+            await lock.release()
+
+        lock = client.allocate_lock("sharded_redis_lock", 10)
+        assert await lock.acquire()
+        await lock.release()
+
+
+async def test_sharded_add_node(srd: ShardedRedisDelegate, request):
+    async with await srd.get_cache_client() as client:
+        names = [client.get_safe_key(f"node:{i}") for i in range(300)]
+        before = {name: srd.hash_ring.get_node(name) for name in names}
+
+    url_kwargs = _get_redis_params(urlparse(request.config.getoption("--redis-url")))
+    await srd.add_redis_node(**dict(url_kwargs, db=12))
+
+    after = {name: srd.hash_ring.get_node(name) for name in names}
+    new_node = f"{url_kwargs['host']}:{url_kwargs['port']}/12"
+
+    moved = [name for name in names if before[name] != after[name]]
+    assert moved and all(after[name] == new_node for name in moved)
+    assert srd.redis_pools[new_node].key_prefix == POOL_KEY_PREFIX
+
+
+async def test_sharded_scan_keys(srd: ShardedRedisDelegate):
+    client = await srd.get_cache_client()
+
+    names = [client.get_safe_key(f"sharded_scan:{i}") for i in range(50)]
+
+    for name in names:
+        await client.set(name, 1)
+
+    assert sorted(await client.keys(client.get_safe_key("sharded_scan:*"))) == sorted(name.encode() for name in names)
+
+    scanned = [key async for key in client.scan_iter(client.get_safe_key("sharded_scan:*"), count=5)]
+    assert sorted(scanned) == sorted(name.encode() for name in names)
+
+    await client.release()
+
+
+async def test_sharded_publish(srd: ShardedRedisDelegate):
+    client = await srd.get_cache_client()
+
+    # PUBLISH与订阅固定在第一个节点
+    assert client.get_shard(client._route_key(("PUBLISH", "sharded_channel", "1"))) is client.get_shard()
+
+    pub_sub = client.pubsub()
+    await pub_sub.subscribe("sharded_channel")
+    await pub_sub.get_message(timeout=1)
+
+    for i in range(10):
+        assert await client.publish("sharded_channel", i) == 1
+
+    await pub_sub.unsubscribe()
+    await pub_sub.close()
+
+    await client.release()
+
+
+async def test_sharded_near_cache(srd: ShardedRedisDelegate):
+    near_cache = await srd.enable_near_cache(64, 60)
+    assert len(near_cache.near_caches) == 2
+
+    client = await srd.get_cache_client()
+
+    names = [client.get_safe_key(f"sharded_near:{i}") for i in range(10)]
+
+    for index, name in enumerate(names):
+        await near_cache.set_obj(name, index)
+
+    for _ in range(2):
+        for index, name in enumerate(names):
+            assert await near_cache.get_obj(name) == index
+
+    assert near_cache.hit_ratio == 0.5
+    assert near_cache.size() == 10
+
+    # 其它客户端修改后，所在节点的失效通知淘汰本地缓存
+    await client.set_obj(names[0], -1)
+
+    for _ in range(20):
+        if near_cache.size() == 9:
+            break
+        await asyncio.sleep(0.05)
+
+    assert await near_cache.get_obj(names[0]) == -1
+    assert await near_cache.delete(*names) == 10
+
+    await client.release()
+
+
+async def test_sharded_context_release(request):
+    url_kwargs = _get_redis_params(urlparse(request.config.getoption("--redis-url")))
+
+    delegate = ShardedRedisDelegate()
+    await delegate.async_init_redis([dict(url_kwargs, db=db) for db in (10, 11)], max_connections=4, timeout=1)
+    delegate.set_redis_key_prefix(POOL_KEY_PREFIX)
+
+    # async with退出时释放各节点客户端的连接，循环次数超过连接池上限
+    for i in range(10):
+        async with await delegate.get_cache_client() as client:
+            await client.set(client.get_safe_key(f"sharded_release:{i}"), i)
+            assert await client.get(client.get_safe_key(f"sharded_release:{i}")) == str(i).encode()
+
+    async with await delegate.get_cache_client() as client:
+        await client.flushdb()
+
+    await delegate.async_close_redis()
+
+
+def _names_by_node(srd, client, prefix):
+    names = {}
+
+    for i in range(100):
+        name = client.get_safe_key(f"{prefix}:{i}")
+        names.setdefault(srd.hash_ring.get_node(name), []).append(name)
+
+    return list(names.values())
+
+
+async def test_sharded_command_keys(srd: ShardedRedisDelegate):
+    client = await srd.get_cache_client()
+
+    (name_1, set_1, other_1, *_), (name_2, set_2, *_) = _names_by_node(srd, client, "sharded_keys")
+
+    # key不在第一个参数的命令按实际的key路由
+    for name in (name_1, name_2):
+        await client.xadd(name, {"a": 1})
+
+        assert (await client.xread({name: "0"}, count=10))[0][0] == name.encode()
+        assert await client.object("encoding", name) == b"stream"
+
+        await client.xgroup_create(name, "group", "0")
+        assert len((await client.xreadgroup("group", "consumer", {name: ">"}, count=10, block=10))[0][1]) == 1
+
+    await client.sadd(set_1, 1)
+    await client.sadd(other_1, 2)
+    assert await client.sunion(set_1, other_1) == {b"1", b"2"}
+
+    # 多个key分布在不同节点时抛出异常
+    with pytest.raises(redis.ResponseError, match="CROSSSLOT"):
+        await client.xread({name_1: "0", name_2: "0"})
+
+    with pytest.raises(redis.ResponseError, match="CROSSSLOT"):
+        await client.sunion(set_1, set_2)
+
+    await client.release()
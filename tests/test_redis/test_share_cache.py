@@ -1,3 +1,5 @@
+import asyncio
+
 from najapy.cache.redis import CacheClient, ShareCache, PeriodCounter
 
 
@@ -34,3 +36,44 @@ async def test_share_cache(r: CacheClient):
 
     assert await c1.incr() == 3
     assert await c2.incr() == 2
+
+
+async def test_share_cache_xfetch(create_redis):
+    r1 = await create_redis()
+    r2 = await create_redis()
+
+    c1 = ShareCache(r1, "xfetch", lock_blocking_timeout=1, xfetch_beta=1)
+    assert await c1.get() is None
+    await asyncio.sleep(0.05)
+    await c1.set("v1", 2)
+    await c1.release()
+
+    envelope = await r2.get_obj(r2.get_safe_key("xfetch"))
+    assert envelope["value"] == "v1"
+    assert envelope["delta"] >= 0.05
+    assert 2 < await r2.ttl(r2.get_safe_key("xfetch")) <= 4
+
+    # 远离过期时直接命中
+    c2 = ShareCache(r2, "xfetch", lock_blocking_timeout=1, xfetch_beta=1)
+    assert await c2.get() == "v1"
+    await c2.release()
+
+    # 逻辑过期后只有一个调用方重算，其余调用方继续获得旧值且不阻塞
+    await asyncio.sleep(2.1)
+
+    c1 = ShareCache(r1, "xfetch", lock_blocking_timeout=1, xfetch_beta=1)
+    c2 = ShareCache(r2, "xfetch", lock_blocking_timeout=1, xfetch_beta=1)
+
+    assert await c1.get() is None
+
+    begin_time = asyncio.get_running_loop().time()
+    assert await c2.get() == "v1"
+    assert asyncio.get_running_loop().time() - begin_time < 0.1
+    await c2.release()
+
+    await c1.set("v2", 2)
+    await c1.release()
+
+    c2 = ShareCache(r2, "xfetch", lock_blocking_timeout=1, xfetch_beta=1)
+    assert await c2.get() == "v2"
+    await c2.release()
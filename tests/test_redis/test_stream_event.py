@@ -0,0 +1,195 @@
+import os
+
+from najapy.cache.redis import RedisDelegate
+from najapy.common.async_base import Utils
+
+
+async def _wait_for(predicate, timeout=2):
+
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return True
+        await Utils.sleep(0.01)
+
+    return False
+
+
+async def test_stream_event_group(rd: RedisDelegate):
+    received = []
+
+    e1 = rd.stream_event_dispatcher("test_stream", block_timeout=0.1)
+    e2 = rd.stream_event_dispatcher("test_stream", block_timeout=0.1)
+
+    e1.add_listener("test_event", lambda num: received.append(("e1", num)))
+    e2.add_listener("test_event", lambda num: received.append(("e2", num)))
+
+    await Utils.sleep(0.2)
+
+    for num in range(100):
+        await e1.dispatch("test_event", num)
+
+    # 同一消费组内每个事件只处理一次
+    assert await _wait_for(lambda: len(received) == 100)
+    await Utils.sleep(0.2)
+    assert sorted(num for _, num in received) == list(range(100))
+
+    async with await rd.get_cache_client() as client:
+        assert (await client.xpending(e1.stream, "default"))["pending"] == 0
+
+    e1.close()
+    e2.close()
+
+
+async def test_stream_event_durable(rd: RedisDelegate):
+    received = []
+
+    e1 = rd.stream_event_dispatcher("test_stream_durable", consumer_name="worker", block_timeout=0.1)
+    await Utils.sleep(0.2)
+    e1.close()
+
+    # 监听者离线期间发布的事件不会丢失
+    await e1.dispatch("test_event", 1, key="a")
+    await e1.dispatch("test_event", 2, key="b")
+
+    e2 = rd.stream_event_dispatcher("test_stream_durable", consumer_name="worker", block_timeout=0.1)
+    e2.add_listener("test_event", lambda num, key: received.append((num, key)))
+
+    assert await _wait_for(lambda: len(received) == 2)
+    assert received == [(1, "a"), (2, "b")]
+
+    e2.close()
+
+
+async def test_stream_event_broadcast(rd: RedisDelegate):
+    received = []
+
+    e1 = rd.stream_event_dispatcher("test_stream_broadcast", broadcast=True, block_timeout=0.1)
+    e2 = rd.stream_event_dispatcher("test_stream_broadcast", broadcast=True, block_timeout=0.1)
+
+    e1.add_listener("test_event", lambda num: received.append(("e1", num)))
+    e2.add_listener("test_event", lambda num: received.append(("e2", num)))
+
+    await Utils.sleep(0.2)
+
+    for num in range(10):
+        await e2.dispatch("test_event", num)
+
+    assert await _wait_for(lambda: len(received) == 20)
+    assert sorted(received) == sorted([(name, num) for name in ("e1", "e2") for num in range(10)])
+
+    async with await rd.get_cache_client() as client:
+        await client.xadd(e1.stream, {"data": b"invalid"})
+    await e1.dispatch("test_event", 10)
+
+    assert await _wait_for(lambda: len(received) == 22)
+
+    e1.close()
+    e2.close()
+
+
+async def test_stream_event_ack_after_handler(rd: RedisDelegate):
+    received = []
+
+    e1 = rd.stream_event_dispatcher("test_stream_ack", block_timeout=0.1)
+
+    assert str(os.getpid()) in e1.consumer_name
+
+    async def _handler(num):
+        await Utils.sleep(0.3)
+        received.append(num)
+
+    e1.add_listener("test_event", _handler)
+
+    await Utils.sleep(0.2)
+    await e1.dispatch("test_event", 1)
+    await Utils.sleep(0.15)
+
+    # 监听函数执行完成前事件保持未确认
+    async with await rd.get_cache_client() as client:
+        assert (await client.xpending(e1.stream, "default"))["pending"] == 1
+
+    assert await _wait_for(lambda: received == [1])
+    await Utils.sleep(0.1)
+
+    async with await rd.get_cache_client() as client:
+        assert (await client.xpending(e1.stream, "default"))["pending"] == 0
+
+    e1.close()
+
+
+async def test_stream_event_claim(rd: RedisDelegate):
+    received = []
+
+    e1 = rd.stream_event_dispatcher("test_stream_claim", block_timeout=0.1, claim_idle=0.2)
+    e1.add_listener("test_event", lambda num: received.append(num))
+
+    await Utils.sleep(0.2)
+    e1.close()
+
+    await e1.dispatch("test_event", 1)
+
+    # 模拟读取后未确认即退出的消费者
+    async with await rd.get_cache_client() as client:
+        await client.xreadgroup("default", "dead_worker", {e1.stream: ">"}, 10)
+
+    e2 = rd.stream_event_dispatcher("test_stream_claim", block_timeout=0.1, claim_idle=0.2)
+    e2.add_listener("test_event", lambda num: received.append(num))
+
+    assert await _wait_for(lambda: received == [1])
+    await Utils.sleep(0.1)
+
+    async with await rd.get_cache_client() as client:
+        assert (await client.xpending(e2.stream, "default"))["pending"] == 0
+
+    e2.close()
+
+
+async def test_stream_event_nogroup(rd: RedisDelegate):
+    received = []
+
+    e1 = rd.stream_event_dispatcher("test_stream_nogroup", block_timeout=0.1)
+    e1.add_listener("test_event", lambda num: received.append(num))
+
+    await Utils.sleep(0.2)
+
+    async with await rd.get_cache_client() as client:
+        await client.delete(e1.stream)
+
+    # 消费组被删除后监听任务重建消费组并继续运行
+    await Utils.sleep(0.3)
+    await e1.dispatch("test_event", 1)
+
+    assert await _wait_for(lambda: received == [1])
+
+    e1.close()
+
+
+async def test_stream_event_handler_error(rd: RedisDelegate):
+    received = []
+    failures = [ValueError("mock error")]
+
+    def _handler(num):
+        if failures:
+            raise failures.pop()
+        received.append(num)
+
+    e1 = rd.stream_event_dispatcher("test_stream_handler_error", block_timeout=0.1, claim_idle=0.2)
+    e1.add_listener("test_event", _handler)
+
+    await Utils.sleep(0.2)
+    await e1.dispatch("test_event", 1)
+    await e1.dispatch("test_event", 2)
+
+    # 处理失败的事件保持未确认，超过claim_idle后重新处理
+    assert await _wait_for(lambda: received == [2])
+
+    async with await rd.get_cache_client() as client:
+        assert (await client.xpending(e1.stream, "default"))["pending"] == 1
+
+    assert await _wait_for(lambda: received == [2, 1])
+    await Utils.sleep(0.1)
+
+    async with await rd.get_cache_client() as client:
+        assert (await client.xpending(e1.stream, "default"))["pending"] == 0
+
+    e1.close()
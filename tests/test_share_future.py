@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from najapy.cache.base import ShareFuture
+from najapy.common.async_base import Utils
+
+pytestmark = pytest.mark.asyncio
+
+
+class TestShareFuture:
+
+    async def test_share_future_result(self):
+        share_future = ShareFuture()
+
+        @share_future
+        async def func_1(key):
+            await Utils.sleep(0.1)
+            return {r'key': key, r'items': [1, 2]}
+
+        results = await asyncio.gather(*[func_1('a') for _ in range(5)])
+
+        assert all(result == {r'key': 'a', r'items': [1, 2]} for result in results)
+        assert len({id(result) for result in results}) == 5
+
+        assert share_future.call_count == 5
+        assert share_future.coalesce_count == 4
+
+    async def test_share_future_exception(self):
+
+        @ShareFuture()
+        async def func_1():
+            await Utils.sleep(0.1)
+            raise ValueError(r'func_1')
+
+        results = await asyncio.wait_for(
+            asyncio.gather(*[func_1() for _ in range(5)], return_exceptions=True), 1
+        )
+
+        assert all(isinstance(result, ValueError) for result in results)
+
+    async def test_share_future_cancel(self):
+
+        share_future = ShareFuture()
+
+        @share_future
+        async def func_1():
+            await Utils.sleep(10)
+
+        tasks = [Utils.create_task(func_1()) for _ in range(3)]
+        await Utils.sleep(0.1)
+
+        # 取消共享的任务本身时传递给所有调用方
+        for futures in list(share_future._future.values()):
+            futures[0].cancel()
+
+        results = await asyncio.wait_for(
+            asyncio.gather(*tasks, return_exceptions=True), 1
+        )
+
+        assert all(isinstance(result, asyncio.CancelledError) for result in results)
+
+    async def test_share_future_cancel_caller(self):
+
+        @ShareFuture()
+        async def func_1():
+            await Utils.sleep(0.1)
+            return 1
+
+        tasks = [Utils.create_task(func_1()) for _ in range(3)]
+        await Utils.sleep(0.01)
+
+        # 发起调用方取消等待不影响其它调用方
+        tasks[0].cancel()
+
+        results = await asyncio.wait_for(
+            asyncio.gather(*tasks, return_exceptions=True), 1
+        )
+
+        assert isinstance(results[0], asyncio.CancelledError)
+        assert results[1:] == [1, 1]
+
+    async def test_share_future_same(self):
+
+        @ShareFuture(ShareFuture.SAME)
+        async def func_1():
+            await Utils.sleep(0.1)
+            return [1, 2]
+
+        results = await asyncio.gather(*[func_1() for _ in range(5)])
+
+        assert len({id(result) for result in results}) == 1
+
+    async def test_share_future_freeze(self):
+
+        @ShareFuture(ShareFuture.FREEZE)
+        async def func_1():
+            await Utils.sleep(0.1)
+            return {r'items': [1, 2]}
+
+        results = await asyncio.gather(*[func_1() for _ in range(5)])
+
+        assert len({id(result) for result in results}) == 1
+        assert results[0][r'items'] == (1, 2)
+
+        with pytest.raises(TypeError):
+            results[0][r'key'] = 1
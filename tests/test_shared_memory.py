@@ -0,0 +1,111 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from najapy.cache.shared_memory import SharedMemoryCache
+from najapy.common.async_base import Utils
+
+
+def _worker(name, index):
+    cache = SharedMemoryCache(name, slot_count=64, arena_size=4096)
+
+    assert cache.get(r'config') == {r'a': 1}
+    cache.set(f'worker_{index}', index)
+
+    cache.release()
+
+
+@pytest.fixture
+def cache():
+    cache = SharedMemoryCache(f'test_{Utils.uuid1()[:8]}', slot_count=64, arena_size=4096)
+
+    yield cache
+
+    cache.destroy()
+
+
+class TestSharedMemoryCache:
+
+    def test_get_set(self, cache):
+        cache.set(r'a', {r'key': [1, 2]})
+        cache.set(b'b', 2)
+
+        assert cache.get(r'a') == {r'key': [1, 2]}
+        assert cache.get(r'b') == 2
+        assert cache.get(r'c', 3) == 3
+
+        assert cache.delete(r'a')
+        assert not cache.has(r'a')
+
+    def test_ttl(self, cache):
+        cache.set(r'a', 1, ttl=0.1)
+        assert cache.get(r'a') == 1
+
+        time.sleep(0.2)
+
+        assert cache.get(r'a') is None
+
+    def test_eviction(self, cache):
+        for index in range(200):
+            cache.set(f'key_{index}', r'v' * 50)
+
+        # 数据区写满后旧数据被覆盖，新数据可读
+        assert cache.get(r'key_0') is None
+        assert cache.get(r'key_199') == r'v' * 50
+        assert cache.size() <= 64
+
+        with pytest.raises(ValueError):
+            cache.set(r'big', r'v' * 5000)
+
+    def test_multi_process(self, cache):
+        cache.set(r'config', {r'a': 1})
+
+        processes = [multiprocessing.Process(target=_worker, args=(cache._name, index)) for index in range(4)]
+
+        for process in processes:
+            process.start()
+
+        for process in processes:
+            process.join()
+            assert process.exitcode == 0
+
+        assert [cache.get(f'worker_{index}') for index in range(4)] == [0, 1, 2, 3]
+
+    def test_bytes_view(self, cache):
+        cache.set_bytes(r'raw', b'abcdef')
+
+        view = cache.get_view(r'raw')
+
+        assert isinstance(view, memoryview)
+        assert view.obj is cache._buf.obj
+        assert view == b'abcdef'
+        assert cache.get(r'raw') == b'abcdef'
+        assert cache.get_view(r'missing') is None
+
+        view.release()
+
+    def test_attach_process_exit(self, cache):
+        cache.set(r'config', {r'a': 1})
+
+        # 独立进程(拥有自己的resource_tracker)连接后退出，共享内存不会被删除
+        code = (
+            r'from najapy.cache.shared_memory import SharedMemoryCache;'
+            f'cache = SharedMemoryCache({cache._name!r}, slot_count=64, arena_size=4096);'
+            r'assert cache.get("config") == {"a": 1};'
+            r'cache.release()'
+        )
+        subprocess.run(
+            [sys.executable, r'-c', code], check=True, env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        )
+
+        time.sleep(0.5)
+
+        other = SharedMemoryCache(cache._name, slot_count=64, arena_size=4096)
+
+        assert other.get(r'config') == {r'a': 1}
+
+        other.release()
@@ -0,0 +1,79 @@
+import os
+
+from najapy.common.spill import DiskSpill, SpillSegment
+
+
+def test_disk_spill_order(tmp_path):
+    spill = DiskSpill(str(tmp_path), segment_size=256)
+
+    for i in range(100):
+        spill.append({"seq": i})
+
+    # 写满后创建新的段文件
+    assert len(os.listdir(tmp_path)) > 1
+    assert len(spill) == 100
+
+    assert spill.pop(30) == [{"seq": i} for i in range(30)]
+    assert spill.pop(100) == [{"seq": i} for i in range(30, 100)]
+    assert len(spill) == 0
+
+    # 确认前段文件保留在磁盘中
+    assert spill.unacked_size() == 100
+    assert len(os.listdir(tmp_path)) > 1
+
+    spill.ack(100)
+    assert spill.unacked_size() == 0
+
+    spill.close()
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_disk_spill_restart(tmp_path):
+    spill = DiskSpill(str(tmp_path), segment_size=256)
+
+    for i in range(50):
+        spill.append(i)
+
+    assert spill.pop(20) == list(range(20))
+    spill.ack(10)
+
+    spill.close()
+
+    # 重启后从已确认的偏移继续读取
+    spill = DiskSpill(str(tmp_path), segment_size=256)
+
+    assert len(spill) == 40
+
+    spill.append(50)
+
+    assert spill.pop(100) == list(range(10, 51))
+
+    spill.close()
+
+
+def test_disk_spill_torn_write(tmp_path):
+    spill = DiskSpill(str(tmp_path), segment_size=4096)
+
+    for i in range(3):
+        spill.append(b"x" * 10)
+
+    spill.close()
+
+    path = os.path.join(tmp_path, os.listdir(tmp_path)[0])
+
+    # 破坏最后一条记录，模拟写入中断
+    offset = SpillSegment.HEADER.size + (SpillSegment.RECORD.size + 25) * 2 + SpillSegment.RECORD.size
+    with open(path, "r+b") as file:
+        file.seek(offset)
+        file.write(b"\xff")
+
+    spill = DiskSpill(str(tmp_path), segment_size=4096)
+
+    assert len(spill) == 2
+
+    spill.append(b"y")
+
+    assert spill.pop(10) == [b"x" * 10, b"x" * 10, b"y"]
+
+    spill.close()
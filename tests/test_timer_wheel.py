@@ -0,0 +1,51 @@
+import asyncio
+
+from najapy.common.async_base import TimerWheel
+
+
+async def test_timer_wheel():
+    loop = asyncio.get_running_loop()
+    expired = {}
+
+    wheel = TimerWheel(0.01, lambda key: expired.setdefault(key, loop.time()), slot_count=8)
+
+    begin_time = loop.time()
+
+    wheel.add("a", 0.03)
+    wheel.add("b", 0.05)
+    wheel.add("c", 0.15)
+    wheel.add("d", 0.03)
+    wheel.remove("d")
+    wheel.add("b", 0.1)
+
+    assert len(wheel) == 3 and "d" not in wheel
+
+    await asyncio.sleep(0.3)
+
+    assert set(expired) == {"a", "b", "c"}
+    assert 0.03 <= expired["a"] - begin_time < expired["b"] - begin_time < expired["c"] - begin_time
+    # 超过一圈(8*0.01秒)的定时项在正确的圈数后触发
+    assert expired["c"] - begin_time >= 0.15
+
+    assert len(wheel) == 0
+    assert wheel._timer_handle is None
+
+
+async def test_timer_wheel_callback_error():
+    expired = []
+
+    def _callback(key):
+        expired.append(key)
+        raise ValueError(key)
+
+    wheel = TimerWheel(0.01, _callback)
+
+    for index in range(100):
+        wheel.add(index, 0.02)
+
+    await asyncio.sleep(0.1)
+    assert sorted(expired) == list(range(100))
+
+    wheel.add("x", 10)
+    wheel.stop()
+    assert wheel._timer_handle is None
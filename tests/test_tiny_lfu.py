@@ -0,0 +1,92 @@
+import time
+
+from najapy.cache.base import StackCache
+from najapy.cache.tiny_lfu import TinyLFUCache, FrequencySketch
+
+
+class TestTinyLFU:
+
+    def test_frequency_sketch(self):
+        sketch = FrequencySketch(16)
+
+        for _ in range(5):
+            sketch.increment(r'a')
+
+        sketch.increment(r'b')
+
+        assert sketch.frequency(r'a') >= 5
+        assert sketch.frequency(r'a') > sketch.frequency(r'b')
+
+    def test_max_weight(self):
+        cache = TinyLFUCache(100, weigher=lambda key, val: len(val))
+
+        for index in range(50):
+            cache[index] = r'x' * 10
+
+        assert cache.weight <= 100
+        assert len(cache) <= 10
+
+        # 超过总权重的数据不会被缓存
+        cache[r'big'] = r'x' * 101
+        assert r'big' not in cache
+
+    def test_scan_resistance(self):
+        cache = TinyLFUCache(100)
+
+        for _ in range(10):
+            for index in range(50):
+                cache.set(f'hot_{index}', index)
+                cache.get(f'hot_{index}')
+
+        for index in range(1000):
+            cache.set(f'cold_{index}', index)
+
+        hot_count = sum(1 for index in range(50) if f'hot_{index}' in cache)
+
+        assert hot_count >= 45
+        assert len(cache) <= 100
+
+    def test_ttl(self):
+        cache = TinyLFUCache(100, ttl=10, ttl_jitter=0.1)
+
+        cache.set(r'a', 1)
+        cache.set(r'b', 2, ttl=0.1)
+
+        time.sleep(0.2)
+
+        assert cache.get(r'a') == 1
+        assert cache.get(r'b') is None
+        assert len(cache) == 1
+
+    def test_stack_cache(self):
+        cache = StackCache(ttl=10, max_weight=100)
+
+        cache.set(r'a', 1)
+        cache.set(r'b', 2, ttl=0.1)
+
+        assert cache.incr(r'a') == 2
+        assert cache.has(r'b')
+
+        time.sleep(0.2)
+
+        assert not cache.has(r'b')
+
+        cache.delete(r'a')
+        assert cache.size() == 0
+
+    def test_stack_cache_ttl(self):
+        cache = StackCache(ttl=10)
+
+        cache.set(r'a', 1)
+        cache.set(r'b', 2, ttl=0.1)
+        cache.set(r'c', 3, ttl=5)
+
+        assert cache.has(r'b')
+
+        time.sleep(0.2)
+
+        # 指定有效期的项按过期时间淘汰，不影响其它项
+        assert not cache.has(r'b')
+        assert cache.get(r'a') == 1
+        assert cache.get(r'c') == 3
+        assert cache.size() == 2